@@ -55,6 +55,7 @@ from ..lib.error import (
     AuthError,
     PolicyError,
     ResourceNotFoundError,
+    ServerBusyError,
     UserError,
     eduMFAError,
 )
@@ -371,6 +372,18 @@ def resource_not_found_error(error):
     return send_error(error.message, error_code=error.id), 404
 
 
+@validate_blueprint.app_errorhandler(ServerBusyError)
+def server_busy_error(error):
+    """
+    This function is called when a ServerBusyError occurs, e.g. if the pool
+    for the password verification is saturated.
+    It sends a 503, so that clients can retry later.
+    """
+    if "audit_object" in g:
+        g.audit_object.log({"info": error.message})
+    return send_error(error.message, error_code=error.id), 503
+
+
 @system_blueprint.app_errorhandler(eduMFAError)
 @realm_blueprint.app_errorhandler(eduMFAError)
 @defaultrealm_blueprint.app_errorhandler(eduMFAError)
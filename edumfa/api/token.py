@@ -105,7 +105,7 @@ from ..lib.token import (
     get_serial_by_otp,
     get_tokens,
     get_tokens_paginate,
-    import_token,
+    import_tokens,
     init_token,
     lost_token,
     remove_token,
@@ -1005,8 +1005,9 @@ def loadtokens_api(filename=None):
     :jsonparam psk: Pre Shared Key, when importing PSKC
     :jsonparam pskcValidateMAC: Determines how invalid MACs should be handled when importing PSKC.
                Allowed values are 'no_check', 'check_fail_soft' and 'check_fail_hard'.
-    :return: The number of the imported tokens
-    :rtype: int
+    :return: The number of the imported tokens, the number of the tokens,
+        which could not be imported, and the errors of these tokens by serial
+    :rtype: dict
     """
     if not filename:
         filename = getParam(request.all_data, "filename", required)
@@ -1078,25 +1079,25 @@ def loadtokens_api(filename=None):
         )
 
     # Now import the Tokens from the dictionary
-    ret = ""
-    for serial in TOKENS:
-        log.debug(f"importing token {TOKENS[serial]}")
-
-        log.info(f"initialize token. serial: {serial}, realm: {tokenrealms}")
-
-        import_token(serial, TOKENS[serial], tokenrealms=tokenrealms)
+    log.info(f"importing {len(TOKENS)} tokens. realm: {tokenrealms}")
+    result = import_tokens(TOKENS, tokenrealms=tokenrealms)
+    errors = result["errors"]
 
     g.audit_object.log(
         {
-            "info": f"{file_type}, {token_file} (imported: {len(TOKENS):d})",
-            "serial": ", ".join(TOKENS),
+            "info": f"{file_type}, {token_file} (imported: {result['n_imported']:d})",
+            "serial": ", ".join(serial for serial in TOKENS if serial not in errors),
             "success": True,
         }
     )
     # logTokenNum()
 
     return send_result(
-        {"n_imported": len(TOKENS), "n_not_imported": len(not_imported_serials)}
+        {
+            "n_imported": result["n_imported"],
+            "n_not_imported": len(not_imported_serials) + len(errors),
+            "errors": errors,
+        }
     )
 
 
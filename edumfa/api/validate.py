@@ -93,7 +93,7 @@ from edumfa.api.recover import recover_blueprint
 from edumfa.api.register import register_blueprint
 from edumfa.lib.applications.offline import MachineApplication
 from edumfa.lib.audit import getAudit
-from edumfa.lib.challenge import extract_answered_challenges, get_challenges
+from edumfa.lib.challenge import extract_answered_challenges, get_open_challenges
 from edumfa.lib.config import (
     SYSCONF,
     ensure_no_config_object,
@@ -701,11 +701,7 @@ def poll_transaction(transaction_id=None):
         transaction_id = getParam(request.all_data, "transaction_id", required)
     # Fetch a list of non-exired challenges with the given transaction ID
     # and determine whether it contains at least one non-expired answered challenge.
-    matching_challenges = [
-        challenge
-        for challenge in get_challenges(transaction_id=transaction_id)
-        if challenge.is_valid()
-    ]
+    matching_challenges = get_open_challenges(transaction_id=transaction_id)
     answered_challenges = extract_answered_challenges(matching_challenges)
 
     declined_challenges = []
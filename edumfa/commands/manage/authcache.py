@@ -19,7 +19,7 @@
 import click
 from flask.cli import AppGroup
 
-from edumfa.lib.authcache import cleanup
+from edumfa.lib.authcache import cleanup, delete_unindexed_entries
 
 authcache_cli = AppGroup("authcache", help="Manage authentication cache")
 
@@ -41,3 +41,16 @@ def authcache_cleanup(minutes: int):
     """
     r = cleanup(minutes)
     click.echo(f"{r} entries deleted from authcache")
+
+
+@authcache_cli.command("rebuild")
+def authcache_rebuild():
+    """
+    Remove all authcache entries without a fingerprint.
+    These entries were written by an older version and need a slow hash
+    verification on every lookup. Since the fingerprint can not be calculated
+    without the password, the entries are deleted and will be added again
+    with the next successful authentication of the user.
+    """
+    r = delete_unindexed_entries()
+    click.echo(f"{r} unindexed entries deleted from authcache")
@@ -20,8 +20,8 @@
 import click
 from flask.cli import AppGroup
 
-from edumfa.lib.importotp import parseOATHcsv
-from edumfa.lib.token import import_token
+from edumfa.lib.importotp import iterOATHcsv
+from edumfa.lib.token import IMPORT_CHUNK_SIZE, import_tokens
 
 token_cli = AppGroup("token", help="Manage tokens")
 
@@ -29,14 +29,29 @@ token_cli = AppGroup("token", help="Manage tokens")
 @token_cli.command("import")
 @click.argument("file", type=click.File("r"))
 @click.option("-t", "tokenrealm", help="The token realm", type=str)
-def import_tokens(file, tokenrealm):
+@click.option(
+    "-c",
+    "--chunk-size",
+    default=IMPORT_CHUNK_SIZE,
+    show_default=True,
+    type=int,
+    help="The number of tokens, which are written in one transaction",
+)
+def import_tokens_cli(file, tokenrealm, chunk_size):
     """
     Import Tokens from a CSV file
+    The file is read line by line and the tokens are written in chunks.
     """
-    contents = file.read()
-    tokens = parseOATHcsv(contents)
-    i = 0
-    for serial in tokens:
-        i += 1
-        click.echo(f"{i}/{len(tokens)} Importing token {serial}")
-        import_token(serial, tokens[serial], tokenrealms=tokenrealm)
+    tokenrealms = tokenrealm.split(",") if tokenrealm else None
+    result = import_tokens(
+        iterOATHcsv(file),
+        tokenrealms=tokenrealms,
+        chunk_size=chunk_size,
+        progress=lambda n: click.echo(f"{n} tokens processed"),
+    )
+    for serial, error in result["errors"].items():
+        click.echo(f"Could not import token {serial}: {error}", err=True)
+    click.echo(
+        f"{result['n_imported']} tokens imported, "
+        f"{len(result['errors'])} tokens not imported"
+    )
@@ -37,8 +37,11 @@ If the EDUMFA_AUDIT_SQL_URI is omitted the Audit data is written to the
 token database.
 """
 
+import atexit
 import datetime
 import logging
+import queue
+import threading
 import traceback
 from collections import OrderedDict
 
@@ -49,7 +52,7 @@ from sqlalchemy.sql.expression import FunctionElement
 
 from edumfa.lib.auditmodules.base import Audit as AuditBase
 from edumfa.lib.auditmodules.base import Paginate
-from edumfa.lib.crypto import Sign
+from edumfa.lib.crypto import Sign, merkle_root
 from edumfa.lib.framework import get_app_config_value, get_app_local_store
 from edumfa.lib.lifecycle import register_finalizer, register_request_finalizer
 from edumfa.lib.pooling import (
@@ -65,6 +68,9 @@ log = logging.getLogger(__name__)
 
 metadata = MetaData()
 
+# The prefix of signatures, which sign a batch of audit entries
+BATCH_SIGNATURE_PREFIX = "merkle"
+
 
 # Define function to convert SQL DateTime objects to an ISO-format string
 # By using <https://docs.sqlalchemy.org/en/14/core/compiler.html> we can
@@ -96,6 +102,159 @@ def fn_to_isodate(element, compiler, **kw):
     )
 
 
+def write_log_entries(session, entries, sign_object=None, batch_sign=False):
+    """
+    Write the given audit entries to the database and sign them.
+
+    All entries are inserted with one transaction. Afterwards, the entries
+    are read back at once, so that the signature covers the data as it is
+    stored in the database, and the signatures are written with a second
+    transaction.
+
+    :param session: the SQLAlchemy session of the audit database
+    :param entries: list of ``LogEntry`` objects
+    :param sign_object: a ``Sign`` object or None, if the entries should not be signed
+    :param batch_sign: Sign all entries with a single signature (see ``Audit.sign_batch``)
+    """
+    try:
+        session.add_all(entries)
+        # The ids are collected before the commit expires the entries.
+        # Otherwise every entry would be refreshed with its own SELECT.
+        session.flush()
+        ids = [le.id for le in entries]
+        session.commit()
+        # Add the signature
+        if sign_object:
+            stored_entries = (
+                session.query(LogEntry)
+                .filter(LogEntry.id.in_(ids))
+                .order_by(LogEntry.id)
+                .all()
+            )
+            if batch_sign and len(stored_entries) > 1:
+                signature = Audit.sign_batch(sign_object, stored_entries)
+                for le in stored_entries:
+                    le.signature = signature
+            else:
+                for le in stored_entries:
+                    le.signature = sign_object.sign(Audit._log_to_string(le))
+            session.commit()
+    except Exception as exx:  # pragma: no cover
+        # in case of a Unicode Error in _log_to_string() we won't have
+        # a signature, but the log entry is available
+        log.error(f"exception {exx!r}")
+        log.error(f"Could not write {len(entries)} audit entries.")
+        log.debug(traceback.format_exc())
+        session.rollback()
+    finally:
+        session.close()
+
+
+class AuditWriter:
+    """
+    A background thread, which writes audit entries to the database, so
+    that the request does not need to wait for the insert and the signature.
+
+    The entries are passed via a bounded queue. The writer takes up to
+    ``batch_size`` entries from the queue and writes them with a single
+    transaction. If the queue is full, the request either waits until the
+    writer has caught up (``block=True``) or the entry is dropped.
+
+    The queue is flushed, when the process exits.
+    """
+
+    def __init__(
+        self,
+        engine,
+        sign_object=None,
+        queue_size=10000,
+        batch_size=100,
+        block=True,
+        batch_sign=False,
+    ):
+        self.engine = engine
+        # The session is only used by the writer thread
+        self.session = scoped_session(sessionmaker(bind=engine))
+        self.sign_object = sign_object
+        self.batch_sign = batch_sign
+        self.batch_size = batch_size
+        self.block = block
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the writer thread, if it is not running yet.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="edumfa-audit-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def put(self, entry):
+        """
+        Add an audit entry to the queue.
+
+        :param entry: a ``LogEntry`` object
+        """
+        try:
+            self.queue.put(entry, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+            log.error(
+                f"The audit queue is full. Dropped the audit entry for {entry.action!r} "
+                f"({self.dropped} entries dropped so far)."
+            )
+
+    def flush(self):
+        """
+        Wait until all queued audit entries are written.
+        """
+        self.queue.join()
+
+    def stop(self, timeout=10):
+        """
+        Write all queued audit entries and stop the writer thread.
+
+        :param timeout: the number of seconds to wait for the writer thread
+        """
+        with self._lock:
+            if self._thread is None:
+                return
+            self.queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            entry = self.queue.get()
+            while True:
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                log.debug(f"Writing {len(batch)} audit entries.")
+                write_log_entries(
+                    self.session, batch, self.sign_object, self.batch_sign
+                )
+            for _ in range(len(batch) + int(stop)):
+                self.queue.task_done()
+
+
 class Audit(AuditBase):
     """
     This is the SQLAudit module, which writes the audit entries
@@ -128,6 +287,17 @@ class Audit(AuditBase):
 
     If ``EDUMFA_CHECK_OLD_SIGNATURES = True`` old style signatures (text-book RSA) will
     be checked as well, otherwise they will be marked as ``FAIL``.
+
+    With ``EDUMFA_AUDIT_ASYNC = True`` the audit entries are written by a
+    background thread (see ``AuditWriter``), which is configured by
+
+    * ``EDUMFA_AUDIT_ASYNC_QUEUE_SIZE``
+    * ``EDUMFA_AUDIT_ASYNC_BATCH_SIZE``
+    * ``EDUMFA_AUDIT_ASYNC_QUEUE_FULL``
+
+    With ``EDUMFA_AUDIT_SIGN_BATCH = True`` the background writer signs all entries,
+    which it writes at once, with a single signature over a Merkle tree of the
+    entries (see ``sign_batch``).
     """
 
     is_readable = True
@@ -138,6 +308,9 @@ class Audit(AuditBase):
         self.sign_data = not self.config.get("EDUMFA_AUDIT_NO_SIGN")
         self.sign_object = None
         self.verify_old_sig = self.config.get("EDUMFA_CHECK_OLD_SIGNATURES")
+        self.batch_sign = is_true(self.config.get("EDUMFA_AUDIT_SIGN_BATCH"))
+        # The results of the verification of batch signatures
+        self.verified_batches = {}
         # Disable the costly checking of private RSA keys when loading them.
         self.check_private_key = not self.config.get(
             "EDUMFA_AUDIT_NO_PRIVATE_KEY_CHECK", False
@@ -358,18 +531,12 @@ class Audit(AuditBase):
                 duration=duration,
                 thread_id=self.audit_data.get("thread_id"),
             )
-            self.session.add(le)
-            self.session.commit()
-            # Add the signature
-            if self.sign_data and self.sign_object:
-                s = self._log_to_string(le)
-                sign = self.sign_object.sign(s)
-                le.signature = sign
-                self.session.merge(le)
-                self.session.commit()
+            if is_true(self.config.get("EDUMFA_AUDIT_ASYNC")):
+                # The entry is written and signed by the background writer
+                self._get_writer().put(le)
+            else:
+                write_log_entries(self.session, [le], self.sign_object)
         except Exception as exx:  # pragma: no cover
-            # in case of a Unicode Error in _log_to_string() we won't have
-            # a signature, but the log entry is available
             log.error(f"exception {exx!r}")
             log.error(f"DATA: {self.audit_data}")
             log.debug(traceback.format_exc())
@@ -380,11 +547,43 @@ class Audit(AuditBase):
             # clear the audit data
             self.audit_data = {}
 
-    def _check_missing(self, audit_id):
+    def _get_writer(self):
+        """
+        Return the background writer of the current application. If there is
+        no writer yet, it is created and started.
+
+        :return: an ``AuditWriter`` object
+        """
+        store = get_app_local_store()
+        writer = store.get("sqlaudit.writer")
+        if writer is None:
+            queue_full = self.config.get("EDUMFA_AUDIT_ASYNC_QUEUE_FULL", "block")
+            if queue_full not in ["block", "drop"]:
+                log.warning(
+                    f"Unknown value for EDUMFA_AUDIT_ASYNC_QUEUE_FULL: {queue_full!r}"
+                )
+                queue_full = "block"
+            writer = AuditWriter(
+                self._create_engine(),
+                sign_object=self.sign_object,
+                queue_size=int(self.config.get("EDUMFA_AUDIT_ASYNC_QUEUE_SIZE", 10000)),
+                batch_size=int(self.config.get("EDUMFA_AUDIT_ASYNC_BATCH_SIZE", 100)),
+                block=queue_full == "block",
+                batch_sign=self.batch_sign,
+            )
+            writer = store.setdefault("sqlaudit.writer", writer)
+            writer.start()
+        return writer
+
+    def _check_missing(self, audit_id, batch_ids=None):
         """
         Check if the audit log contains the entries before and after
         the given id.
 
+        If the entry was signed together with other entries, the ids of the
+        verified batch can be passed in ``batch_ids``. The batch signature
+        already guarantees, that these entries exist.
+
         TODO: We can not check at the moment if the first or the last entries
               were deleted. If we want to do this, we need to store some signed
               meta information:
@@ -392,6 +591,9 @@ class Audit(AuditBase):
               2. Which one was the last entry.
         """
         res = False
+        batch_ids = batch_ids or []
+        if int(audit_id) - 1 in batch_ids and int(audit_id) + 1 in batch_ids:
+            return True
         try:
             id_bef = (
                 self.session.query(LogEntry.id)
@@ -417,6 +619,59 @@ class Audit(AuditBase):
 
         return res
 
+    @staticmethod
+    def sign_batch(sign_object, entries):
+        """
+        Create a single signature for a list of audit entries.
+
+        The signed data contains the id of the first entry, the number of
+        entries and the root of a Merkle tree over the entries. The signature
+        is stored in every entry of the batch, so that the entries of a batch
+        can be found to verify the signature.
+
+        :param sign_object: a ``Sign`` object
+        :param entries: list of ``LogEntry`` objects, ordered by id
+        :return: the signature
+        :rtype: str
+        """
+        batch_info = f"{entries[0].id}:{len(entries)}"
+        root = merkle_root([Audit._log_to_string(le) for le in entries])
+        sign = sign_object.sign(f"{batch_info}:{root}")
+        return f"{BATCH_SIGNATURE_PREFIX}:{batch_info}:{sign}"
+
+    def _verify_batch(self, audit_entry):
+        """
+        Verify the batch signature of an audit entry.
+        All entries of the batch are read from the database and the result
+        is stored, so that the other entries of the batch do not need to be
+        verified again.
+
+        :param audit_entry: a ``LogEntry`` object with a batch signature
+        :return: tuple of a bool, whether the signature is valid, and the ids of the batch
+        """
+        signature = audit_entry.signature
+        if signature not in self.verified_batches:
+            result = (False, [])
+            try:
+                _prefix, first_id, count, sign = signature.split(":", 3)
+                entries = (
+                    self.session.query(LogEntry)
+                    .filter(LogEntry.id >= int(first_id))
+                    .filter(LogEntry.signature == signature)
+                    .order_by(LogEntry.id)
+                    .limit(int(count) + 1)
+                    .all()
+                )
+                if len(entries) == int(count) and entries[0].id == int(first_id):
+                    root = merkle_root([self._log_to_string(le) for le in entries])
+                    if self.sign_object.verify(f"{first_id}:{count}:{root}", sign):
+                        result = (True, [le.id for le in entries])
+            except ValueError:
+                log.warning(f"Invalid batch signature for log entry {audit_entry.id}.")
+                log.debug(traceback.format_exc())
+            self.verified_batches[signature] = result
+        return self.verified_batches[signature]
+
     @staticmethod
     def _log_to_string(le):
         """
@@ -489,6 +744,7 @@ class Audit(AuditBase):
             .all()
         )
 
+        self.verified_batches = {}
         for le in logentries:
             audit_dict = self.audit_entry_to_dict(le)
             yield ",".join([f"'{x}'" for x in audit_dict.values()]) + "\n"
@@ -535,6 +791,7 @@ class Audit(AuditBase):
             sortorder=sortorder,
             timelimit=timelimit,
         )
+        self.verified_batches = {}
         while True:
             try:
                 le = next(auditIter)
@@ -620,7 +877,13 @@ class Audit(AuditBase):
 
     def audit_entry_to_dict(self, audit_entry):
         sig = None
-        if self.sign_data:
+        batch_ids = []
+        if self.sign_data and str(audit_entry.signature).startswith(
+            BATCH_SIGNATURE_PREFIX + ":"
+        ):
+            sig, batch_ids = self._verify_batch(audit_entry)
+            sig = sig and audit_entry.id in batch_ids
+        elif self.sign_data:
             try:
                 sig = self.sign_object.verify(
                     self._log_to_string(audit_entry),
@@ -636,7 +899,7 @@ class Audit(AuditBase):
                 )
                 log.debug(traceback.format_exc())
 
-        is_not_missing = self._check_missing(int(audit_entry.id))
+        is_not_missing = self._check_missing(int(audit_entry.id), batch_ids)
         # is_not_missing = True
         audit_dict = OrderedDict()
         audit_dict["number"] = audit_entry.id
@@ -20,14 +20,20 @@
 # License along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import datetime
+import hashlib
+import hmac
 import logging
 
 from passlib.hash import argon2
-from sqlalchemy import and_
+from sqlalchemy import and_, or_
 
 from ..models import AuthCache, db
+from .framework import get_app_config_value
+from .kdfpool import run_kdf
+from .utils import to_bytes
 
 ROUNDS = 9
+FINGERPRINT_KEY_CONFIG_NAME = "EDUMFA_AUTH_CACHE_KEY"
 log = logging.getLogger(__name__)
 
 
@@ -35,11 +41,35 @@ def _hash_password(password):
     return argon2.using(rounds=ROUNDS).hash(password)
 
 
+def _fingerprint(username, realm, resolver, password):
+    """
+    Return a keyed HMAC of the credentials. It is stored alongside the argon2
+    hash, so that the matching entry is found by index and only the argon2
+    hash of this entry needs to be verified.
+
+    The key is read from ``EDUMFA_AUTH_CACHE_KEY`` and defaults to the
+    ``SECRET_KEY``.
+    """
+    key = get_app_config_value(FINGERPRINT_KEY_CONFIG_NAME) or get_app_config_value(
+        "SECRET_KEY"
+    )
+    message = "\x00".join(str(x) for x in (username, realm, resolver, password))
+    return hmac.new(to_bytes(key), to_bytes(message), hashlib.sha256).hexdigest()
+
+
 def add_to_cache(username, realm, resolver, password):
     # Can not store timezone aware timestamps!
     first_auth = datetime.datetime.utcnow()
     auth_hash = _hash_password(password)
-    record = AuthCache(username, realm, resolver, auth_hash, first_auth, first_auth)
+    record = AuthCache(
+        username,
+        realm,
+        resolver,
+        auth_hash,
+        first_auth,
+        first_auth,
+        fingerprint=_fingerprint(username, realm, resolver, password),
+    )
     log.debug(
         f"Adding record to auth cache: ({username!r}, {realm!r}, {resolver!r}, {auth_hash!r})"
     )
@@ -80,6 +110,7 @@ def delete_from_cache(
         .all()
     )
     r = 0
+    fingerprint = _fingerprint(username, realm, resolver, password)
     for cached_auth in cached_auths:
         delete_entry = False
         # if the password matches or the entry is otherwise invalid, we deleted it.
@@ -90,7 +121,12 @@ def delete_from_cache(
                 last_valid_cache_time and cached_auth.first_auth < last_valid_cache_time
             ):
                 delete_entry = True
-            elif argon2.verify(password, cached_auth.authentication):
+            elif cached_auth.fingerprint == fingerprint:
+                delete_entry = True
+            elif cached_auth.fingerprint is None and run_kdf(
+                argon2.verify, password, cached_auth.authentication
+            ):
+                # Entries without fingerprint need to be verified
                 delete_entry = True
 
         except ValueError:
@@ -119,6 +155,24 @@ def cleanup(minutes):
     return r
 
 
+def delete_unindexed_entries():
+    """
+    Delete all authcache entries without a fingerprint. These entries were
+    created before the fingerprint was introduced. Since the fingerprint can
+    only be calculated from the password, the entries can not be updated.
+    Every lookup of such an entry costs a slow argon2 verification.
+
+    :return: the number of deleted entries
+    """
+    r = (
+        db.session.query(AuthCache)
+        .filter(AuthCache.fingerprint.is_(None))
+        .delete(synchronize_session=False)
+    )
+    db.session.commit()
+    return r
+
+
 def verify_in_cache(
     username, realm, resolver, password, first_auth=None, last_auth=None, max_auths=0
 ):
@@ -149,13 +203,21 @@ def verify_in_cache(
         conditions.append(AuthCache.first_auth > first_auth)
     if last_auth:
         conditions.append(AuthCache.last_auth > last_auth)
+    # Only the entry with the matching fingerprint (and entries, which were
+    # created before the fingerprint was introduced) need to be verified
+    conditions.append(
+        or_(
+            AuthCache.fingerprint == _fingerprint(username, realm, resolver, password),
+            AuthCache.fingerprint.is_(None),
+        )
+    )
 
     filter_condition = and_(True, *conditions)
     cached_auths = AuthCache.query.filter(filter_condition).all()
 
     for cached_auth in cached_auths:
         try:
-            result = argon2.verify(password, cached_auth.authentication)
+            result = run_kdf(argon2.verify, password, cached_auth.authentication)
         except ValueError:
             log.debug(f"Old (non-argon2) authcache entry for user {username}@{realm}.")
             result = False
@@ -25,16 +25,178 @@
 This is a helper module for the challenges database table.
 It is used by the lib.tokenclass
 
+Challenges, which are polled frequently, e.g. by the smartphones of push
+tokens or via ``/validate/polltransaction``, can be read from a process-local
+cache (see ``get_open_challenges``). A cache entry is dropped, as soon as
+a change of the challenge is announced via the challenge channel, and
+expires after ``EDUMFA_CHALLENGE_CACHE_TTL`` seconds.
+
 The method is tested in test_lib_challenges
 """
 
 import logging
+import time
+from collections import OrderedDict
+from threading import Lock
 
 from ..models import Challenge
+from .challengechannel import get_challenge_channel
+from .framework import get_app_config_value, get_app_local_store
 from .log import log_with
 
 log = logging.getLogger(__name__)
 
+CACHE_SIZE_CONFIG_NAME = "EDUMFA_CHALLENGE_CACHE_SIZE"
+CACHE_TTL_CONFIG_NAME = "EDUMFA_CHALLENGE_CACHE_TTL"
+DEFAULT_CACHE_TTL = 5
+
+
+class ChallengeCache:
+    """
+    A process-local cache of the challenges of a transaction ID or of a
+    token serial. The cache holds at most ``size`` entries for at most
+    ``ttl`` seconds.
+
+    The cache stores read-only copies of the challenges, which are not
+    attached to a database session.
+    """
+
+    def __init__(self, size, ttl=DEFAULT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        # The generation is increased by every invalidation. A query result is
+        # only stored, if no invalidation happened while it was read.
+        self.generation = 0
+
+    def get(self, key):
+        """
+        Return the cached challenges for the given key.
+
+        :param key: a tuple ("transaction_id", transaction_id) or ("serial", serial)
+        :return: a tuple of challenges or None, if the key is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expiry, challenges = entry
+            if expiry < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return challenges
+
+    def put(self, key, challenges, generation):
+        """
+        Store the challenges for the given key, if the cache was not
+        invalidated since ``generation``.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, tuple(challenges))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, transaction_id, serial=None):
+        """
+        Drop the entries of a changed challenge.
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(("transaction_id", transaction_id), None)
+            if serial is not None:
+                self._entries.pop(("serial", serial), None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+def get_challenge_cache():
+    """
+    Return the ``ChallengeCache`` of the current application, if it is enabled
+    via ``EDUMFA_CHALLENGE_CACHE_SIZE``.
+
+    :return: a ``ChallengeCache`` object or None
+    """
+    size = int(get_app_config_value(CACHE_SIZE_CONFIG_NAME, 0))
+    if size <= 0:
+        return None
+    app_store = get_app_local_store()
+    try:
+        return app_store["challenge_cache"]
+    except KeyError:
+        cache = ChallengeCache(
+            size,
+            ttl=float(get_app_config_value(CACHE_TTL_CONFIG_NAME, DEFAULT_CACHE_TTL)),
+        )
+        if app_store.setdefault("challenge_cache", cache) is cache:
+            get_challenge_channel().add_listener(cache.invalidate)
+        return app_store["challenge_cache"]
+
+
+def _copy_challenge(challenge):
+    """
+    Return a copy of the challenge, which is not attached to the database session.
+    """
+    copy = Challenge(
+        challenge.serial,
+        transaction_id=challenge.transaction_id,
+        challenge=challenge.challenge,
+        data=challenge.data,
+        session=challenge.session,
+    )
+    copy.id = challenge.id
+    copy.timestamp = challenge.timestamp
+    copy.expiration = challenge.expiration
+    copy.received_count = challenge.received_count
+    copy.otp_valid = challenge.otp_valid
+    return copy
+
+
+def get_open_challenges(serial=None, transaction_id=None):
+    """
+    Return the challenges of a transaction ID or a token serial, that have not
+    expired yet. If the challenge cache is enabled, the challenges are read
+    from the cache.
+
+    The returned challenges must only be read. Use ``get_challenges`` to
+    modify challenges.
+
+    :param serial: challenges for this very serial number
+    :param transaction_id: challenges with this very transaction id
+    :return: list of challenge objects
+    """
+    if transaction_id is not None:
+        key = ("transaction_id", transaction_id)
+        query = {"transaction_id": transaction_id}
+    elif serial is not None:
+        key = ("serial", serial)
+        query = {"serial": serial}
+    else:
+        raise ValueError("Either a serial or a transaction_id is required.")
+    cache = get_challenge_cache()
+    if cache is None:
+        challenges = get_challenges(serial=serial, transaction_id=transaction_id)
+    else:
+        challenges = cache.get(key)
+        if challenges is None:
+            generation = cache.generation
+            challenges = [
+                _copy_challenge(challenge)
+                for challenge in get_challenges(**query)
+                if challenge.is_valid()
+            ]
+            cache.put(key, challenges, generation)
+        if serial is not None and transaction_id is not None:
+            challenges = [c for c in challenges if c.serial == serial]
+    return [challenge for challenge in challenges if challenge.is_valid()]
+
 
 @log_with(log)
 def get_challenges(serial=None, transaction_id=None, challenge=None):
@@ -0,0 +1,359 @@
+#
+# License:  AGPLv3
+# This file is part of eduMFA. eduMFA is a fork of privacyIDEA which was forked from LinOTP.
+# Copyright (c) 2024 eduMFA Project-Team
+#
+# This code is free software; you can redistribute it and/or
+# modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or any later version.
+#
+# This code is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU AFFERO GENERAL PUBLIC LICENSE for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__doc__ = """
+This module implements so-called challenge channels, which notify a waiting
+request that a challenge was answered.
+
+With the ``push_wait`` policy, the request to ``/validate/check`` waits until
+the user confirmed the login on the smartphone. Instead of reading the
+challenge table every second, the request waits for a notification, which is
+sent after the answer of the smartphone has been committed to the database.
+The challenge table is only polled as a fallback (according to
+``EDUMFA_PUSH_WAIT_POLL_INTERVAL``), e.g. if the answer was received by
+another node.
+
+Every change of a challenge is announced, so that the channel is also used to
+invalidate the challenge cache (see ``edumfa.lib.challenge``). This includes
+the bulk deletes and updates of the challenge table, e.g. after a successful
+challenge response authentication.
+
+There should only be one channel per application, which is stored in the
+app-local store.
+
+This module is tested in tests/test_lib_challenges.py.
+"""
+
+import itertools
+import logging
+import os
+import socket
+import threading
+from contextlib import contextmanager
+
+from flask import has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
+from edumfa.models import Challenge
+
+log = logging.getLogger(__name__)
+
+# The key in the session info, which holds the transaction IDs and serials of
+# the challenges, that were changed in the current transaction
+CHALLENGE_CHANGED_KEY = "edumfa_challenge_changed"
+SOCKET_SUFFIX = ".sock"
+
+
+class LocalChallengeChannel:
+    """
+    A channel which notifies the requests waiting in the same process via
+    condition variables. Answers, which are received by other processes, are
+    only found by polling the challenge table.
+
+    It can be activated by setting ``EDUMFA_CHALLENGE_CHANNEL`` to "local".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # The events of the waiting requests per transaction ID
+        self._waiters = {}
+        # The functions, which are called with the transaction ID and the
+        # serial of every changed challenge
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Add a function, which is called with the transaction ID and the serial
+        of every changed challenge. The function may be called from another
+        thread and must not access the database.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    @contextmanager
+    def subscribe(self, transaction_id):
+        """
+        Subscribe to the notifications for the given transaction ID. The
+        subscription has to be done before the challenge table is read,
+        so that no notification is missed.
+
+        :param transaction_id: the transaction ID of the challenge
+        :return: a ``threading.Event``, which is set on a notification
+        """
+        waiter = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(transaction_id, set()).add(waiter)
+        try:
+            yield waiter
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(transaction_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[transaction_id]
+
+    def wake(self, transaction_id, serial=None):
+        """
+        Wake up the requests of this process, which wait for the given
+        transaction ID, and call the listeners.
+        """
+        with self._lock:
+            waiters = list(self._waiters.get(transaction_id, ()))
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(transaction_id, serial)
+        for waiter in waiters:
+            waiter.set()
+
+    def notify(self, transaction_id, serial=None):
+        """
+        Announce that the challenge with the given transaction ID was changed,
+        e.g. answered. This is called after the change has been committed to
+        the database.
+        """
+        self.wake(transaction_id, serial)
+
+
+class SocketChallengeChannel(LocalChallengeChannel):
+    """
+    A channel which additionally notifies the other processes of the node.
+    Every process binds a unix datagram socket in a directory, which is
+    shared by all processes of the node. A notification is sent to all
+    sockets in this directory.
+
+    It can be activated by setting ``EDUMFA_CHALLENGE_CHANNEL`` to "socket".
+    The directory is defined by ``EDUMFA_CHALLENGE_CHANNEL_DIR``. If
+    ``EDUMFA_CHALLENGE_CHANNEL`` is not set, this channel is used, if the
+    directory exists and is writable.
+    """
+
+    def __init__(self, directory):
+        LocalChallengeChannel.__init__(self)
+        self.directory = directory
+        self._socket = None
+        self._socket_name = None
+        self._thread = None
+        self._pid = None
+
+    def _listen(self):
+        # The socket is bound lazily, so that every forked process binds its own socket
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._socket_name = os.path.join(
+                self.directory, f"{self._pid}{SOCKET_SUFFIX}"
+            )
+            try:
+                if os.path.exists(self._socket_name):
+                    os.unlink(self._socket_name)
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._socket.bind(self._socket_name)
+            except OSError as exx:
+                log.warning(
+                    f"Could not bind challenge channel socket {self._socket_name!r}: {exx}"
+                )
+                self._socket = None
+                return
+            self._thread = threading.Thread(
+                target=self._receive, args=(self._socket,), daemon=True
+            )
+            self._thread.start()
+
+    def _receive(self, sock):
+        while True:
+            try:
+                data = sock.recv(256)
+            except OSError as exx:
+                if self._socket is sock:
+                    log.warning(f"Could not receive challenge notification: {exx}")
+                return
+            if self._socket is not sock:
+                # The channel was closed
+                return
+            transaction_id, _, serial = data.decode("utf-8", "replace").partition("\n")
+            self.wake(transaction_id, serial or None)
+
+    def close(self):
+        """
+        Stop the receiver thread and remove the socket of this process.
+        """
+        with self._lock:
+            sock, thread, socket_name = self._socket, self._thread, self._socket_name
+            self._socket = self._thread = self._socket_name = self._pid = None
+        if sock is None:
+            return
+        try:
+            # This wakes up the receiver thread
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError as exx:
+            log.debug(f"Could not shut down challenge channel socket: {exx}")
+        if thread is not None:
+            thread.join(5)
+        sock.close()
+        try:
+            os.unlink(socket_name)
+        except OSError as exx:
+            log.debug(f"Could not remove challenge channel socket: {exx}")
+
+    def add_listener(self, listener):
+        self._listen()
+        LocalChallengeChannel.add_listener(self, listener)
+
+    def subscribe(self, transaction_id):
+        self._listen()
+        return LocalChallengeChannel.subscribe(self, transaction_id)
+
+    def notify(self, transaction_id, serial=None):
+        self.wake(transaction_id, serial)
+        data = f"{transaction_id}\n{serial or ''}".encode()
+        try:
+            names = os.listdir(self.directory)
+        except OSError as exx:
+            log.warning(f"Could not read challenge channel directory: {exx}")
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for name in names:
+                filename = os.path.join(self.directory, name)
+                if not name.endswith(SOCKET_SUFFIX) or filename == self._socket_name:
+                    continue
+                try:
+                    sock.sendto(data, filename)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The process does not exist anymore
+                    log.debug(f"Removing stale challenge channel socket {filename!r}")
+                    try:
+                        os.unlink(filename)
+                    except OSError:
+                        pass
+                except OSError as exx:
+                    log.debug(f"Could not notify {filename!r}: {exx}")
+
+
+CHALLENGE_CHANNEL_CLASSES = {
+    "local": LocalChallengeChannel,
+    "socket": SocketChallengeChannel,
+}
+DEFAULT_CHANNEL_CLASS_NAME = "local"
+CHANNEL_CONFIG_NAME = "EDUMFA_CHALLENGE_CHANNEL"
+CHANNEL_DIR_CONFIG_NAME = "EDUMFA_CHALLENGE_CHANNEL_DIR"
+DEFAULT_CHANNEL_DIR = "/run/edumfa/challenges"
+POLL_INTERVAL_CONFIG_NAME = "EDUMFA_PUSH_WAIT_POLL_INTERVAL"
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+def get_challenge_channel():
+    """
+    Return the challenge channel associated with the current application.
+    If there is no such object yet, create one and write it to the app-local store.
+    This respects the ``EDUMFA_CHALLENGE_CHANNEL`` config option. If it is not
+    set, the socket channel is used, if ``EDUMFA_CHALLENGE_CHANNEL_DIR`` is a
+    writable directory, since the local channel only notifies the requests of
+    the same process.
+
+    :return: a ``LocalChallengeChannel`` object
+    """
+    app_store = get_app_local_store()
+    try:
+        return app_store["challenge_channel"]
+    except KeyError:
+        directory = get_app_config_value(CHANNEL_DIR_CONFIG_NAME, DEFAULT_CHANNEL_DIR)
+        channel_class_name = get_app_config_value(CHANNEL_CONFIG_NAME)
+        if channel_class_name is None:
+            if os.path.isdir(directory) and os.access(directory, os.W_OK | os.X_OK):
+                channel_class_name = "socket"
+            else:
+                channel_class_name = DEFAULT_CHANNEL_CLASS_NAME
+        elif channel_class_name not in CHALLENGE_CHANNEL_CLASSES:
+            log.warning(f"Unknown challenge channel class: {channel_class_name!r}")
+            channel_class_name = DEFAULT_CHANNEL_CLASS_NAME
+        if channel_class_name == "socket":
+            channel = SocketChallengeChannel(directory)
+        else:
+            channel = CHALLENGE_CHANNEL_CLASSES[channel_class_name]()
+        log.info(f"Created a new challenge channel: {channel!r}")
+        return app_store.setdefault("challenge_channel", channel)
+
+
+def get_poll_interval():
+    """
+    Return the number of seconds, after which a waiting request reads the
+    challenge table again, if it was not notified.
+
+    :return: float
+    """
+    return float(get_app_config_value(POLL_INTERVAL_CONFIG_NAME, DEFAULT_POLL_INTERVAL))
+
+
+def mark_challenge_changed(session, transaction_id, serial=None):
+    """
+    Mark the challenge with the given transaction ID as changed in the current
+    transaction of the session. After the transaction is committed, the
+    change is announced via the challenge channel.
+
+    Challenges, which are changed via the ORM or via a bulk delete or update
+    of the session, are marked automatically.
+
+    :param session: an SQLAlchemy session
+    :param transaction_id: the transaction ID of the challenge
+    :param serial: the serial of the token of the challenge
+    """
+    session.info.setdefault(CHALLENGE_CHANGED_KEY, set()).add((transaction_id, serial))
+
+
+@event.listens_for(Session, "before_flush")
+def _mark_flushed_challenges(session, flush_context, instances):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Challenge):
+            mark_challenge_changed(session, obj.transaction_id, obj.serial)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_challenges(orm_execute_state):
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Challenge:
+        return
+    # The affected challenges are not known after a bulk statement, so we
+    # read them before
+    query = select(Challenge.transaction_id, Challenge.serial).distinct()
+    whereclause = orm_execute_state.statement.whereclause
+    if whereclause is not None:
+        query = query.where(whereclause)
+    session = orm_execute_state.session
+    for transaction_id, serial in session.execute(query):
+        mark_challenge_changed(session, transaction_id, serial)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_after_commit(session):
+    changed = session.info.pop(CHALLENGE_CHANGED_KEY, None)
+    if changed and has_app_context():
+        channel = get_challenge_channel()
+        for transaction_id, serial in changed:
+            channel.notify(transaction_id, serial)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(CHALLENGE_CHANGED_KEY, None)
@@ -32,6 +32,7 @@ import datetime
 import importlib
 import inspect
 import logging
+import random
 import sys
 import threading
 import traceback
@@ -59,6 +60,7 @@ from ..models import (
 # We need these imports to return the list of CA connector types. Bummer: New import for each new Class anyway.
 from .caconnectors import localca, msca
 from .caconnectors.baseca import BaseCAConnector
+from .configchannel import get_config_channel
 from .crypto import decryptPassword, encryptPassword
 from .log import log_with
 from .machines.base import BaseMachineResolver
@@ -81,8 +83,8 @@ class SharedConfigClass:
 
     The method ``_reload_from_db()`` compares this timestamp against the
     timestamp in the database (while taking the EDUMFA_CHECK_RELOAD_CONFIG
-    setting into account). If the database timestamp is newer, the current
-    configuration is updated.
+    setting and the config channel into account). If the database timestamp
+    is newer, the current configuration is updated.
 
     However, app code must not access the config stored in the shared object!
     Instead, it must use ``reload_and_clone()`` to retrieve
@@ -93,12 +95,66 @@ class SharedConfigClass:
         self._config_lock = threading.Lock()
         self.config = {}
         self.resolver = {}
+        # The version of each resolver configuration, which only changes,
+        # if the configuration of this resolver changes
+        self.resolver_versions = {}
         self.realm = {}
         self.default_realm = None
         self.policies = []
+        self.policy_index = None
         self.events = []
+        self.event_index = None
         self.timestamp = None
         self.caconnectors = []
+        self.channel_version = None
+        self.channel_reload_after = None
+        self.reload_jitter = 0
+
+    def _reload_due(self):
+        """
+        Check if the timestamp in the database needs to be read.
+
+        This is the case, if the configuration was never loaded, if the
+        ``EDUMFA_CHECK_RELOAD_CONFIG`` interval has passed or if the config
+        channel announced a change. To avoid that all processes reload
+        at the same time, the interval and the reload after an announced
+        change are delayed by a random jitter of up to
+        ``EDUMFA_CONFIG_RELOAD_JITTER`` seconds.
+
+        :return: True or False
+        """
+        now = datetime.datetime.now()
+        if not self.timestamp:
+            return True
+        check_reload_config = get_app_config_value("EDUMFA_CHECK_RELOAD_CONFIG", 0)
+        if (
+            self.timestamp
+            + datetime.timedelta(seconds=check_reload_config + self.reload_jitter)
+            < now
+        ):
+            return True
+        channel_version = get_config_channel().get_version()
+        if channel_version != self.channel_version:
+            if self.channel_reload_after is None:
+                self.channel_reload_after = now + datetime.timedelta(
+                    seconds=self._get_jitter()
+                )
+            if self.channel_reload_after <= now:
+                log.debug(f"Config channel announced version {channel_version!r}")
+                self.channel_version = channel_version
+                self.channel_reload_after = None
+                return True
+        return False
+
+    @staticmethod
+    def _get_jitter():
+        """
+        :return: a random delay in seconds according to ``EDUMFA_CONFIG_RELOAD_JITTER``
+        """
+        max_jitter = float(get_app_config_value("EDUMFA_CONFIG_RELOAD_JITTER", 0))
+        if max_jitter <= 0:
+            return 0
+        return random.uniform(0, max_jitter)  # nosec B311 # not used for crypto
 
     def _reload_from_db(self):
         """
@@ -106,12 +162,7 @@ class SharedConfigClass:
         the internal timestamp, then read the complete data
         :return:
         """
-        check_reload_config = get_app_config_value("EDUMFA_CHECK_RELOAD_CONFIG", 0)
-        if (
-            not self.timestamp
-            or self.timestamp + datetime.timedelta(seconds=check_reload_config)
-            < datetime.datetime.now()
-        ):
+        if self._reload_due():
             db_ts = Config.query.filter_by(Key=EDUMFA_TIMESTAMP).first()
             if reload_db(self.timestamp, db_ts):
                 log.debug("Reloading shared config from database")
@@ -165,12 +216,18 @@ class SharedConfigClass:
                             }
                         )
                     realmconfig[realm.name] = realmdef
-                # Load all policies
+                # Load all policies and compile the policy index
+                from edumfa.lib.policy import PolicyIndex
+
                 for pol in Policy.query.all():
                     policies.append(pol.get())
-                # Load all events
+                policy_index = PolicyIndex(policies)
+                # Load all events and index them
+                from edumfa.lib.event import index_events
+
                 for event in EventHandler.query.order_by(EventHandler.ordering):
                     events.append(event.get())
+                event_index = index_events(events)
                 # Load all CA connectors
                 from edumfa.lib.caconnector import get_caconnector_object
 
@@ -191,14 +248,30 @@ class SharedConfigClass:
 
                 # Finally, set the current timestamp
                 timestamp = datetime.datetime.now()
+                reload_jitter = self._get_jitter()
+                # Resolvers with an unchanged configuration keep their version,
+                # so that their resolver objects do not need to be recreated
+                resolver_versions = {}
+                for name, resolverdef in resolverconfig.items():
+                    if (
+                        name in self.resolver_versions
+                        and self.resolver.get(name) == resolverdef
+                    ):
+                        resolver_versions[name] = self.resolver_versions[name]
+                    else:
+                        resolver_versions[name] = timestamp
                 with self._config_lock:
                     self.config = config
                     self.resolver = resolverconfig
+                    self.resolver_versions = resolver_versions
                     self.realm = realmconfig
                     self.default_realm = default_realm
                     self.policies = policies
+                    self.policy_index = policy_index
                     self.events = events
+                    self.event_index = event_index
                     self.timestamp = timestamp
+                    self.reload_jitter = reload_jitter
                     self.caconnectors = caconnectors
 
     def _clone(self):
@@ -215,6 +288,9 @@ class SharedConfigClass:
                 self.events,
                 self.caconnectors,
                 self.timestamp,
+                self.policy_index,
+                self.event_index,
+                self.resolver_versions,
             )
 
     def reload_and_clone(self):
@@ -246,15 +322,21 @@ class LocalConfigClass:
         events,
         caconnectors,
         timestamp,
+        policy_index=None,
+        event_index=None,
+        resolver_versions=None,
     ):
         self.config = config
         self.resolver = resolver
+        self.resolver_versions = resolver_versions or {}
         self.realm = realm
         self.default_realm = default_realm
         self.policies = policies
         self.events = events
         self.caconnectors = caconnectors
         self.timestamp = timestamp
+        self.policy_index = policy_index
+        self.event_index = event_index
 
     def get_config(self, key=None, default=None, role="admin", return_bool=False):
         """
@@ -0,0 +1,181 @@
+#
+# License:  AGPLv3
+# This file is part of eduMFA. eduMFA is a fork of privacyIDEA which was forked from LinOTP.
+# Copyright (c) 2024 eduMFA Project-Team
+#
+# This code is free software; you can redistribute it and/or
+# modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or any later version.
+#
+# This code is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU AFFERO GENERAL PUBLIC LICENSE for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__doc__ = """
+This module implements so-called config channels, which notify the
+wsgi processes about changes of the configuration in the database.
+
+By default, every process polls the configuration timestamp in the database
+(according to ``EDUMFA_CHECK_RELOAD_CONFIG``). A config channel allows the
+process that changed the configuration to push a notification to all other
+processes, which then only need to read the database, if a notification
+was received.
+
+There should only be one channel per application, which is stored in the
+app-local store.
+
+This module is tested in tests/test_lib_config.py.
+"""
+
+import logging
+import os
+import time
+
+from flask import has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
+
+log = logging.getLogger(__name__)
+
+# The key in the session info, which marks a transaction that modified the config
+CONFIG_CHANGED_KEY = "edumfa_config_changed"
+
+
+class BaseConfigChannel:
+    """
+    Abstract base class for config channels.
+    """
+
+    def get_version(self):
+        """
+        Return the current version of the configuration as announced via
+        the channel. A changed version means that the configuration in the
+        database was changed.
+
+        :return: a comparable object or None, if the channel does not announce changes
+        """
+        raise NotImplementedError()
+
+    def notify(self):
+        """
+        Announce a change of the configuration to all processes.
+        This is called after the change has been committed to the database.
+        """
+        raise NotImplementedError()
+
+
+class PollConfigChannel(BaseConfigChannel):
+    """
+    A channel which does not announce changes. The processes only
+    poll the config timestamp in the database.
+
+    It can be activated by setting ``EDUMFA_CONFIG_CHANNEL`` to "poll".
+    """
+
+    def get_version(self):
+        return None
+
+    def notify(self):
+        pass
+
+
+class FileConfigChannel(BaseConfigChannel):
+    """
+    A channel which announces changes by writing a new nanosecond timestamp
+    to a file, which is shared by all processes of the node.
+    Checking for a change only costs reading this small file instead of a
+    database query. The version combines the modification time, size and inode
+    of the file with its content, so two notifications are told apart even on
+    file systems with a coarse timestamp resolution.
+
+    It can be activated by setting ``EDUMFA_CONFIG_CHANNEL`` to "file". The
+    file is defined by ``EDUMFA_CONFIG_CHANNEL_FILE``.
+    """
+
+    def __init__(self, filename):
+        BaseConfigChannel.__init__(self)
+        self.filename = filename
+
+    def get_version(self):
+        try:
+            with open(self.filename) as f:
+                stat = os.fstat(f.fileno())
+                content = f.read().strip()
+            return stat.st_mtime_ns, stat.st_size, stat.st_ino, content
+        except OSError as exx:
+            log.debug(f"Could not read config channel file {self.filename!r}: {exx}")
+            return None
+
+    def notify(self):
+        try:
+            with open(self.filename, "w") as f:
+                f.write(f"{time.time_ns()}\n")
+        except OSError as exx:
+            log.warning(f"Could not write config channel file {self.filename!r}: {exx}")
+
+
+CONFIG_CHANNEL_CLASSES = {
+    "poll": PollConfigChannel,
+    "file": FileConfigChannel,
+}
+DEFAULT_CHANNEL_CLASS_NAME = "poll"
+CHANNEL_CONFIG_NAME = "EDUMFA_CONFIG_CHANNEL"
+CHANNEL_FILE_CONFIG_NAME = "EDUMFA_CONFIG_CHANNEL_FILE"
+DEFAULT_CHANNEL_FILE = "/var/lib/edumfa/config.version"
+
+
+def get_config_channel():
+    """
+    Return the config channel associated with the current application.
+    If there is no such object yet, create one and write it to the app-local store.
+    This respects the ``EDUMFA_CONFIG_CHANNEL`` config option.
+
+    :return: a ``BaseConfigChannel`` object
+    """
+    app_store = get_app_local_store()
+    try:
+        return app_store["config_channel"]
+    except KeyError:
+        channel_class_name = get_app_config_value(
+            CHANNEL_CONFIG_NAME, DEFAULT_CHANNEL_CLASS_NAME
+        )
+        if channel_class_name not in CONFIG_CHANNEL_CLASSES:
+            log.warning(f"Unknown config channel class: {channel_class_name!r}")
+            channel_class_name = DEFAULT_CHANNEL_CLASS_NAME
+        if channel_class_name == "file":
+            channel = FileConfigChannel(
+                get_app_config_value(CHANNEL_FILE_CONFIG_NAME, DEFAULT_CHANNEL_FILE)
+            )
+        else:
+            channel = CONFIG_CHANNEL_CLASSES[channel_class_name]()
+        log.info(f"Created a new config channel: {channel!r}")
+        return app_store.setdefault("config_channel", channel)
+
+
+def mark_config_changed(session):
+    """
+    Mark the current transaction of the session as a transaction that
+    modified the configuration. After the transaction is committed,
+    the change is announced via the config channel.
+
+    :param session: an SQLAlchemy session
+    """
+    session.info[CONFIG_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_after_commit(session):
+    if session.info.pop(CONFIG_CHANGED_KEY, False) and has_app_context():
+        get_config_channel().notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(CONFIG_CHANGED_KEY, None)
@@ -46,8 +46,11 @@ import logging
 import random
 import secrets
 import string
+import time
 import traceback
+from collections import OrderedDict
 from hashlib import sha256
+from threading import Lock
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, padding, serialization
@@ -62,6 +65,7 @@ from edumfa.lib.framework import (
     get_app_config_value,
     get_app_local_store,
 )
+from edumfa.lib.kdfpool import get_kdf_pool
 from edumfa.lib.log import log_with
 from edumfa.lib.utils import (
     b64encode_and_unicode,
@@ -69,7 +73,10 @@ from edumfa.lib.utils import (
     to_bytes,
     to_unicode,
 )
-from edumfa.lib.utils.password_hash import verify_with_crypt_context
+from edumfa.lib.utils.password_hash import (
+    verify_with_crypt_context,
+    verify_with_schemes,
+)
 
 
 def safe_compare(a, b):
@@ -88,9 +95,112 @@ DEFAULT_HASH_ALGO_PARAMS = {"argon2__rounds": ROUNDS}
 
 FAILED_TO_DECRYPT_PASSWORD = "FAILED TO DECRYPT PASSWORD!"  # nosec B105 # placeholder in case of error
 
+SECRET_CACHE_CONFIG_NAME = "EDUMFA_SECRET_CACHE"
+SECRET_CACHE_SIZE_CONFIG_NAME = "EDUMFA_SECRET_CACHE_SIZE"
+SECRET_CACHE_TTL_CONFIG_NAME = "EDUMFA_SECRET_CACHE_TTL"
+DEFAULT_SECRET_CACHE_SIZE = 1000
+DEFAULT_SECRET_CACHE_TTL = 300
+
 log = logging.getLogger(__name__)
 
 
+class DecryptedKeyCache:
+    """
+    A process-local cache of decrypted OTP keys, which avoids decrypting the
+    key via the security module for every HMAC calculation.
+
+    The cache holds at most ``size`` keys for at most ``ttl`` seconds. Keys
+    are zeroed in memory, when they are evicted or expired. The cache only
+    hands out copies of the keys, so that callers can zero their copy.
+    """
+
+    def __init__(self, size=DEFAULT_SECRET_CACHE_SIZE, ttl=DEFAULT_SECRET_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._keys = OrderedDict()
+
+    def get(self, enc_key, iv):
+        """
+        Return a copy of the decrypted key for the given encrypted key and IV.
+
+        :param enc_key: the encrypted key
+        :type enc_key: bytes
+        :param iv: the initialisation vector
+        :type iv: bytes
+        :return: the binary key or None, if it is not cached
+        :rtype: bytearray or None
+        """
+        with self._lock:
+            entry = self._keys.get((enc_key, iv))
+            if entry is None:
+                return None
+            expiry, bkey = entry
+            if expiry < time.monotonic():
+                self._evict((enc_key, iv))
+                return None
+            self._keys.move_to_end((enc_key, iv))
+            return bytearray(bkey)
+
+    def put(self, enc_key, iv, bkey):
+        """
+        Store a copy of the decrypted key.
+
+        :param enc_key: the encrypted key
+        :type enc_key: bytes
+        :param iv: the initialisation vector
+        :type iv: bytes
+        :param bkey: the binary decrypted key
+        :type bkey: bytes or bytearray
+        """
+        with self._lock:
+            if (enc_key, iv) in self._keys:
+                self._evict((enc_key, iv))
+            self._keys[(enc_key, iv)] = (time.monotonic() + self.ttl, bytearray(bkey))
+            while len(self._keys) > self.size:
+                self._evict(next(iter(self._keys)))
+
+    def clear(self):
+        """
+        Remove and zero all cached keys.
+        """
+        with self._lock:
+            for key in list(self._keys):
+                self._evict(key)
+
+    def _evict(self, key):
+        _expiry, bkey = self._keys.pop(key)
+        zerome(bkey)
+
+
+def get_secret_cache():
+    """
+    Return the ``DecryptedKeyCache`` of the current application, if the cache
+    is enabled via ``EDUMFA_SECRET_CACHE``.
+
+    :return: a ``DecryptedKeyCache`` object or None
+    """
+    if not get_app_config_value(SECRET_CACHE_CONFIG_NAME, False):
+        return None
+    app_store = get_app_local_store()
+    try:
+        return app_store["secret_cache"]
+    except KeyError:
+        cache = DecryptedKeyCache(
+            size=int(
+                get_app_config_value(
+                    SECRET_CACHE_SIZE_CONFIG_NAME, DEFAULT_SECRET_CACHE_SIZE
+                )
+            ),
+            ttl=int(
+                get_app_config_value(
+                    SECRET_CACHE_TTL_CONFIG_NAME, DEFAULT_SECRET_CACHE_TTL
+                )
+            ),
+        )
+        return app_store.setdefault("secret_cache", cache)
+
+
 class SecretObj:
     def __init__(self, val, iv, preserve=True):
         self.val = val
@@ -133,10 +243,16 @@ class SecretObj:
 
     def _setupKey_(self):
         if self.bkey is None:
-            akey = decrypt(self.val, self.iv)
-            self.bkey = binascii.unhexlify(akey)
-            zerome(akey)
-            del akey
+            cache = get_secret_cache()
+            if cache is not None:
+                self.bkey = cache.get(self.val, self.iv)
+            if self.bkey is None:
+                akey = decrypt(self.val, self.iv)
+                self.bkey = binascii.unhexlify(akey)
+                zerome(akey)
+                del akey
+                if cache is not None:
+                    cache.put(self.val, self.iv, self.bkey)
 
     def _clearKey_(self, preserve=False):
         if preserve is False and self.bkey is not None:
@@ -168,6 +284,29 @@ def hash(val, seed, algo=None):
     return hexlify_and_unicode(m.digest())
 
 
+def get_crypt_context(schemes, params=None):
+    """
+    Return a CryptContext for the given hash algorithms and parameters.
+
+    Creating a CryptContext is expensive, so the contexts are cached in the
+    app-local store. The cache is keyed by the algorithms and parameters, so
+    a changed configuration results in a new context.
+
+    :param schemes: list of hash algorithms
+    :type schemes: list
+    :param params: additional parameters for the hash algorithms
+    :type params: dict
+    :return: a ``CryptContext`` object
+    """
+    params = params or {}
+    key = (tuple(schemes), tuple(sorted(params.items())))
+    contexts = get_app_local_store().setdefault("crypt_contexts", {})
+    try:
+        return contexts[key]
+    except KeyError:
+        return contexts.setdefault(key, CryptContext(list(schemes), **params))
+
+
 @log_with(log, log_entry=False, log_exit=False)
 def pass_hash(password):
     """
@@ -176,12 +315,11 @@ def pass_hash(password):
     :type password: str
     :return: The hash string of the password
     """
-    DEFAULT_HASH_ALGO_PARAMS.update(
-        get_app_config_value("EDUMFA_HASH_ALGO_PARAMS", default={})
-    )
-    pass_ctx = CryptContext(
+    params = dict(DEFAULT_HASH_ALGO_PARAMS)
+    params.update(get_app_config_value("EDUMFA_HASH_ALGO_PARAMS", default={}))
+    pass_ctx = get_crypt_context(
         get_app_config_value("EDUMFA_HASH_ALGO_LIST", default=DEFAULT_HASH_ALGO_LIST),
-        **DEFAULT_HASH_ALGO_PARAMS,
+        params,
     )
     pw_dig = pass_ctx.hash(password)
     return pw_dig
@@ -198,9 +336,13 @@ def verify_pass_hash(password, hvalue):
     :return: True if the password matches
     :rtype: bool
     """
-    pass_ctx = CryptContext(
-        get_app_config_value("EDUMFA_HASH_ALGO_LIST", default=DEFAULT_HASH_ALGO_LIST)
+    schemes = get_app_config_value(
+        "EDUMFA_HASH_ALGO_LIST", default=DEFAULT_HASH_ALGO_LIST
     )
+    pool = get_kdf_pool()
+    if pool:
+        return pool.run(verify_with_schemes, tuple(schemes), password, hvalue)
+    pass_ctx = get_crypt_context(schemes)
     return verify_with_crypt_context(pass_ctx, password, hvalue)
 
 
@@ -675,6 +817,31 @@ def zerome(bufferObject):
     return
 
 
+def merkle_root(data_list):
+    """
+    Calculate the root of a SHA-256 Merkle tree over the given list of strings.
+    Leaves and inner nodes are hashed with different prefixes, an odd node
+    is passed to the next level unchanged.
+
+    :param data_list: list of strings, which are the leaves of the tree
+    :type data_list: list
+    :return: the hexlified root hash
+    :rtype: str
+    """
+    level = [sha256(b"\x00" + to_bytes(data)).digest() for data in data_list]
+    if not level:
+        return sha256(b"").hexdigest()
+    while len(level) > 1:
+        next_level = [
+            sha256(b"\x01" + level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return hexlify_and_unicode(level[0])
+
+
 def _slow_rsa_verify_raw(key, sig, msg):
     if not (isinstance(sig, int) and isinstance(msg, int)):  # pragma: no cover
         raise ParameterError("Message and signature need to be integer")
@@ -23,10 +23,10 @@ import json
 import logging
 from urllib.parse import quote
 
-import requests
-
 from edumfa.lib.error import ConfigAdminError
+from edumfa.lib.httpsession import http_request
 from edumfa.lib.log import log_with
+from edumfa.lib.upstream import upstream_request
 from edumfa.lib.utils import fetch_one_resource, to_unicode
 from edumfa.lib.utils.export import register_export, register_import
 from edumfa.models import eduMFAServer as eduMFAServerDB
@@ -66,17 +66,28 @@ class eduMFAServer:
         realm=None,
         transaction_id=None,
         resolver=None,
+        url=None,
     ):
         """
         Perform an HTTP validate/check request to the remote eduMFA
-        Server.
+        Server. If the URL of the server contains several URLs, which are
+        separated by whitespace, the request is sent according to the
+        upstream fan-out mode (see ``edumfa.lib.upstream``).
+
+        The answer to a challenge has to be sent to the server, which created
+        the challenge, since the other servers do not know its transaction ID.
+        This server is passed as ``url``, e.g. the ``remote_url`` of the
+        response, which contained the transaction ID.
 
         :param serial: The serial number of a token
         :param user: The username
         :param password: The password
         :param realm: an optional realm, if it is not contained in the username
         :param transaction_id:  an optional transaction_id.
-        :return: Tuple (HTTP response object, JSON response content)
+        :param url: the URL of the server, which created the challenge of the
+            transaction_id
+        :return: HTTP response object with the additional attribute
+            ``remote_url``, the URL of the server, which sent the response
         """
         data = {"pass": quote(password)}
         if user:
@@ -89,14 +100,7 @@ class eduMFAServer:
             data["transaction_id"] = transaction_id
         if resolver:
             data["resolver"] = resolver
-        response = requests.post(
-            self.config.url + "/validate/check",
-            data=data,
-            verify=self.config.tls,
-            timeout=60,
-        )
-
-        return response
+        return _post_validate_check(self.config, data, url=url)
 
     @staticmethod
     def request(config, user, password):
@@ -113,11 +117,8 @@ class eduMFAServer:
         :param password: the password/OTP to test
         :return: True or False. If any error occurs, an exception is raised.
         """
-        response = requests.post(
-            config.url + "/validate/check",
-            data={"user": quote(user), "pass": quote(password)},
-            verify=config.tls,
-            timeout=60,
+        response = _post_validate_check(
+            config, {"user": quote(user), "pass": quote(password)}
         )
         log.debug(
             f"Sent request to eduMFA server. status code returned: {response.status_code}"
@@ -134,6 +135,41 @@ class eduMFAServer:
         return result.get("status") and result.get("value")
 
 
+def _is_accepted(response):
+    """
+    Check if the response of a remote eduMFA server grants access.
+    """
+    if response.status_code != 200:
+        return False
+    try:
+        result = response.json().get("result", {})
+    except ValueError:
+        return False
+    return bool(result.get("status") and result.get("value"))
+
+
+def _post_validate_check(config, data, url=None):
+    """
+    Send the validate/check request to the URLs of the eduMFA server
+    configuration and return the first response, which grants access,
+    or the first response of the remote servers. If ``url`` is given, the
+    request is only sent to this URL.
+    """
+
+    def send(server_url):
+        response = http_request(
+            "POST",
+            server_url + "/validate/check",
+            data=data,
+            verify=config.tls,
+            timeout=60,
+        )
+        response.remote_url = server_url
+        return response
+
+    return upstream_request([url] if url else config.url.split(), send, _is_accepted)
+
+
 @log_with(log)
 def list_edumfaservers(identifier=None, id=None):
     res = {}
@@ -59,6 +59,7 @@ class ERROR:
     HSM = 707
     SELFSERVICE = 807
     SERVER = 903
+    SERVER_BUSY = 9031
     USER = 904
     PARAMETER = 905
 
@@ -181,6 +182,11 @@ class ServerError(eduMFAError):
         eduMFAError.__init__(self, description=description, id=id)
 
 
+class ServerBusyError(ServerError):
+    def __init__(self, description="server busy!", id=ERROR.SERVER_BUSY):
+        ServerError.__init__(self, description=description, id=id)
+
+
 class HSMException(eduMFAError):
     def __init__(self, description="hsm error!", id=ERROR.HSM):
         eduMFAError.__init__(self, description=description, id=id)
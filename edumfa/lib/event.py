@@ -72,6 +72,8 @@ class event:
             e_handles = self.g.event_config.get_handled_events(
                 self.eventname, position="pre"
             )
+            # The token and user lookups are shared by the handlers of the event
+            lookups = {}
             for e_handler_def in e_handles:
                 log.debug(f"Pre-Handling event {self.eventname} with {e_handler_def}")
                 event_handler_name = e_handler_def.get("handlermodule")
@@ -82,6 +84,7 @@ class event:
                     "request": self.request,
                     "g": self.g,
                     "handler_def": e_handler_def,
+                    "lookups": lookups,
                 }
                 if event_handler.check_condition(options=options):
                     log.debug(
@@ -103,6 +106,8 @@ class event:
                     result = event_handler.do(
                         e_handler_def.get("action"), options=options
                     )
+                    # The action may have changed the token or the user
+                    lookups.clear()
                     # set audit object to success
                     event_audit.log({"success": result})
                     event_audit.finalize_log()
@@ -111,6 +116,7 @@ class event:
 
             # Post-Event Handling
             e_handles = self.g.event_config.get_handled_events(self.eventname)
+            lookups = {}
             for e_handler_def in e_handles:
                 log.debug(f"Post-Handling event {self.eventname} with {e_handler_def}")
                 event_handler_name = e_handler_def.get("handlermodule")
@@ -122,6 +128,7 @@ class event:
                     "g": self.g,
                     "response": f_result,
                     "handler_def": e_handler_def,
+                    "lookups": lookups,
                 }
                 if event_handler.check_condition(options=options):
                     log.debug(
@@ -145,6 +152,8 @@ class event:
                     )
                     # In case the handler has modified the response
                     f_result = options.get("response")
+                    # The action may have changed the token or the user
+                    lookups.clear()
                     # set audit object to success
                     event_audit.log({"success": result})
                     event_audit.finalize_log()
@@ -285,6 +294,25 @@ def delete_event(event_id):
     return fetch_one_resource(EventHandler, id=event_id).delete()
 
 
+def index_events(events):
+    """
+    Index the active event handler definitions by the event name and the
+    position, so that the handlers of an event can be found without checking
+    all definitions.
+
+    :param events: list of event handler definitions, ordered by their ordering
+    :return: dictionary with tuples of event name and position as keys and
+        lists of event handler definitions as values
+    :rtype: dict
+    """
+    index = {}
+    for e in events:
+        if e.get("active"):
+            for eventname in dict.fromkeys(e.get("event")):
+                index.setdefault((eventname, e.get("position")), []).append(e)
+    return index
+
+
 class EventConfiguration:
     """
     This class is supposed to contain the event handling configuration during
@@ -302,6 +330,17 @@ class EventConfiguration:
         """
         return get_config_object().events
 
+    @property
+    def event_index(self):
+        """
+        The index of the active event handlers of the request-local config object.
+        If the config object does not contain an index yet, it is created.
+        """
+        config_object = get_config_object()
+        if config_object.event_index is None:
+            config_object.event_index = index_events(config_object.events)
+        return config_object.event_index
+
     def get_handled_events(self, eventname, position="post"):
         """
         Return a list of the event handling definitions for the given eventname
@@ -311,16 +350,7 @@ class EventConfiguration:
         :param position: the position of the event definition
         :return:
         """
-        eventlist = [
-            e
-            for e in self.events
-            if (
-                eventname in e.get("event")
-                and e.get("active")
-                and e.get("position") == position
-            )
-        ]
-        return eventlist
+        return list(self.event_index.get((eventname, position), []))
 
     def get_event(self, eventid):
         """
@@ -396,27 +396,26 @@ class BaseEventHandler:
                 content = response.json
         return content
 
-    def check_condition(self, options):
-        """
-        Check if all conditions are met and if the action should be executed.
-        The the conditions are met, we return "True"
-        :return: True
+    def _get_token_context(self, request, content, lookups=None):
         """
-        g = options.get("g")
-        request = options.get("request")
-        response = options.get("response")
-        e_handler_def = options.get("handler_def")
-        if not e_handler_def:
-            # options is the handler definition
-            return True
-        # conditions can be corresponding to the property conditions
-        conditions = e_handler_def.get("conditions")
-        content = self._get_response_content(response)
-        user = self._get_tokenowner(request)
+        Determine the user and the token, which are involved in the request.
+
+        If a dictionary ``lookups`` is passed, the result is stored in it, so
+        that the other event handlers of the same event can reuse it.
 
+        :param request: The request object
+        :param content: The content of the response
+        :param lookups: dictionary, which is shared by the handlers of an event
+        :return: tuple of the user, the serial, the token object or None, the
+            realms, the resolvers and the type of the token
+        """
         serial = request.all_data.get("serial") or content.get("detail", {}).get(
             "serial"
         )
+        if lookups is not None and ("token_context", serial) in lookups:
+            return lookups[("token_context", serial)]
+
+        user = self._get_tokenowner(request)
         tokenrealms = []
         tokenresolvers = []
         tokentype = None
@@ -443,6 +442,43 @@ class BaseEventHandler:
                 tokenresolvers.extend([r.get("name") for r in resolvers])
             tokenresolvers = list(set(tokenresolvers))
 
+        token_context = (
+            user,
+            serial,
+            token_obj,
+            tokenrealms,
+            tokenresolvers,
+            tokentype,
+        )
+        if lookups is not None:
+            lookups[("token_context", serial)] = token_context
+        return token_context
+
+    def check_condition(self, options):
+        """
+        Check if all conditions are met and if the action should be executed.
+        The the conditions are met, we return "True"
+        :return: True
+        """
+        g = options.get("g")
+        request = options.get("request")
+        response = options.get("response")
+        e_handler_def = options.get("handler_def")
+        if not e_handler_def:
+            # options is the handler definition
+            return True
+        # conditions can be corresponding to the property conditions
+        conditions = e_handler_def.get("conditions")
+        content = self._get_response_content(response)
+        (
+            user,
+            serial,
+            token_obj,
+            tokenrealms,
+            tokenresolvers,
+            tokentype,
+        ) = self._get_token_context(request, content, options.get("lookups"))
+
         if CONDITION.CLIENT_IP in conditions:
             if g and g.client_ip:
                 ip_policy = [
@@ -27,12 +27,13 @@ Requests can be forwarded to other eduMFA servers.
 import json
 import logging
 
-import requests
 from flask import current_app
 
 from edumfa.lib import _
 from edumfa.lib.edumfaserver import get_edumfaserver, get_edumfaservers
 from edumfa.lib.eventhandler.base import BaseEventHandler
+from edumfa.lib.httpsession import http_request
+from edumfa.lib.upstream import upstream_request
 from edumfa.lib.utils import is_true
 
 log = logging.getLogger(__name__)
@@ -131,8 +132,10 @@ class FederationEventHandler(BaseEventHandler):
             server_def = handler_options.get("eduMFA")
             pi_server = get_edumfaserver(server_def)
 
-            # the new url is the configured server url and the original path
-            url = pi_server.config.url + request.path
+            # the new url is the configured server url and the original path.
+            # If several server urls are configured, the next one is only
+            # used if the previous one is not reachable.
+            urls = [u + request.path for u in pi_server.config.url.split()]
             # We use the original method
             method = request.method
             tls = pi_server.config.tls
@@ -145,8 +148,8 @@ class FederationEventHandler(BaseEventHandler):
             if handler_options.get("resolver"):
                 data["resolver"] = handler_options.get("resolver")
 
-            log.info(f"Sending {method} request to {url!r}")
-            requester = None
+            log.info(f"Sending {method} request to {urls!r}")
+            http_method = None
             params = None
             headers = {}
 
@@ -158,16 +161,25 @@ class FederationEventHandler(BaseEventHandler):
             if method.upper() == "GET":
                 params = data
                 data = None
-                requester = requests.get
+                http_method = "GET"
             elif method.upper() == "POST":
-                requester = requests.post
+                http_method = "POST"
             elif method.upper() == "DELETE":
-                requester = requests.delete
+                http_method = "DELETE"
 
-            if requester:
-                r = requester(
-                    url, params=params, data=data, headers=headers, verify=tls
-                )
+            if http_method:
+
+                def send(server_url):
+                    return server_url, http_request(
+                        http_method,
+                        server_url,
+                        params=params,
+                        data=data,
+                        headers=headers,
+                        verify=tls,
+                    )
+
+                url, r = upstream_request(urls, send, fanout="failover")
                 # convert requests Response to werkzeug Response
                 response_dict = json.loads(r.text)
                 if "detail" in response_dict:
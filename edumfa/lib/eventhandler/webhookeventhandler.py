@@ -25,12 +25,12 @@ api requests and reduce your traffic this way.
 import json
 import logging
 
-import requests
 from requests.exceptions import ConnectionError, HTTPError, RequestException, Timeout
 
 from edumfa.lib import _
 from edumfa.lib.error import UserError
 from edumfa.lib.eventhandler.base import BaseEventHandler
+from edumfa.lib.httpsession import http_request
 from edumfa.lib.user import User
 from edumfa.lib.utils import replace_function_event_handler
 
@@ -165,7 +165,8 @@ class WebHookHandler(BaseEventHandler):
                     log.info(
                         f"A webhook is send to {webhook_url!r} with the text: {webhook_text!r}"
                     )
-                    resp = requests.post(
+                    resp = http_request(
+                        "POST",
                         webhook_url,
                         data=json.dumps(webhook_text),
                         headers={"Content-Type": content_type},
@@ -182,9 +183,10 @@ class WebHookHandler(BaseEventHandler):
                     log.info(
                         f"A webhook is send to {webhook_url!r} with the text: {webhook_text!r}"
                     )
-                    resp = requests.post(
+                    resp = http_request(
+                        "POST",
                         webhook_url,
-                        webhook_text,
+                        data=webhook_text,
                         headers={"Content-Type": content_type},
                         timeout=TIMEOUT,
                     )
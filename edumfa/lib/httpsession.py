@@ -0,0 +1,238 @@
+#
+# License:  AGPLv3
+# This file is part of eduMFA. eduMFA is a fork of privacyIDEA which was forked from LinOTP.
+# Copyright (c) 2024 eduMFA Project-Team
+#
+# This code is free software; you can redistribute it and/or
+# modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or any later version.
+#
+# This code is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU AFFERO GENERAL PUBLIC LICENSE for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__doc__ = """
+This module implements a so-called session registry which manages
+the ``requests`` sessions used for outgoing HTTP requests, e.g. by the
+remote token, the HTTP SMS provider, the webhook handler and the HTTP
+and SCIM resolvers.
+
+The registry holds one session per target (scheme, host and port). Each
+session keeps a pool of connections to the target open, so that subsequent
+requests do not need a new TCP connection and TLS handshake.
+
+There should only be one shared registry per application which is
+used by all threads. This is analogous to the engine registry in
+``edumfa.lib.pooling``.
+
+This module is tested in tests/test_lib_httpsession.py.
+"""
+
+import logging
+import os
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from flask import has_app_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
+
+log = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 0
+DEFAULT_BACKOFF_FACTOR = 0.1
+
+
+def _get_target(url):
+    """
+    Return the target of the URL, i.e. the scheme, the host and the port.
+
+    :param url: the URL of the request
+    :return: a string like ``https://example.com:443``
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    port = parts.port or {"http": 80, "https": 443}.get(scheme)
+    return f"{scheme}://{(parts.hostname or '').lower()}:{port}"
+
+
+class BaseSessionRegistry:
+    """
+    Abstract base class for session registries.
+    """
+
+    def __init__(
+        self, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, targets=None
+    ):
+        """
+        :param pool_size: the number of connections, which are kept open per target
+        :param retries: the number of retries of failed connection attempts
+        :param targets: a dictionary, which maps a target like
+            ``https://example.com`` or ``https://example.com:8443`` to a dictionary
+            with the keys ``pool_size`` and ``retries``, which override the
+            defaults for this target.
+        """
+        self.pool_size = int(pool_size)
+        self.retries = int(retries)
+        self.targets = {_get_target(k): v for k, v in (targets or {}).items()}
+
+    def create_session(self, target):
+        """
+        Create a new session for the given target with the configured pool
+        size and retries.
+
+        :param target: the target as returned by ``_get_target``
+        :return: a ``requests.Session`` object
+        """
+        target_config = self.targets.get(target, {})
+        pool_size = int(target_config.get("pool_size", self.pool_size))
+        retries = int(target_config.get("retries", self.retries))
+        # Only failed connection attempts are retried. A read error is raised
+        # immediately, since the request, e.g. with an OTP value, may already
+        # have been processed by the target.
+        retry = Retry(
+            total=retries,
+            read=False,
+            backoff_factor=DEFAULT_BACKOFF_FACTOR,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # The session is shared by the requests of all users, so we must not
+        # keep any cookies.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def request(self, method, url, **kwargs):
+        """
+        Send an HTTP request. The parameters are the same as for
+        ``requests.request``.
+
+        :return: a ``requests.Response`` object
+        """
+        raise NotImplementedError()
+
+
+class NullSessionRegistry(BaseSessionRegistry):
+    """
+    A registry which creates a new session for every request.
+    Consequently, connections are not reused.
+
+    It can be activated by setting ``EDUMFA_HTTP_SESSION_REGISTRY_CLASS`` to "null".
+    """
+
+    def request(self, method, url, **kwargs):
+        with self.create_session(_get_target(url)) as session:
+            return session.request(method, url, **kwargs)
+
+
+class SharedSessionRegistry(BaseSessionRegistry):
+    """
+    A registry which holds a dictionary mapping a target to a session.
+
+    It can be activated by setting ``EDUMFA_HTTP_SESSION_REGISTRY_CLASS`` to "shared".
+    """
+
+    def __init__(self, *args, **kwargs):
+        BaseSessionRegistry.__init__(self, *args, **kwargs)
+        self._session_lock = Lock()
+        self._sessions = {}
+        self._pid = os.getpid()
+
+    def get_session(self, url):
+        """
+        Return the session associated with the target of the URL.
+
+        :param url: the URL of the request
+        :return: a ``requests.Session`` object
+        """
+        target = _get_target(url)
+        with self._session_lock:
+            if self._pid != os.getpid():
+                # The connections must not be shared with the parent process
+                self._sessions = {}
+                self._pid = os.getpid()
+            if target not in self._sessions:
+                log.info(
+                    f"Creating a new HTTP session and connection pool for {target}"
+                )
+                self._sessions[target] = self.create_session(target)
+            return self._sessions[target]
+
+    def request(self, method, url, **kwargs):
+        return self.get_session(url).request(method, url, **kwargs)
+
+    def clear(self):
+        """
+        Close all sessions and their connections.
+        """
+        with self._session_lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+SESSION_REGISTRY_CLASSES = {
+    "null": NullSessionRegistry,
+    "shared": SharedSessionRegistry,
+}
+DEFAULT_REGISTRY_CLASS_NAME = "shared"
+REGISTRY_CONFIG_NAME = "EDUMFA_HTTP_SESSION_REGISTRY_CLASS"
+POOL_SIZE_CONFIG_NAME = "EDUMFA_HTTP_POOL_SIZE"
+RETRIES_CONFIG_NAME = "EDUMFA_HTTP_RETRIES"
+TARGETS_CONFIG_NAME = "EDUMFA_HTTP_TARGETS"
+
+
+def get_session_registry():
+    """
+    Return the ``SessionRegistry`` object associated with the current application.
+    If there is no such object yet, create one and write it to the app-local store.
+    This respects the ``EDUMFA_HTTP_SESSION_REGISTRY_CLASS``, ``EDUMFA_HTTP_POOL_SIZE``,
+    ``EDUMFA_HTTP_RETRIES`` and ``EDUMFA_HTTP_TARGETS`` config options.
+
+    :return: a ``SessionRegistry`` object
+    """
+    app_store = get_app_local_store()
+    try:
+        return app_store["http_session_registry"]
+    except KeyError:
+        registry_class_name = get_app_config_value(
+            REGISTRY_CONFIG_NAME, DEFAULT_REGISTRY_CLASS_NAME
+        )
+        if registry_class_name not in SESSION_REGISTRY_CLASSES:
+            log.warning(f"Unknown HTTP session registry class: {registry_class_name!r}")
+            registry_class_name = DEFAULT_REGISTRY_CLASS_NAME
+        registry = SESSION_REGISTRY_CLASSES[registry_class_name](
+            pool_size=get_app_config_value(POOL_SIZE_CONFIG_NAME, DEFAULT_POOL_SIZE),
+            retries=get_app_config_value(RETRIES_CONFIG_NAME, DEFAULT_RETRIES),
+            targets=get_app_config_value(TARGETS_CONFIG_NAME, {}),
+        )
+        log.info(f"Created a new HTTP session registry: {registry!r}")
+        return app_store.setdefault("http_session_registry", registry)
+
+
+def http_request(method, url, **kwargs):
+    """
+    Send an HTTP request via the application-global session registry.
+    The parameters are the same as for ``requests.request``. Outside of an
+    application context, a new connection is used.
+
+    :return: a ``requests.Response`` object
+    """
+    if not has_app_context():
+        return requests.request(method, url, **kwargs)
+    return get_session_registry().request(method, url, **kwargs)
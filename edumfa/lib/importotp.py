@@ -36,6 +36,7 @@ import binascii
 import hashlib
 import hmac
 import html
+import itertools
 import logging
 import re
 import traceback
@@ -126,18 +127,31 @@ def parseOATHcsv(csv):
                         'ocrasuite' : xxx  }
         }
     """
-    TOKENS = {}
-    version = 0
-
     csv_array = csv.split("\n")
+    log.debug(f"the file contains {len(csv_array):d} lines.")
+    return dict(iterOATHcsv(csv_array))
+
+
+def iterOATHcsv(lines):
+    """
+    Parse the lines of an OATH CSV file (see ``parseOATHcsv``) one by one.
+    This allows to import large files without reading the whole file into
+    memory.
 
-    m = re.match(r"^#\s*version:\s*(\d+)", csv_array[0])
+    :param lines: iterable of the lines of the file, like a file object
+    :return: generator of tuples (serial, token dictionary)
+    """
+    version = 0
+    lines = iter(lines)
+    first_line = next(lines, "")
+
+    m = re.match(r"^#\s*version:\s*(\d+)", first_line)
     if m:
         version = m.group(1)
         log.debug(f"the file is version {version}.")
 
-    log.debug(f"the file contains {len(csv_array):d} lines.")
-    for line in csv_array:
+    for line in itertools.chain([first_line], lines):
+        line = line.rstrip("\n")
         # Do not parse comment lines
         if line.startswith("#"):
             continue
@@ -174,9 +188,7 @@ def parseOATHcsv(csv):
             log.debug(f"read the line {params}")
 
             params["user"] = user
-            TOKENS[serial] = params
-
-    return TOKENS
+            yield serial, params
 
 
 @log_with(log)
@@ -0,0 +1,238 @@
+#
+# License:  AGPLv3
+# This file is part of eduMFA. eduMFA is a fork of privacyIDEA which was forked from LinOTP.
+# Copyright (c) 2024 eduMFA Project-Team
+#
+# This code is free software; you can redistribute it and/or
+# modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or any later version.
+#
+# This code is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU AFFERO GENERAL PUBLIC LICENSE for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__doc__ = """
+This module implements a pool of worker processes, which verify password
+hashes (PINs, the authentication cache and SQL resolver passwords).
+
+Key derivation functions like argon2 or bcrypt keep the CPU busy for tens of
+milliseconds. The pool moves this work out of the WSGI process and limits the
+number of verifications, which can be pending at the same time. If the limit
+is reached, further verifications either wait for a free slot or are
+rejected immediately, so that a burst of logins does not block all threads
+of the WSGI process. A verification, which does not finish in time, is
+rejected as well.
+
+There should only be one pool per application, which is stored in the
+app-local store. The pool is only used, if ``EDUMFA_KDF_POOL_SIZE`` is set.
+The limits apply per WSGI process, so the pool is meant for WSGI processes,
+which run several threads. The worker processes are started via a fork
+server (or spawned, if this is not available), since forking a process with
+several threads is not safe. A WSGI process, which was forked after the pool
+was created, gets its own worker processes.
+
+This module is tested in tests/test_lib_kdfpool.py.
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import BoundedSemaphore, Lock
+
+from edumfa.lib import _
+from edumfa.lib.error import ServerBusyError
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
+from edumfa.lib.lifecycle import register_request_finalizer
+from edumfa.lib.monitoringstats import write_stats
+
+log = logging.getLogger(__name__)
+
+POOL_SIZE_CONFIG_NAME = "EDUMFA_KDF_POOL_SIZE"
+QUEUE_SIZE_CONFIG_NAME = "EDUMFA_KDF_POOL_QUEUE_SIZE"
+FULL_CONFIG_NAME = "EDUMFA_KDF_POOL_FULL"
+TIMEOUT_CONFIG_NAME = "EDUMFA_KDF_POOL_TIMEOUT"
+STATS_INTERVAL_CONFIG_NAME = "EDUMFA_KDF_POOL_STATS_INTERVAL"
+DEFAULT_TIMEOUT = 10
+DEFAULT_STATS_INTERVAL = 60
+
+
+def _get_mp_context():
+    # The worker processes must not be forked from a WSGI process, which
+    # runs several threads
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class KDFPool:
+    """
+    A pool of ``size`` worker processes. At most ``queue_size``
+    verifications are pending at the same time. If this limit is reached, a
+    further verification waits up to ``timeout`` seconds for a free slot or,
+    if ``reject`` is set, is rejected immediately with a ``ServerBusyError``.
+    A verification, which does not return a result within ``timeout``
+    seconds, is also rejected with a ``ServerBusyError``.
+    """
+
+    def __init__(
+        self,
+        size,
+        queue_size,
+        reject=False,
+        timeout=DEFAULT_TIMEOUT,
+        stats_interval=DEFAULT_STATS_INTERVAL,
+    ):
+        self.size = size
+        self.queue_size = queue_size
+        self.reject = reject
+        self.timeout = timeout
+        self.stats_interval = stats_interval
+        self._executor = self._create_executor()
+        self._pid = os.getpid()
+        self._slots = BoundedSemaphore(queue_size)
+        self._lock = Lock()
+        self._next_stats = time.monotonic() + stats_interval
+        # The number of pending verifications and the counters since the
+        # statistics were last written
+        self.pending = 0
+        self.counters = {"verified": 0, "rejected": 0}
+
+    def run(self, func, *args):
+        """
+        Run ``func(*args)`` in a worker process and return the result.
+        ``func`` and ``args`` need to be picklable, i.e. ``func`` needs to
+        be a module-level function.
+
+        :raises ServerBusyError: if no slot becomes available or the
+            verification does not finish in time
+        """
+        self._schedule_stats()
+        if self.reject:
+            acquired = self._slots.acquire(blocking=False)
+        else:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        if not acquired:
+            self._reject(
+                "The password verification is rejected, since the pool is busy."
+            )
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+        # The slot is only released, when the worker process is finished,
+        # even if the request does not wait for the result anymore.
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._reject("The password verification did not finish in time.")
+        with self._lock:
+            self.counters["verified"] += 1
+        return result
+
+    def _reject(self, message):
+        with self._lock:
+            self.counters["rejected"] += 1
+        log.warning(message)
+        raise ServerBusyError(
+            _("Too many concurrent authentications. Please try again later.")
+        )
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.size, mp_context=_get_mp_context())
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # The worker processes must not be shared with the parent process
+                self._executor = self._create_executor()
+                self._pid = os.getpid()
+            return self._executor
+
+    def get_stats(self):
+        """
+        Return the number of pending verifications and the counters, which
+        were collected since the last call, and reset the counters.
+
+        :return: dict
+        """
+        with self._lock:
+            stats = dict(self.counters, pending=self.pending)
+            for name in self.counters:
+                self.counters[name] = 0
+        return stats
+
+    def write_stats(self):
+        """
+        Write the statistics of the pool to the monitoring statistics.
+        """
+        for name, value in self.get_stats().items():
+            write_stats(f"kdf_pool_{name}", value)
+
+    def _schedule_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_stats:
+                return
+            self._next_stats = now + self.stats_interval
+        register_request_finalizer(self.write_stats)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_kdf_pool():
+    """
+    Return the ``KDFPool`` of the current application, if the pool is
+    enabled via ``EDUMFA_KDF_POOL_SIZE``.
+
+    :return: a ``KDFPool`` object or None
+    """
+    size = int(get_app_config_value(POOL_SIZE_CONFIG_NAME, 0))
+    if size <= 0:
+        return None
+    app_store = get_app_local_store()
+    try:
+        return app_store["kdf_pool"]
+    except KeyError:
+        pool = KDFPool(
+            size,
+            int(get_app_config_value(QUEUE_SIZE_CONFIG_NAME, 4 * size)),
+            reject=get_app_config_value(FULL_CONFIG_NAME, "wait") == "reject",
+            timeout=float(get_app_config_value(TIMEOUT_CONFIG_NAME, DEFAULT_TIMEOUT)),
+            stats_interval=int(
+                get_app_config_value(STATS_INTERVAL_CONFIG_NAME, DEFAULT_STATS_INTERVAL)
+            ),
+        )
+        log.info(f"Created a new KDF pool with {size} processes")
+        return app_store.setdefault("kdf_pool", pool)
+
+
+def run_kdf(func, *args):
+    """
+    Run the password verification ``func(*args)`` in the KDF pool, if it is
+    enabled. Otherwise, run it in the current process.
+
+    :return: the result of ``func``
+    """
+    pool = get_kdf_pool()
+    if pool is None:
+        return func(*args)
+    return pool.run(func, *args)
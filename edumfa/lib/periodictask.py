@@ -31,6 +31,7 @@ from dateutil.tz import tzlocal, tzutc
 
 from edumfa.lib.error import ParameterError, ResourceNotFoundError
 from edumfa.lib.framework import get_app_config
+from edumfa.lib.task.challengecleanup import ChallengeCleanupTask
 from edumfa.lib.task.eventcounter import EventCounterTask
 from edumfa.lib.task.simplestats import SimpleStatsTask
 from edumfa.lib.tokenclass import DATE_FORMAT
@@ -40,7 +41,7 @@ from edumfa.models import PeriodicTask
 
 log = logging.getLogger(__name__)
 
-TASK_CLASSES = [EventCounterTask, SimpleStatsTask]
+TASK_CLASSES = [EventCounterTask, SimpleStatsTask, ChallengeCleanupTask]
 #: TASK_MODULES maps task module identifiers to subclasses of BaseTask
 TASK_MODULES = dict((cls.identifier, cls) for cls in TASK_CLASSES)
 
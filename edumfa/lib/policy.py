@@ -96,6 +96,7 @@ import datetime
 import logging
 import re
 import traceback
+from collections import defaultdict
 from operator import itemgetter
 
 from configobj import ConfigObj
@@ -116,6 +117,7 @@ from edumfa.lib.error import (
     ServerError,
     eduMFAError,
 )
+from edumfa.lib.framework import get_request_local_store
 from edumfa.lib.radiusserver import get_radiusservers
 from edumfa.lib.realm import get_realms
 from edumfa.lib.resolver import get_resolver_list
@@ -431,6 +433,96 @@ class CONDITION_CHECK:
     CHECK_AND_RAISE_EXCEPTION_ON_MISSING = None
 
 
+class PolicyIndex:
+    """
+    An index over a list of policies, which is compiled once whenever the
+    shared configuration is reloaded from the database.
+
+    The index maps the policy name, the scope and the literal values of the
+    attributes ``action``, ``realm``, ``resolver`` and ``adminrealm`` to the
+    positions of the policies in the list. Policies, which contain an empty
+    attribute, a wildcard, a regular expression or an exclusion, are kept as
+    wildcard entries of the respective attribute, so that they are always
+    considered.
+
+    ``candidates`` only preselects the policies which might match.
+    The exact matching is still done by ``PolicyClass.list_policies``.
+    """
+
+    INDEXED_KEYS = ["action", "realm", "resolver", "adminrealm"]
+
+    def __init__(self, policies):
+        self.policies = policies
+        self._by_name = defaultdict(set)
+        self._by_scope = defaultdict(set)
+        self._exact = {key: defaultdict(set) for key in self.INDEXED_KEYS}
+        self._wildcard = {key: set() for key in self.INDEXED_KEYS}
+        for position, policy in enumerate(policies):
+            self._by_name[policy.get("name")].add(position)
+            self._by_scope[policy.get("scope")].add(position)
+            for key in self.INDEXED_KEYS:
+                values = list(policy.get(key) or [])
+                if (
+                    not values
+                    or (key == "resolver" and policy.get("check_all_resolvers"))
+                    or not all(self._is_literal(value) for value in values)
+                ):
+                    self._wildcard[key].add(position)
+                else:
+                    for value in values:
+                        self._exact[key][value].add(position)
+
+    @staticmethod
+    def _is_literal(value):
+        """
+        Check if a policy attribute value only matches exactly the same value.
+
+        :param value: a single value of a policy attribute
+        :return: True, if the value is neither a wildcard, an exclusion nor
+            a regular expression
+        """
+        return (
+            isinstance(value, str)
+            and bool(value)
+            and value[0] not in ["!", "-"]
+            and re.escape(value) == value
+        )
+
+    def candidates(self, name=None, scope=None, **searchvalues):
+        """
+        Return the policies, which might match the given values, in the
+        original order. Search values, which are ``None``, are not used
+        to reduce the policies.
+
+        :param name: the name of the policy
+        :param scope: the scope of the policy
+        :param searchvalues: search values for the indexed attributes
+        :return: list of policies
+        """
+        positions = None
+        if name is not None:
+            positions = set(self._by_name.get(name, ()))
+        if scope is not None:
+            scope_positions = self._by_scope.get(scope, set())
+            positions = (
+                set(scope_positions)
+                if positions is None
+                else positions & scope_positions
+            )
+        for key, searchvalue in searchvalues.items():
+            if searchvalue is None:
+                continue
+            found = set(self._wildcard[key])
+            for value in (
+                searchvalue if isinstance(searchvalue, list) else [searchvalue]
+            ):
+                found |= self._exact[key].get(value, set())
+            positions = found if positions is None else positions & found
+        if positions is None:
+            return self.policies
+        return [self.policies[position] for position in sorted(positions)]
+
+
 class PolicyClass:
     """
     A policy object can be used to query the current set of policies.
@@ -451,6 +543,16 @@ class PolicyClass:
         """
         return get_config_object().policies
 
+    @property
+    def policy_index(self):
+        """
+        Shorthand to retrieve the ``PolicyIndex`` of the request-local config object
+        """
+        config_object = get_config_object()
+        if config_object.policy_index is None:
+            config_object.policy_index = PolicyIndex(config_object.policies)
+        return config_object.policy_index
+
     @classmethod
     def _search_value(cls, policy_attributes, searchvalue):
         """
@@ -537,7 +639,15 @@ class PolicyClass:
         :return: list of policies
         :rtype: list of dicts
         """
-        reduced_policies = self.policies
+        # Only consider the policies which might match according to the index
+        reduced_policies = self.policy_index.candidates(
+            name=name,
+            scope=scope,
+            action=action,
+            realm=realm,
+            resolver=resolver,
+            adminrealm=adminrealm if scope == SCOPE.ADMIN else None,
+        )
 
         # Do exact matches for "name", "active" and "scope", as these fields
         # can only contain one entry
@@ -671,6 +781,43 @@ class PolicyClass:
 
         return reduced_policies
 
+    def _list_policies_memoized(self, **kwargs):
+        """
+        Return the result of ``list_policies`` for the given arguments.
+
+        During a single request the same policies are matched several times
+        by the different decorators. Hence, the results are memoized in the
+        request-local store as long as the request-local config object does
+        not change. Time and conditions are not part of the memoized result,
+        they are still checked by ``match_policies`` on every call.
+
+        :param kwargs: the arguments of ``list_policies``
+        :return: list of policies
+        """
+        try:
+            key = tuple(sorted(kwargs.items()))
+            hash(key)
+        except TypeError:
+            return self.list_policies(**kwargs)
+        config_object = get_config_object()
+        store = get_request_local_store()
+        memo = store.get("policy_match_memo")
+        if memo is None or memo["config_object"] is not config_object:
+            memo = {
+                "config_object": config_object,
+                "results": {},
+                "hits": 0,
+                "misses": 0,
+            }
+            store["policy_match_memo"] = memo
+        if key in memo["results"]:
+            memo["hits"] += 1
+        else:
+            memo["misses"] += 1
+            memo["results"][key] = self.list_policies(**kwargs)
+        log.debug(f"Policy match memo: {memo['hits']} hits, {memo['misses']} misses")
+        return memo["results"][key]
+
     @log_with(log)
     def match_policies(
         self,
@@ -755,7 +902,7 @@ class PolicyClass:
             realm = user_object.realm
             resolver = user_object.resolver
 
-        reduced_policies = self.list_policies(
+        reduced_policies = self._list_policies_memoized(
             name=name,
             scope=scope,
             realm=realm,
@@ -20,6 +20,7 @@
 # License along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import logging
+from collections import namedtuple
 
 import pyrad.packet
 from pyrad.client import Client, Timeout
@@ -34,6 +35,7 @@ from edumfa.lib.crypto import (
 )
 from edumfa.lib.error import ConfigAdminError, eduMFAError
 from edumfa.lib.log import log_with
+from edumfa.lib.upstream import upstream_request
 from edumfa.lib.utils import fetch_one_resource, to_bytes
 from edumfa.lib.utils.export import register_export, register_import
 from edumfa.models import RADIUSServer as RADIUSServerDB
@@ -73,7 +75,8 @@ class RADIUSServer:
         """
         Perform a RADIUS request to a RADIUS server.
         The RADIUS configuration contains the IP address, the port and the
-        secret of the RADIUS server.
+        secret of the RADIUS server. The server may also contain a list of
+        several RADIUS servers, see ``parse_radius_servers``.
 
         * config.server
         * config.port
@@ -90,8 +93,6 @@ class RADIUSServer:
         :type password: str
         :return: True or False. If any error occurs, an exception is raised.
         """
-        success = False
-
         nas_identifier = get_from_config("radius.nas_identifier", "eduMFA")
         r_dict = config.dictionary or get_from_config(
             "radius.dictfile", "/etc/edumfa/dictionary"
@@ -102,61 +103,164 @@ class RADIUSServer:
             f"with server: {config.server!r}, port: {config.port!r}, secret: {config.secret!r}"
         )
 
-        srv = Client(
-            server=config.server,
-            authport=config.port,
-            secret=to_bytes(decryptPassword(config.secret)),
-            dict=Dictionary(r_dict),
-        )
+        try:
+            response = send_radius_request(
+                parse_radius_servers(config.server, config.port or 1812),
+                to_bytes(decryptPassword(config.secret)),
+                Dictionary(r_dict),
+                nas_identifier,
+                user,
+                password,
+                timeout=config.timeout,
+                retries=config.retries,
+                enforce_ma=config.enforce_ma,
+            )
+        except Timeout:
+            log.warning(f"Receiving timeout from remote radius server {config.server}")
+            return False
+
+        if not response.authenticated:
+            return False
+        if response.packet.code == pyrad.packet.AccessAccept:
+            log.info(f"Radiusserver {response.server} granted access to user {user}.")
+            return True
+        log.warning(f"Radiusserver {response.server} rejected access to user {user}.")
+        return False
+
+
+RADIUSResponse = namedtuple(
+    "RADIUSResponse", ["server", "packet", "authenticated", "port"]
+)
+
+
+def parse_radius_servers(servers, port=1812):
+    """
+    Parse a list of RADIUS servers, which are separated by commas or
+    whitespace. Every server may contain a port like ``radius1:1813`` or
+    ``[2001:db8::1]:1813``.
+
+    :param servers: the servers, e.g. "radius1.example.com, radius2.example.com"
+    :param port: the port of the servers without a port
+    :return: list of tuples of the server and the port
+    """
+    result = []
+    for server in servers.replace(",", " ").split():
+        r_port = port
+        if server.startswith("["):
+            server, _, r_port_str = server[1:].partition("]")
+            if r_port_str.startswith(":"):
+                r_port = int(r_port_str[1:])
+        elif server.count(":") == 1:
+            server, r_port_str = server.split(":")
+            r_port = int(r_port_str)
+        result.append((server, int(r_port)))
+    return result
+
+
+def format_radius_server(server, port):
+    """
+    Return the server and the port in the format, which is understood by
+    ``parse_radius_servers``.
+
+    :param server: the server
+    :param port: the port
+    :return: a string like ``radius1:1812`` or ``[2001:db8::1]:1812``
+    """
+    if ":" in server:
+        return f"[{server}]:{port}"
+    return f"{server}:{port}"
 
+
+def send_radius_request(
+    servers,
+    secret,
+    dictionary,
+    nas_identifier,
+    user,
+    password,
+    timeout=None,
+    retries=None,
+    enforce_ma=False,
+    state=None,
+    challenge_server=None,
+):
+    """
+    Send an Access-Request to the given RADIUS servers. If there are several
+    servers, the request is sent to them according to the upstream fan-out
+    mode (see ``edumfa.lib.upstream``) and the first Access-Accept or
+    Access-Challenge is returned.
+
+    The answer to an Access-Challenge is only sent to ``challenge_server``,
+    since the other servers do not know its State.
+
+    :param servers: list of tuples of the server and the port
+    :param secret: the RADIUS secret
+    :type secret: bytes
+    :param dictionary: the RADIUS dictionary
+    :type dictionary: pyrad.dictionary.Dictionary
+    :param nas_identifier: the NAS identifier
+    :param user: the RADIUS username
+    :param password: the RADIUS password
+    :param timeout: the timeout of one request in seconds
+    :param retries: the number of retries per server
+    :param enforce_ma: Enforce usage and check of Message-Authenticator
+    :param state: the State of a previous Access-Challenge
+    :param challenge_server: the tuple of the server and the port, which sent
+        the previous Access-Challenge
+    :return: a ``RADIUSResponse``. ``authenticated`` is False, if the
+        Message-Authenticator is enforced, but missing or broken.
+    :raises Timeout: if no server answered
+    """
+    if state and challenge_server:
+        servers = [tuple(challenge_server)]
+    upstreams = {f"radius:{server}:{port}": (server, port) for server, port in servers}
+
+    def send(upstream):
+        server, port = upstreams[upstream]
+        srv = Client(server=server, authport=port, secret=secret, dict=dictionary)
         # Set retries and timeout of the client
-        if config.timeout:
-            srv.timeout = config.timeout
-        if config.retries:
-            srv.retries = config.retries
+        if timeout:
+            srv.timeout = timeout
+        if retries:
+            srv.retries = retries
 
         req = srv.CreateAuthPacket(
             code=pyrad.packet.AccessRequest,
             User_Name=user.encode("utf-8"),
             NAS_Identifier=nas_identifier.encode("ascii"),
         )
-        if config.enforce_ma:
+        if enforce_ma:
             req.add_message_authenticator()
-
         # PwCrypt encodes unicode strings to UTF-8
         req["User-Password"] = req.PwCrypt(password)
-        try:
-            response = srv.SendPacket(req)
-            if config.enforce_ma:
-                # verify_message_authenticator() raises a generic exception
-                # if M-A attribute is missing .. check for it before!
-                if "Message-Authenticator" in response:
-                    success = response.verify_message_authenticator(
-                        original_authenticator=req.authenticator
-                    )
-                    if not success:
-                        log.info(
-                            f"Radiusserver {config.server} sent broken "
-                            "Message-Authenticator"
-                        )
-                        return False
-                else:
-                    log.info(
-                        f"Radiusserver {config.server} sent no Message-Authenticator"
-                    )
-                    return False
-
-            if response.code == pyrad.packet.AccessAccept:
-                log.info(f"Radiusserver {config.server} granted access to user {user}.")
-                success = True
-            else:
-                log.warning(
-                    f"Radiusserver {config.server} rejected access to user {user}."
-                )
-        except Timeout:
-            log.warning(f"Receiving timeout from remote radius server {config.server}")
-
-        return success
+        if state:
+            req["State"] = state
+            log.info(f"Sending saved challenge to radius server: {state!r} ")
+
+        response = srv.SendPacket(req)
+        authenticated = True
+        if enforce_ma:
+            # verify_message_authenticator() raises a generic exception
+            # if the M-A attribute is missing, so check for it first
+            if "Message-Authenticator" not in response:
+                log.info(f"Radiusserver {server} sent no Message-Authenticator")
+                authenticated = False
+            elif not response.verify_message_authenticator(
+                original_authenticator=req.authenticator
+            ):
+                log.info(f"Radiusserver {server} sent broken Message-Authenticator")
+                authenticated = False
+        return RADIUSResponse(server, response, authenticated, port)
+
+    return upstream_request(
+        list(upstreams),
+        send,
+        lambda r: (
+            r.authenticated
+            and r.packet.code
+            in (pyrad.packet.AccessAccept, pyrad.packet.AccessChallenge)
+        ),
+    )
 
 
 @log_with(log)
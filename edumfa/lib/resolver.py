@@ -317,8 +317,9 @@ def get_resolver_type(resolvername):
 # @cache.memoize(10)
 def get_resolver_object(resolvername):
     """
-    Return the cached resolver object for the given resolver name (stored in the request context).
-    If no resolver object is cached, create it and add it to the cache.
+    Return the cached resolver object for the given resolver name (stored in the app-local store).
+    If no resolver object is cached or the configuration of the resolver has
+    changed since the object was created, create it and add it to the cache.
 
     :param resolvername: the resolver string as from the token including
                          the config as last part
@@ -333,16 +334,17 @@ def get_resolver_object(resolvername):
         return None
     else:
         store = get_app_local_store()
-        if "resolver_objects" not in store:
-            store["resolver_objects"] = {}
-        resolver_objects = store["resolver_objects"]
-        if resolvername not in resolver_objects:
+        resolver_objects = store.setdefault("resolver_objects", {})
+        version = get_config_object().resolver_versions.get(resolvername)
+        entry = resolver_objects.get(resolvername)
+        if entry is None or entry[0] != version:
             # create the resolver instance and load the config
-            r_obj = resolver_objects[resolvername] = r_obj_class()
+            r_obj = r_obj_class()
             if r_obj is not None:
                 resolver_config = get_resolver_config(resolvername)
                 r_obj.loadConfig(resolver_config)
-        return resolver_objects[resolvername]
+            entry = resolver_objects[resolvername] = (version, r_obj)
+        return entry[1]
 
 
 @log_with(log)
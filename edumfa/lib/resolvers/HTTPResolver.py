@@ -28,9 +28,10 @@ import json
 import logging
 from urllib.parse import urlencode
 
-import requests
 from pydash import get
 
+from edumfa.lib.httpsession import http_request
+
 from .UserIdResolver import UserIdResolver
 
 __name__ = "HTTP_RESOLVER"
@@ -200,12 +201,16 @@ class HTTPResolver(UserIdResolver):
         errorResponse = json.loads(param.get("errorResponse", "{}"))
 
         if method == "post":
-            httpResponse = requests.post(
-                endpoint, json=requestMappingJSON, headers=headers, timeout=60
+            httpResponse = http_request(
+                "POST", endpoint, json=requestMappingJSON, headers=headers, timeout=60
             )
         else:
-            httpResponse = requests.get(
-                endpoint, urlencode(requestMappingJSON), headers=headers, timeout=60
+            httpResponse = http_request(
+                "GET",
+                endpoint,
+                params=urlencode(requestMappingJSON),
+                headers=headers,
+                timeout=60,
             )
 
         # Raises HTTPError, if one occurred.
@@ -37,8 +37,10 @@ import logging
 import os.path
 import ssl
 import threading
+import time
 import traceback
 import uuid
+from collections import OrderedDict
 from operator import itemgetter
 
 import ldap3
@@ -52,6 +54,8 @@ from passlib.hash import ldap_salted_sha1
 from edumfa.lib import _
 from edumfa.lib.error import eduMFAError
 from edumfa.lib.framework import get_app_config_value, get_app_local_store
+from edumfa.lib.lifecycle import register_request_finalizer
+from edumfa.lib.monitoringstats import write_stats
 from edumfa.lib.utils import convert_column_to_unicode, is_true, to_bytes, to_unicode
 
 from .UserIdResolver import UserIdResolver
@@ -67,6 +71,23 @@ except ImportError:
     have_gssapi = False
 
 CACHE = {}
+# The functions of the resolver, which are cached
+CACHED_FUNCTIONS = ["getUserId", "getUserInfo", "_getDN"]
+# The prefix of the cache sections for empty results
+NEGATIVE_PREFIX = "negative:"
+CACHE_SIZE_CONFIG_NAME = "EDUMFA_LDAP_CACHE_SIZE"
+DEFAULT_CACHE_SIZE = 10000
+CACHE_NEGATIVE_SIZE_CONFIG_NAME = "EDUMFA_LDAP_CACHE_NEGATIVE_SIZE"
+DEFAULT_CACHE_NEGATIVE_SIZE = 1000
+CACHE_STATS_CONFIG_NAME = "EDUMFA_LDAP_CACHE_STATS"
+CACHE_STATS_INTERVAL_CONFIG_NAME = "EDUMFA_LDAP_CACHE_STATS_INTERVAL"
+DEFAULT_CACHE_STATS_INTERVAL = 60
+# The number of users, which are looked up with a single search
+BATCH_SIZE = 50
+# Hits, misses and evictions of the cache, since they were last written to the monitoring
+CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+CACHE_STATS_SCHEDULE = {"next_write": 0}
+CACHE_STATS_LOCK = threading.Lock()
 
 # The number of rounds the resolver tries to reach a responding server in the
 #  pool
@@ -207,58 +228,172 @@ def ignore_sizelimit_exception(conn, generator):
                 raise
 
 
+class CacheSection(OrderedDict):
+    """
+    A bounded section of the LDAP resolver cache for one function of one
+    resolver. The entries are dictionaries containing the cached ``value`` and
+    the ``timestamp`` at which the value was read from the directory.
+
+    The entries are kept in LRU order. Since all entries of a section share
+    the same timeout, expired entries are removed from the head of the section
+    and entries exceeding the size of the section are evicted in O(1).
+    """
+
+    def __init__(self, size):
+        OrderedDict.__init__(self)
+        self.size = size
+        self.lock = threading.Lock()
+
+    def lookup(self, key, now, tdelta):
+        """
+        Return the cached entry for ``key`` or None, if there is no valid entry.
+        """
+        with self.lock:
+            entry = OrderedDict.get(self, key)
+            if entry is None:
+                return None
+            if now >= entry.get("timestamp") + tdelta:
+                del self[key]
+                _count_cache_stat("evictions")
+                return None
+            self.move_to_end(key)
+            return entry
+
+    def store(self, key, value, now, tdelta):
+        """
+        Add ``value`` to the section and remove expired entries as well as the
+        least recently used entries, if the section exceeds its size.
+        """
+        with self.lock:
+            self.pop(key, None)
+            while self:
+                oldest = next(iter(self.values()))
+                if len(self) < self.size and now < oldest.get("timestamp") + tdelta:
+                    break
+                self.popitem(last=False)
+                _count_cache_stat("evictions")
+            if self.size > 0:
+                self[key] = {"value": value, "timestamp": now}
+
+
+def _count_cache_stat(name):
+    with CACHE_STATS_LOCK:
+        CACHE_STATS[name] += 1
+
+
+def _write_cache_stats():
+    """
+    Write the counters of the LDAP resolver cache, which were collected since
+    the last call, to the monitoring statistics.
+    """
+    with CACHE_STATS_LOCK:
+        stats = dict(CACHE_STATS)
+        for name in CACHE_STATS:
+            CACHE_STATS[name] = 0
+    for name, value in stats.items():
+        write_stats(f"ldap_cache_{name}", value)
+
+
+def _schedule_cache_stats():
+    """
+    Register a finalizer, which writes the cache counters to the monitoring
+    statistics, if ``EDUMFA_LDAP_CACHE_STATS`` is enabled and the last write
+    is at least ``EDUMFA_LDAP_CACHE_STATS_INTERVAL`` seconds ago.
+    """
+    if not is_true(get_app_config_value(CACHE_STATS_CONFIG_NAME, False)):
+        return
+    interval = int(
+        get_app_config_value(
+            CACHE_STATS_INTERVAL_CONFIG_NAME, DEFAULT_CACHE_STATS_INTERVAL
+        )
+    )
+    now = time.monotonic()
+    with CACHE_STATS_LOCK:
+        if now < CACHE_STATS_SCHEDULE["next_write"]:
+            return
+        CACHE_STATS_SCHEDULE["next_write"] = now + interval
+    register_request_finalizer(_write_cache_stats)
+
+
+def _get_cache_sections(resolver_id):
+    """
+    Return the cache of the given resolver. If it does not exist yet, it is
+    created with the sizes defined by ``EDUMFA_LDAP_CACHE_SIZE`` and
+    ``EDUMFA_LDAP_CACHE_NEGATIVE_SIZE``.
+    """
+    try:
+        return CACHE[resolver_id]
+    except KeyError:
+        size = int(get_app_config_value(CACHE_SIZE_CONFIG_NAME, DEFAULT_CACHE_SIZE))
+        negative_size = int(
+            get_app_config_value(
+                CACHE_NEGATIVE_SIZE_CONFIG_NAME, DEFAULT_CACHE_NEGATIVE_SIZE
+            )
+        )
+        sections = {}
+        for func_name in CACHED_FUNCTIONS:
+            sections[func_name] = CacheSection(size)
+            sections[NEGATIVE_PREFIX + func_name] = CacheSection(negative_size)
+        return CACHE.setdefault(resolver_id, sections)
+
+
+def _read_from_cache(resolver, func_name, key):
+    """
+    Read the cached result of the function ``func_name`` of the given
+    LDAP resolver for ``key``.
+
+    :return: tuple of a bool, whether a valid entry was found, and the cached value
+    """
+    r_cache = _get_cache_sections(resolver.getResolverId())
+    now = datetime.datetime.now()
+    tdelta = datetime.timedelta(seconds=resolver.cache_timeout)
+    for section_name in [func_name, NEGATIVE_PREFIX + func_name]:
+        entry = r_cache[section_name].lookup(key, now, tdelta)
+        if entry is not None:
+            log.debug(f"Reading {key!r} from cache for {func_name!r}")
+            _count_cache_stat("hits")
+            _schedule_cache_stats()
+            return True, entry.get("value")
+    _count_cache_stat("misses")
+    _schedule_cache_stats()
+    return False, None
+
+
+def _write_to_cache(resolver, func_name, key, value):
+    """
+    Write the result of the function ``func_name`` of the given LDAP
+    resolver for ``key`` to the cache.
+    """
+    r_cache = _get_cache_sections(resolver.getResolverId())
+    now = datetime.datetime.now()
+    tdelta = datetime.timedelta(seconds=resolver.cache_timeout)
+    section_name = func_name if value else NEGATIVE_PREFIX + func_name
+    r_cache[section_name].store(key, value, now, tdelta)
+
+
 def cache(func):
     """
     cache the user with his loginname, resolver and UID in a local
     dictionary cache.
     This is a per process cache.
+
+    Empty results (like unknown login names) are stored in a separate, smaller
+    section of the cache, so that they can not evict existing users.
     """
 
     @functools.wraps(func)
     def cache_wrapper(self, *args, **kwds):
         # Only run the code, in case we have a configured cache!
         if self.cache_timeout > 0:
-            # If it does not exist, create the node for this instance
-            resolver_id = self.getResolverId()
-            now = datetime.datetime.now()
-            tdelta = datetime.timedelta(seconds=self.cache_timeout)
-            if not resolver_id in CACHE:
-                CACHE[resolver_id] = {"getUserId": {}, "getUserInfo": {}, "_getDN": {}}
-            else:
-                # Clean up the cache in the current resolver and the current function
-                _to_be_deleted = []
-                try:
-                    for user, cached_result in (
-                        CACHE[resolver_id].get(func.__name__).items()
-                    ):
-                        if now > cached_result.get("timestamp") + tdelta:
-                            _to_be_deleted.append(user)
-                except RuntimeError:
-                    # This might happen if thread A evicts an expired
-                    # cache entry while thread B looks for expired cache entries
-                    pass
-                for user in _to_be_deleted:
-                    try:
-                        del CACHE[resolver_id][func.__name__][user]
-                    except KeyError:
-                        pass
-                del _to_be_deleted
-
-            # get the portion of the cache for this very LDAP resolver
-            r_cache = CACHE.get(resolver_id).get(func.__name__)
-            entry = r_cache.get(args[0])
-            if entry and now < entry.get("timestamp") + tdelta:
-                log.debug(f"Reading {args[0]!r} from cache for {func.__name__!r}")
-                return entry.get("value")
+            found, value = _read_from_cache(self, func.__name__, args[0])
+            if found:
+                return value
 
         f_result = func(self, *args, **kwds)
 
         if self.cache_timeout > 0:
             # now we cache the result
-            CACHE[resolver_id][func.__name__][args[0]] = {
-                "value": f_result,
-                "timestamp": now,
-            }
+            _write_to_cache(self, func.__name__, args[0], f_result)
 
         return f_result
 
@@ -661,6 +796,90 @@ class IdResolver(UserIdResolver):
         info = self.getUserInfo(user_id)
         return info.get("username", "")
 
+    def getUsernames(self, user_ids):
+        """
+        Returns the usernames/loginnames for a list of user_ids
+
+        :param user_ids: The user_ids in this resolver
+        :type user_ids: list
+        :return: dictionary with the user_ids as keys and the usernames as values
+        :rtype: dict
+        """
+        infos = self.getUserInfoBatch(user_ids)
+        return {user_id: info.get("username", "") for user_id, info in infos.items()}
+
+    def getUserInfoBatch(self, userIds):
+        """
+        This function returns the user info for a list of userids.
+
+        Instead of searching every user separately, the users are searched in
+        chunks of ``BATCH_SIZE`` users with a single OR-filter, using a paged
+        search. Users, which are found in the cache, are not searched and the
+        results are written to the cache.
+
+        :param userIds: The userids of the objects
+        :type userIds: list
+        :return: A dictionary with the userids as keys and the user info as
+            values. Unknown users get an empty dictionary.
+        :rtype: dict
+        """
+        ret = {}
+        missing = []
+        for userId in userIds:
+            if userId in ret or userId in missing:
+                continue
+            if self.cache_timeout > 0:
+                found, value = _read_from_cache(self, "getUserInfo", userId)
+                if found:
+                    ret[userId] = value
+                    continue
+            if self.uidtype.lower() == "dn":
+                # We can not search for several DNs with a filter
+                ret[userId] = self.getUserInfo(userId)
+            else:
+                missing.append(userId)
+
+        attributes = list(self.userinfo.values())
+        attributes.append(str(self.uidtype))
+        if missing:
+            self._bind()
+        for i in range(0, len(missing), BATCH_SIZE):
+            chunk = missing[i : i + BATCH_SIZE]
+            # The directory may return the userids in a different case
+            requested = {userId.lower(): userId for userId in chunk}
+            uid_filter = "".join(
+                f"({self.uidtype}={to_unicode(self._trim_user_id(userId))})"
+                for userId in chunk
+            )
+            g = self.l.extend.standard.paged_search(
+                search_base=self.basedn,
+                search_filter=f"(&{self.searchfilter}(|{uid_filter}))",
+                search_scope=self.scope,
+                attributes=attributes,
+                paged_size=100,
+                generator=True,
+            )
+            infos = {}
+            for entry in g:
+                if entry.get("type") != "searchResEntry":
+                    continue
+                uid = self._get_uid(entry, self.uidtype)
+                userId = requested.get(convert_column_to_unicode(uid).lower())
+                if userId is None:  # pragma: no cover
+                    log.warning(f"The search returned an unexpected uid {uid!r}.")
+                    continue
+                if userId in infos:  # pragma: no cover
+                    raise Exception(f"Found more than one object for uid {userId!r}")
+                infos[userId] = self._ldap_attributes_to_user_object(
+                    entry.get("attributes")
+                )
+            for userId in chunk:
+                ret[userId] = infos.get(userId, {})
+                if self.cache_timeout > 0:
+                    _write_to_cache(self, "getUserInfo", userId, ret[userId])
+
+        return ret
+
     @cache
     def getUserId(self, LoginName):
         """
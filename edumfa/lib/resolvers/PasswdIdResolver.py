@@ -37,6 +37,7 @@ import logging
 import os
 import re
 import sys
+import threading
 
 from passlib.context import CryptContext
 
@@ -47,6 +48,16 @@ from .UserIdResolver import UserIdResolver
 
 log = logging.getLogger(__name__)
 ENCODING = "utf-8"
+# very basic e-mail regex
+EMAIL_REGEX = re.compile(r".+@.+\..+")
+PASSLIB_CONTEXT = CryptContext(
+    schemes=["sha512_crypt", "sha256_crypt", "md5_crypt", "des_crypt"]
+)
+
+# The parsed passwd files, which are shared by all resolver instances.
+# The key is the absolute path of the file.
+PASSWD_FILES = {}
+PASSWD_FILES_LOCK = threading.Lock()
 
 
 def tokenise(r):
@@ -61,6 +72,80 @@ def tokenise(r):
     return _
 
 
+class PasswdFile:
+    """
+    The parsed content of a passwd file.
+
+    Each user is stored as one tuple of the fields of its line, indexed by
+    the user ID. A second dict maps the login names to the user IDs. The
+    description field is only split into name, phones and email, when the
+    user info is requested.
+    """
+
+    __slots__ = ("stat_key", "users", "names")
+
+    def __init__(self, filename=None, stat_key=None):
+        self.stat_key = stat_key
+        self.users = {}
+        self.names = {}
+        if filename is None:
+            # An empty file
+            return
+        ID = IdResolver.sF["userid"]
+        NAME = IdResolver.sF["username"]
+        with open(filename, encoding=ENCODING) as fileHandle:
+            for line in fileHandle:
+                line = line.strip()
+                if not line:
+                    # continue on an empty line
+                    continue
+                fields = tuple(line.split(":", 7))
+                self.names[fields[NAME]] = fields[ID]
+                self.users[fields[ID]] = fields
+
+
+def get_passwd_file(filename):
+    """
+    Return the parsed passwd file. The file is only parsed again, if its
+    inode, modification time or size have changed since it was last parsed.
+
+    :param filename: the name of the passwd file
+    :return: a ``PasswdFile`` object
+    """
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    stat_key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    passwd_file = PASSWD_FILES.get(filename)
+    if passwd_file is None or passwd_file.stat_key != stat_key:
+        with PASSWD_FILES_LOCK:
+            passwd_file = PASSWD_FILES.get(filename)
+            if passwd_file is None or passwd_file.stat_key != stat_key:
+                log.info(f"loading users from file {filename}")
+                passwd_file = PASSWD_FILES[filename] = PasswdFile(filename, stat_key)
+    return passwd_file
+
+
+def parse_description(description):
+    """
+    Split the description (GECOS) field into the name, phone numbers and email.
+
+    :return: tuple of givenname, surname, office phone, home phone and email
+    """
+    descriptions = description.split(",")
+    names = descriptions[0].split(" ", 1)
+    givenname = names[0]
+    surname = names[1] if len(names) >= 2 else ""
+    office_phone = home_phone = email = ""
+    if len(descriptions) >= 4:
+        office_phone = descriptions[2]
+        home_phone = descriptions[3]
+    for field in descriptions[4:]:
+        email_match = EMAIL_REGEX.search(field)
+        if email_match:
+            email = email_match.group(0)
+    return givenname, surname, office_phone, home_phone, email
+
+
 class IdResolver(UserIdResolver):
     fields = {
         "username": 1,
@@ -109,71 +194,37 @@ class IdResolver(UserIdResolver):
         self.fileName = ""
 
         self.name = "P"
-        self.nameDict = {}
-        self.descDict = {}
-        self.reversDict = {}
-        self.passDict = {}
-        self.officePhoneDict = {}
-        self.homePhoneDict = {}
-        self.surnameDict = {}
-        self.givennameDict = {}
-        self.emailDict = {}
+        self.passwdFile = PasswdFile()
 
     def loadFile(self):
         """
         Loads the data of the file initially.
         if the self.fileName is empty, it loads /etc/passwd.
         Empty lines are ignored.
+
+        The parsed file is shared with all other resolver instances, which
+        use the same file.
         """
 
         if self.fileName == "":
             self.fileName = "/etc/passwd"
 
-        log.info(f"loading users from file {self.fileName} from within {os.getcwd()}")
-        with open(self.fileName, encoding=ENCODING) as fileHandle:
-            ID = self.sF["userid"]
-            NAME = self.sF["username"]
-            PASS = self.sF["cryptpass"]
-            DESCRIPTION = self.sF["description"]
+        self.passwdFile = get_passwd_file(self.fileName)
 
-            for line in fileHandle:
-                line = line.strip()
-                if not line:
-                    # continue on an empty line
-                    continue
-
-                fields = line.split(":", 7)
-                self.nameDict[fields[NAME]] = fields[ID]
-
-                # for speed reason - build a revers lookup
-                self.reversDict[fields[ID]] = fields[NAME]
-
-                # for full info store the line
-                self.descDict[fields[ID]] = fields
-
-                # store the encrypted password
-                self.passDict[fields[ID]] = fields[PASS]
-
-                # store surname, givenname and phones
-                descriptions = fields[DESCRIPTION].split(",")
-                name = descriptions[0]
-                names = name.split(" ", 1)
-                self.givennameDict[fields[ID]] = names[0]
-                self.surnameDict[fields[ID]] = ""
-                self.officePhoneDict[fields[ID]] = ""
-                self.homePhoneDict[fields[ID]] = ""
-                self.emailDict[fields[ID]] = ""
-                if len(names) >= 2:
-                    self.surnameDict[fields[ID]] = names[1]
-                if len(descriptions) >= 4:
-                    self.officePhoneDict[fields[ID]] = descriptions[2]
-                    self.homePhoneDict[fields[ID]] = descriptions[3]
-                if len(descriptions) >= 5:
-                    for field in descriptions[4:]:
-                        # very basic e-mail regex
-                        email_match = re.search(r".+@.+\..+", field)
-                        if email_match:
-                            self.emailDict[fields[ID]] = email_match.group(0)
+    def _get_passwd_file(self):
+        """
+        Return the parsed passwd file, after it was parsed again, if it
+        has changed on disk. If the file can not be read anymore, the last
+        parsed content is returned.
+        """
+        if self.passwdFile.stat_key is None:
+            # The file was not loaded yet
+            return self.passwdFile
+        try:
+            self.passwdFile = get_passwd_file(self.fileName)
+        except OSError as exx:
+            log.warning(f"Could not read the file {self.fileName}: {exx}")
+        return self.passwdFile
 
     def checkPass(self, uid, password):
         """
@@ -195,18 +246,15 @@ class IdResolver(UserIdResolver):
         :rtype: bool
         """
         log.info(f"checking password for user uid {uid}")
-        cryptedpasswd = self.passDict[uid]
+        cryptedpasswd = self._get_passwd_file().users[uid][self.sF["cryptpass"]]
         log.debug(f"We found the encrypted pass {cryptedpasswd} for uid {uid}")
         if cryptedpasswd:
             if cryptedpasswd in ["x", "*"]:
                 err = "Sorry, currently no support for shadow passwords"
                 log.error(f"{err}")
                 raise NotImplementedError(err)
-            passlib_context = CryptContext(
-                schemes=["sha512_crypt", "sha256_crypt", "md5_crypt", "des_crypt"]
-            )
             try:
-                if verify_with_crypt_context(passlib_context, password, cryptedpasswd):
+                if verify_with_crypt_context(PASSLIB_CONTEXT, password, cryptedpasswd):
                     log.info(f"successfully authenticated user uid {uid}")
                     return True
             except ValueError:
@@ -228,22 +276,29 @@ class IdResolver(UserIdResolver):
         :param no_passwd: return no password
         :return: dict of user info
         """
-        ret = {}
+        fields = self._get_passwd_file().users.get(userId)
+        return self._get_info(fields, no_passwd)
 
-        if userId in self.reversDict:
-            fields = self.descDict.get(userId)
+    def _get_info(self, fields, no_passwd=False):
+        """
+        Convert the fields of a line of the passwd file to the user info.
+        """
+        ret = {}
 
+        if fields:
             for key in self.sF:
                 if no_passwd and key == "cryptpass":
                     continue
                 index = self.sF[key]
                 ret[key] = fields[index]
 
-            ret["givenname"] = self.givennameDict.get(userId)
-            ret["surname"] = self.surnameDict.get(userId)
-            ret["phone"] = self.homePhoneDict.get(userId)
-            ret["mobile"] = self.officePhoneDict.get(userId)
-            ret["email"] = self.emailDict.get(userId)
+            (
+                ret["givenname"],
+                ret["surname"],
+                ret["mobile"],
+                ret["phone"],
+                ret["email"],
+            ) = parse_description(fields[self.sF["description"]])
 
         return ret
 
@@ -255,7 +310,7 @@ class IdResolver(UserIdResolver):
         :param userid: the userid of the user in this resolver
         :return: username/loginname of the userid
         """
-        fields = self.descDict.get(userId)
+        fields = self._get_passwd_file().users.get(userId)
         if not fields:
             return ""
         else:
@@ -271,9 +326,10 @@ class IdResolver(UserIdResolver):
         :rtype: str
         """
         # We do not encode the LoginName anymore, as we are
-        # storing unicode in nameDict now.
-        if LoginName in self.nameDict:
-            return convert_column_to_unicode(self.nameDict[LoginName])
+        # storing unicode in the passwd file now.
+        names = self._get_passwd_file().names
+        if LoginName in names:
+            return convert_column_to_unicode(names[LoginName])
         else:
             return ""
 
@@ -305,8 +361,7 @@ class IdResolver(UserIdResolver):
         ret = []
 
         #  first check if the searches are in the searchDict
-        for l in self.descDict:
-            line = self.descDict[l]
+        for line in self._get_passwd_file().users.values():
             ok = True
 
             for search in searchDict:
@@ -331,8 +386,7 @@ class IdResolver(UserIdResolver):
                     break
 
             if ok is True:
-                uid = line[self.sF["userid"]]
-                info = self.getUserInfo(uid, no_passwd=True)
+                info = self._get_info(line, no_passwd=True)
                 ret.append(info)
 
         return ret
@@ -35,9 +35,9 @@ import logging
 import traceback
 from urllib.parse import urlencode
 
-import requests
 import yaml
 
+from edumfa.lib.httpsession import http_request
 from edumfa.lib.utils import convert_column_to_unicode, to_bytes, to_unicode
 
 from .UserIdResolver import UserIdResolver
@@ -249,7 +249,7 @@ class IdResolver(UserIdResolver):
             "content-type": "application/json",
         }
         url = f"{resource_server}/Users?{urlencode(params)}"
-        resp = requests.get(url, headers=headers, timeout=60)
+        resp = http_request("GET", url, headers=headers, timeout=60)
         if resp.status_code != 200:
             info = f"Could not get user list: {resp.status_code}"
             log.error(info)
@@ -276,7 +276,7 @@ class IdResolver(UserIdResolver):
             "content-type": "application/json",
         }
         url = f"{resource_server}/Users/{userid}"
-        resp = requests.get(url, headers=headers, timeout=60)
+        resp = http_request("GET", url, headers=headers, timeout=60)
 
         if resp.status_code != 200:
             info = f"Could not get user: {resp.status_code}"
@@ -291,7 +291,9 @@ class IdResolver(UserIdResolver):
         auth = to_unicode(base64.b64encode(to_bytes(client + ":" + secret)))
 
         url = f"{server}/oauth/token?grant_type=client_credentials"
-        resp = requests.get(url, headers={"Authorization": "Basic " + auth}, timeout=60)
+        resp = http_request(
+            "GET", url, headers={"Authorization": "Basic " + auth}, timeout=60
+        )
 
         if resp.status_code != 200:
             info = f"Could not get access token: {resp.status_code}"
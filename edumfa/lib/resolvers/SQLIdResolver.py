@@ -57,6 +57,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import scoped_session, sessionmaker
 
+from edumfa.lib.kdfpool import run_kdf
 from edumfa.lib.lifecycle import register_finalizer
 from edumfa.lib.pooling import get_engine
 from edumfa.lib.resolvers.UserIdResolver import UserIdResolver
@@ -148,6 +149,12 @@ pw_ctx = CryptContext(
     ]
 )
 
+
+def _verify_password(password, database_pw):
+    # A module-level function, so that it can be run in the KDF pool
+    return verify_with_crypt_context(pw_ctx, password, database_pw)
+
+
 # List of supported password hash types for hash generation (name to passlib handler id)
 hash_type_dict = {
     "PHPASS": "phpass",
@@ -162,6 +169,9 @@ hash_type_dict = {
 }
 
 log = logging.getLogger(__name__)
+# The number of users, which are looked up with a single query, and the
+# number of rows, which are fetched at once from the server-side cursor
+BATCH_SIZE = 500
 
 
 class IdResolver(UserIdResolver):
@@ -273,7 +283,7 @@ class IdResolver(UserIdResolver):
         )
 
         try:
-            res = verify_with_crypt_context(pw_ctx, password, database_pw)
+            res = run_kdf(_verify_password, password, database_pw)
         except ValueError as _e:
             # if the hash could not be identified / verified, just return False
             pass
@@ -317,6 +327,66 @@ class IdResolver(UserIdResolver):
         # otherwise we cast the column to string (in case of postgres UUIDs)
         return cast(column, String).like(userId)
 
+    def _get_userids_filter(self, userIds):
+        column = self.TABLE.columns[self.map.get("userid")]
+        if isinstance(column.type, String):
+            return column.in_([str(userId) for userId in userIds])
+        elif isinstance(column.type, Integer):
+            # since our user IDs are usually strings we need to cast
+            return column.in_([int(userId) for userId in userIds if userId.isdigit()])
+
+        # otherwise we cast the column to string (in case of postgres UUIDs)
+        return cast(column, String).in_(userIds)
+
+    def getUserInfoBatch(self, userIds):
+        """
+        This function returns the user info for a list of userids.
+        The users are looked up in chunks of ``BATCH_SIZE`` users with a
+        single query per chunk.
+
+        :param userIds: The userids of the users
+        :type userIds: list
+        :return: dictionary with the userids as keys and the user info as values.
+            Users, which do not exist, are missing in the dictionary.
+        :rtype: dict
+        """
+        userinfos = {}
+        userIds = list(dict.fromkeys(str(userId) for userId in userIds))
+        for i in range(0, len(userIds), BATCH_SIZE):
+            chunk = userIds[i : i + BATCH_SIZE]
+            # The database may return the userids in a different case
+            requested = {userId.lower(): userId for userId in chunk}
+            try:
+                conditions = [self._get_userids_filter(chunk)]
+                conditions = self._append_where_filter(
+                    conditions, self.TABLE, self.where
+                )
+                filter_condition = and_(True, *conditions)
+                result = self.session.execute(
+                    select(self.TABLE).filter(filter_condition)
+                )
+                for r in result.mappings():
+                    user = self._get_user_from_mapped_object(r)
+                    userId = requested.get(user.get("userid", "").lower())
+                    if userId is not None:
+                        userinfos[userId] = user
+            except Exception as exx:  # pragma: no cover
+                log.error(f"Could not get the user information: {exx!r}")
+        return userinfos
+
+    def getUsernames(self, userids):
+        """
+        Returns the usernames/loginnames for a list of userids.
+        The users are looked up with as few queries as possible.
+
+        :param userids: The userids in this resolver
+        :type userids: list
+        :return: dictionary with the userids as keys and the usernames as values
+        :rtype: dict
+        """
+        infos = self.getUserInfoBatch(userids)
+        return {userid: infos.get(userid, {}).get("username", "") for userid in userids}
+
     def getUsername(self, userId):
         """
         Returns the username/loginname for a given userid
@@ -396,11 +466,14 @@ class IdResolver(UserIdResolver):
 
     def getUserList(self, searchDict=None):
         """
+        The rows are read from a server-side cursor in chunks of
+        ``BATCH_SIZE`` rows, so that only the resulting user dictionaries
+        are kept in memory.
+
         :param searchDict: A dictionary with search parameters
         :type searchDict: dict
         :return: list of users, where each user is a dictionary
         """
-        users = []
         conditions = []
         if searchDict is None:
             searchDict = {}
@@ -413,15 +486,18 @@ class IdResolver(UserIdResolver):
         conditions = self._append_where_filter(conditions, self.TABLE, self.where)
         filter_condition = and_(True, *conditions)
 
+        statement = select(self.TABLE).filter(filter_condition).limit(int(self.limit))
+        users = []
         result = self.session.execute(
-            select(self.TABLE).filter(filter_condition).limit(self.limit)
+            statement, execution_options={"yield_per": BATCH_SIZE}
         )
-
-        for r in result.mappings():
-            user = self._get_user_from_mapped_object(r)
-            if "userid" in user:
-                users.append(user)
-
+        try:
+            for r in result.mappings():
+                user = self._get_user_from_mapped_object(r)
+                if "userid" in user:
+                    users.append(user)
+        finally:
+            result.close()
         return users
 
     def getResolverId(self):
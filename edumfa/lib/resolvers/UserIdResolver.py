@@ -136,6 +136,19 @@ class UserIdResolver:
         """
         return "dummy_user_name"
 
+    def getUsernames(self, userids):
+        """
+        Returns the usernames/loginnames for a list of userids.
+        Resolvers, which can look up many users with a single request,
+        should overwrite this method.
+
+        :param userids: The userids in this resolver
+        :type userids: list
+        :return: dictionary with the userids as keys and the usernames as values
+        :rtype: dict
+        """
+        return {userid: self.getUsername(userid) for userid in userids}
+
     def getUserInfo(self, userid):
         """
         This function returns all user information for a given user object
@@ -32,9 +32,8 @@ The code is tested in tests/test_lib_smsprovider
 import logging
 from urllib.parse import urlparse
 
-import requests
-
 from edumfa.lib import _
+from edumfa.lib.httpsession import http_request
 from edumfa.lib.smsprovider.SMSProvider import ISMSProvider, SMSError
 
 log = logging.getLogger(__name__)
@@ -115,12 +114,10 @@ class HttpSMSProvider(ISMSProvider):
             proxies = {protocol: proxy}
 
         # url, parameter, username, password, method
-        requester = requests.get
         params = parameter
         data = None
         json_param = None
         if method == "POST":
-            requester = requests.post
             params = None
             if json_data:
                 json_param = parameter
@@ -135,7 +132,8 @@ class HttpSMSProvider(ISMSProvider):
             f"to url {url}."
         )
         # Todo: drop basic auth if Authorization-Header is given?
-        r = requester(
+        r = http_request(
+            "POST" if method == "POST" else "GET",
             url,
             params=params,
             headers=headers,
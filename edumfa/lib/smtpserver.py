@@ -21,16 +21,22 @@
 #
 import logging
 import smtplib
+import time
+import traceback
 from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
+from threading import Lock
 from time import gmtime, strftime
 from urllib.parse import urlparse
 
+from flask import has_app_context
+
 from edumfa.lib.crypto import (
     FAILED_TO_DECRYPT_PASSWORD,
     decryptPassword,
     encryptPassword,
 )
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
 from edumfa.lib.log import log_with
 from edumfa.lib.queue import has_job_queue, job, wrap_job
 from edumfa.lib.utils import fetch_one_resource, to_unicode
@@ -43,6 +49,9 @@ the Database.
 
 It depends on the SMTPServer in the database model models.py. This module can
 be tested standalone without any webservices.
+
+If ``EDUMFA_SMTP_POOL_SIZE`` is set, the connections to the SMTP servers are
+kept open in a pool and are reused for the next emails.
 This module is tested in tests/test_lib_smtpserver.py
 """
 
@@ -50,70 +59,29 @@ log = logging.getLogger(__name__)
 TIMEOUT = 10
 
 SEND_EMAIL_JOB_NAME = "smtpserver.send_email"
+SEND_EMAILS_JOB_NAME = "smtpserver.send_batch"
 
+POOL_SIZE_CONFIG_NAME = "EDUMFA_SMTP_POOL_SIZE"
+POOL_IDLE_TIME_CONFIG_NAME = "EDUMFA_SMTP_POOL_IDLE_TIME"
+POOL_MAX_MESSAGES_CONFIG_NAME = "EDUMFA_SMTP_POOL_MAX_MESSAGES"
+DEFAULT_POOL_IDLE_TIME = 30
+DEFAULT_POOL_MAX_MESSAGES = 100
 
-class SMTPServer:
+
+class SMTPConnection:
     """
-    SMTP Object that holds a SMTP Database Object but can also send emails.
+    An open connection to an SMTP server, which can be used to send several
+    emails.
     """
 
-    def __init__(self, db_smtpserver_object):
-        """
-        Creates a new SMTPServer instance from a DB Server Object
-
-        :param db_smtpserver_object: A DB STMTPserver object
-        :return: A SMTP Server Object
+    def __init__(self, config):
         """
-        self.config = db_smtpserver_object
-
-    def send_email(
-        self, recipient, subject, body, sender=None, reply_to=None, mimetype="plain"
-    ):
-        return send_or_enqueue_email(
-            self.config.get(), recipient, subject, body, sender, reply_to, mimetype
-        )
-
-    @staticmethod
-    @job(SEND_EMAIL_JOB_NAME)
-    def test_email(
-        config, recipient, subject, body, sender=None, reply_to=None, mimetype="plain"
-    ):
-        """
-        Sends an email via the configuration.
+        Connect to the SMTP server of the configuration, do the STARTTLS and
+        the authentication, if required.
 
         :param config: The email configuration
         :type config: dict
-        :param recipient: The recipients of the email
-        :type recipient: list or str
-        :param subject: The subject of the email
-        :type subject: basestring
-        :param body: The body of the email
-        :type body: email.mime.base.MIMEBase or str
-        :param sender: An optional sender of the email. The SMTP database
-            object has its own sender. This parameter can be used to override
-            the internal sender.
-        :type sender: basestring
-        :param reply_to: The Reply-To parameter
-        :type reply_to: basestring
-        :param mimetype: The type of the email to send. Can by plain or html
-        :return: True or False
         """
-        if type(recipient) != list:
-            recipient = [recipient]
-        mail_from = sender or config["sender"]
-        reply_to = reply_to or mail_from
-        if isinstance(body, MIMEBase):
-            msg = body
-        else:
-            msg = MIMEText(to_unicode(body), mimetype, "utf-8")
-        msg["Subject"] = subject
-        msg["From"] = mail_from
-        msg["To"] = ",".join(recipient)
-        msg["Date"] = strftime("%a, %d %b %Y %H:%M:%S +0000", gmtime())
-        msg["Reply-To"] = reply_to
-        msg["Precedence"] = "bulk"
-        msg["Auto-Submitted"] = "auto-generated"
-
         srv = config["server"]
         # urllib looks for a '//' to identify the host in the string. If it is
         # missing we add one.
@@ -131,7 +99,6 @@ class SMTPServer:
                 port=smtp_url.port or int(config["port"]),
                 timeout=config.get("timeout", TIMEOUT),
             )
-        log.debug(f"submitting message to {msg['To']}")
         log.debug(f"Saying EHLO to mailserver {config['server']}")
         r = mail.ehlo()
         log.debug(f"mailserver responded with {r}")
@@ -146,7 +113,25 @@ class SMTPServer:
             if password == FAILED_TO_DECRYPT_PASSWORD:
                 password = config["password"]
             mail.login(config["username"], password)
-        r = mail.sendmail(mail_from, recipient, msg.as_string())
+        self.mail = mail
+        # The number of emails, which were sent via this connection
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def send(self, mail_from, recipient, msg):
+        """
+        Send the message via this connection.
+
+        :param mail_from: The sender of the email
+        :param recipient: The list of recipients
+        :param msg: The message
+        :type msg: email.mime.base.MIMEBase
+        :return: True or False
+        """
+        log.debug(f"submitting message to {msg['To']}")
+        r = self.mail.sendmail(mail_from, recipient, msg.as_string())
+        self.sent += 1
+        self.last_used = time.monotonic()
         log.info(f"Mail sent: {r}")
         # r is a dictionary like {"recp@destination.com": (200, 'OK')}
         # we change this to True or False
@@ -158,10 +143,298 @@ class SMTPServer:
                 log.error(
                     f"Failed to send email to {one_recipient!r}: {res_id!r}, {res_text!r}"
                 )
-        mail.quit()
-        log.debug("I am done sending your email.")
         return success
 
+    def close(self):
+        """
+        Quit the connection. Errors are ignored, since the connection may
+        already have been closed by the server.
+        """
+        try:
+            self.mail.quit()
+        except (smtplib.SMTPException, OSError) as exx:
+            log.debug(f"Could not quit the SMTP connection: {exx!r}")
+            self.mail.close()
+
+
+class SMTPConnectionPool:
+    """
+    A pool of open SMTP connections, so that an email can be sent without
+    a new TCP connection, TLS handshake and authentication.
+
+    For each SMTP server configuration at most ``size`` idle connections are
+    kept. A connection is closed, if it was idle for more than ``idle_time``
+    seconds or if it has sent ``max_messages`` emails.
+    """
+
+    def __init__(
+        self,
+        size,
+        idle_time=DEFAULT_POOL_IDLE_TIME,
+        max_messages=DEFAULT_POOL_MAX_MESSAGES,
+    ):
+        self.size = size
+        self.idle_time = idle_time
+        self.max_messages = max_messages
+        self._lock = Lock()
+        self._connections = {}
+
+    def get(self, key):
+        """
+        Return an idle connection for the given key and remove it from the pool.
+
+        :param key: the key of the SMTP server configuration
+        :return: an ``SMTPConnection`` or None
+        """
+        expired = []
+        connection = None
+        now = time.monotonic()
+        with self._lock:
+            connections = self._connections.get(key, [])
+            while connections:
+                candidate = connections.pop()
+                if now - candidate.last_used > self.idle_time:
+                    expired.append(candidate)
+                else:
+                    connection = candidate
+                    break
+        for candidate in expired:
+            candidate.close()
+        return connection
+
+    def put(self, key, connection):
+        """
+        Return the connection to the pool or close it, if the pool is full or
+        the connection has sent enough emails.
+        """
+        if connection.sent < self.max_messages:
+            with self._lock:
+                connections = self._connections.setdefault(key, [])
+                if len(connections) < self.size:
+                    connections.append(connection)
+                    return
+        connection.close()
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            connections = [c for conns in self._connections.values() for c in conns]
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+
+def get_smtp_pool():
+    """
+    Return the ``SMTPConnectionPool`` of the current application, if it is
+    enabled via ``EDUMFA_SMTP_POOL_SIZE``.
+
+    :return: a ``SMTPConnectionPool`` object or None
+    """
+    if not has_app_context():
+        return None
+    size = int(get_app_config_value(POOL_SIZE_CONFIG_NAME, 0))
+    if size <= 0:
+        return None
+    app_store = get_app_local_store()
+    try:
+        return app_store["smtp_pool"]
+    except KeyError:
+        pool = SMTPConnectionPool(
+            size,
+            idle_time=float(
+                get_app_config_value(POOL_IDLE_TIME_CONFIG_NAME, DEFAULT_POOL_IDLE_TIME)
+            ),
+            max_messages=int(
+                get_app_config_value(
+                    POOL_MAX_MESSAGES_CONFIG_NAME, DEFAULT_POOL_MAX_MESSAGES
+                )
+            ),
+        )
+        return app_store.setdefault("smtp_pool", pool)
+
+
+def _get_connection_key(config):
+    return tuple(
+        config.get(k)
+        for k in ("server", "port", "tls", "username", "password", "timeout")
+    )
+
+
+def _is_connection_error(exx):
+    """
+    Return True, if the exception means that the connection to the SMTP
+    server was lost, e.g. because the server closed an idle connection.
+    """
+    if isinstance(exx, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exx, smtplib.SMTPResponseException):
+        # 421: Service not available, closing transmission channel
+        return exx.smtp_code == 421
+    return isinstance(exx, OSError) and not isinstance(exx, smtplib.SMTPException)
+
+
+def _create_message(
+    config, recipient, subject, body, sender=None, reply_to=None, mimetype="plain"
+):
+    """
+    Create the message. See ``SMTPServer.test_email`` for the parameters.
+
+    :return: tuple of the sender, the list of recipients and the message
+    """
+    if type(recipient) != list:
+        recipient = [recipient]
+    mail_from = sender or config["sender"]
+    reply_to = reply_to or mail_from
+    if isinstance(body, MIMEBase):
+        msg = body
+    else:
+        msg = MIMEText(to_unicode(body), mimetype, "utf-8")
+    msg["Subject"] = subject
+    msg["From"] = mail_from
+    msg["To"] = ",".join(recipient)
+    msg["Date"] = strftime("%a, %d %b %Y %H:%M:%S +0000", gmtime())
+    msg["Reply-To"] = reply_to
+    msg["Precedence"] = "bulk"
+    msg["Auto-Submitted"] = "auto-generated"
+    return mail_from, recipient, msg
+
+
+def _send_messages(config, messages, fail_silently=False):
+    """
+    Send the messages via one connection. If the connection pool is enabled,
+    the connection is taken from and returned to the pool.
+
+    :param config: The email configuration
+    :type config: dict
+    :param messages: list of dictionaries with the parameters of
+        ``SMTPServer.test_email``
+    :param fail_silently: If this is set, an error while sending a message
+        does not stop sending the other messages. The message is reported as
+        not sent instead.
+    :return: list of True or False for each message
+    """
+    pool = get_smtp_pool()
+    max_messages = pool.max_messages if pool else DEFAULT_POOL_MAX_MESSAGES
+    key = _get_connection_key(config)
+    connection = pool.get(key) if pool else None
+    results = []
+    for message in messages:
+        mail_from, recipient, msg = _create_message(config, **message)
+        if connection is not None and connection.sent >= max_messages:
+            connection.close()
+            connection = None
+        try:
+            if connection is None:
+                connection = SMTPConnection(config)
+            try:
+                results.append(connection.send(mail_from, recipient, msg))
+            except Exception as exx:
+                # A connection, which was already used, may have been closed
+                # by the server in the meantime. Then we try a new connection.
+                if not (connection.sent and _is_connection_error(exx)):
+                    raise
+                log.info(f"The connection to {config['server']} was lost: {exx!r}")
+                connection.close()
+                connection = None
+                connection = SMTPConnection(config)
+                results.append(connection.send(mail_from, recipient, msg))
+        except Exception as exx:
+            if connection is not None:
+                connection.close()
+                connection = None
+            if not fail_silently:
+                raise
+            log.warning(f"Failed to send email to {recipient!r}: {exx!r}")
+            log.debug(traceback.format_exc())
+            results.append(False)
+    if connection is not None:
+        if pool:
+            pool.put(key, connection)
+        else:
+            connection.close()
+    log.debug("I am done sending your email.")
+    return results
+
+
+class SMTPServer:
+    """
+    SMTP Object that holds a SMTP Database Object but can also send emails.
+    """
+
+    def __init__(self, db_smtpserver_object):
+        """
+        Creates a new SMTPServer instance from a DB Server Object
+
+        :param db_smtpserver_object: A DB STMTPserver object
+        :return: A SMTP Server Object
+        """
+        self.config = db_smtpserver_object
+
+    def send_email(
+        self, recipient, subject, body, sender=None, reply_to=None, mimetype="plain"
+    ):
+        return send_or_enqueue_email(
+            self.config.get(), recipient, subject, body, sender, reply_to, mimetype
+        )
+
+    def send_emails(self, messages):
+        return send_or_enqueue_emails(self.config.get(), messages)
+
+    @staticmethod
+    @job(SEND_EMAIL_JOB_NAME)
+    def test_email(
+        config, recipient, subject, body, sender=None, reply_to=None, mimetype="plain"
+    ):
+        """
+        Sends an email via the configuration.
+
+        :param config: The email configuration
+        :type config: dict
+        :param recipient: The recipients of the email
+        :type recipient: list or str
+        :param subject: The subject of the email
+        :type subject: basestring
+        :param body: The body of the email
+        :type body: email.mime.base.MIMEBase or str
+        :param sender: An optional sender of the email. The SMTP database
+            object has its own sender. This parameter can be used to override
+            the internal sender.
+        :type sender: basestring
+        :param reply_to: The Reply-To parameter
+        :type reply_to: basestring
+        :param mimetype: The type of the email to send. Can by plain or html
+        :return: True or False
+        """
+        message = {
+            "recipient": recipient,
+            "subject": subject,
+            "body": body,
+            "sender": sender,
+            "reply_to": reply_to,
+            "mimetype": mimetype,
+        }
+        return _send_messages(config, [message])[0]
+
+    @staticmethod
+    @job(SEND_EMAILS_JOB_NAME)
+    def send_batch(config, messages):
+        """
+        Sends several emails via the configuration over one connection.
+        An email, which can not be sent, does not stop sending the others.
+
+        :param config: The email configuration
+        :type config: dict
+        :param messages: list of dictionaries with the keys ``recipient``,
+            ``subject``, ``body`` and optionally ``sender``, ``reply_to`` and
+            ``mimetype`` (see ``test_email``)
+        :type messages: list
+        :return: list of True or False for each email
+        """
+        return _send_messages(config, messages, fail_silently=True)
+
 
 def send_or_enqueue_email(
     config, recipient, subject, body, sender=None, reply_to=None, mimetype="plain"
@@ -179,6 +452,21 @@ def send_or_enqueue_email(
     return send(config, recipient, subject, body, sender, reply_to, mimetype)
 
 
+def send_or_enqueue_emails(config, messages):
+    """
+    According to the value of ``config["enqueue_job"]``, send the emails directly or send
+    one job for all emails to the queue (if a queue is configured).
+    See ``SMTPServer.send_batch`` for parameters.
+    :return: list of True for each email if the job is sent to the queue, return value of
+        ``SMTPServer.send_batch`` otherwise
+    """
+    if has_job_queue() and config.get("enqueue_job", False):
+        send = wrap_job(SEND_EMAILS_JOB_NAME, [True] * len(messages))
+    else:
+        send = SMTPServer.send_batch
+    return send(config, messages)
+
+
 @log_with(log)
 def send_email_identifier(
     identifier, recipient, subject, body, sender=None, reply_to=None, mimetype="plain"
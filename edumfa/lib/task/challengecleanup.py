@@ -0,0 +1,71 @@
+#
+# License:  AGPLv3
+# This file is part of eduMFA. eduMFA is a fork of privacyIDEA which was forked from LinOTP.
+# Copyright (c) 2024 eduMFA Project-Team
+#
+# This code is free software; you can redistribute it and/or
+# modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or any later version.
+#
+# This code is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU AFFERO GENERAL PUBLIC LICENSE for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+
+from edumfa.lib import _
+from edumfa.lib.monitoringstats import write_stats
+from edumfa.lib.task.base import BaseTask
+from edumfa.lib.utils import is_true
+from edumfa.models import JwtBlacklist, cleanup_challenges
+
+__doc__ = """This task module deletes expired challenges from the database in
+chunks. It can replace the automatic challenge janitor, which deletes the
+expired challenges during the authentication requests."""
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ChallengeCleanupTask(BaseTask):
+    identifier = "ChallengeCleanup"
+    description = "Delete expired challenges from the database."
+
+    @property
+    def options(self):
+        return {
+            "chunk_size": {
+                "type": "str",
+                "description": _(
+                    "The number of challenges, which are deleted in one "
+                    "transaction (default: 1000)."
+                ),
+            },
+            "stats_key": {
+                "type": "str",
+                "description": _(
+                    "The name of the stats key to write the number of deleted "
+                    "challenges to the MonitoringStats table."
+                ),
+            },
+            "cleanup_jwt_blacklist": {
+                "type": "bool",
+                "description": _("Also delete expired JWT blocklist entries."),
+            },
+        }
+
+    def do(self, params):
+        chunk_size = int(params.get("chunk_size") or DEFAULT_CHUNK_SIZE)
+        deleted = cleanup_challenges(chunk_size=chunk_size)
+        log.info(f"Deleted {deleted} expired challenges.")
+        if params.get("stats_key"):
+            write_stats(params.get("stats_key"), deleted)
+        if is_true(params.get("cleanup_jwt_blacklist")):
+            JwtBlacklist.blacklist_janitor()
+        return True
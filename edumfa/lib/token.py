@@ -34,6 +34,7 @@ This is the middleware/glue between the HTTP API and the database
 """
 
 import datetime
+import itertools
 import json
 import logging
 import os
@@ -43,6 +44,7 @@ import traceback
 from dateutil.tz import tzlocal
 from sqlalchemy import and_, func, join
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import selectinload
 from sqlalchemy.sql.expression import FunctionElement
 
 from edumfa.lib import _
@@ -81,7 +83,7 @@ from edumfa.lib.policydecorators import (
 from edumfa.lib.realm import realm_is_defined
 from edumfa.lib.resolver import get_resolver_object
 from edumfa.lib.tokenclass import DATE_FORMAT, TOKENKIND, TokenClass
-from edumfa.lib.user import User
+from edumfa.lib.user import User, get_usernames
 from edumfa.lib.utils import BASE58, check_serial_valid, hexlify_and_unicode, is_true
 from edumfa.models import (
     Challenge,
@@ -93,6 +95,8 @@ from edumfa.models import (
     TokenOwner,
     TokenRealm,
     TokenTokengroup,
+    db,
+    token_unit_of_work,
 )
 
 log = logging.getLogger(__name__)
@@ -100,6 +104,18 @@ log = logging.getLogger(__name__)
 optional = True
 required = False
 
+# The number of tokens, which are written in one transaction during an import
+IMPORT_CHUNK_SIZE = 100
+
+# The relationships of the token, that are loaded eagerly for the different
+# uses of the token query. This avoids an additional query per token, when
+# the token info, the owners, realms or tokengroups are accessed.
+TOKEN_LOAD_PROFILES = {
+    "auth": ("info_list", "owner_list", "realm_list"),
+    "list": ("info_list", "owner_list", "realm_list", "tokengroup_list"),
+    "export": ("info_list", "owner_list", "realm_list", "tokengroup_list"),
+}
+
 
 # Define function to convert Oracle CLOBs to VARCHAR before using them in a
 # compare operation.
@@ -168,13 +184,24 @@ def _create_token_query(
     maxfail=None,
     allowed_realms=None,
     for_update=False,
+    load_profile=None,
 ):
     """
     This function create the sql query for getting tokens. It is used by
     get_tokens and get_tokens_paginate.
+
+    :param load_profile: The name of a profile in ``TOKEN_LOAD_PROFILES``.
+        The relationships of the profile are loaded together with the tokens.
     :return: An SQLAlchemy sql query
     """
     sql_query = Token.query
+    if load_profile:
+        sql_query = sql_query.options(
+            *[
+                selectinload(getattr(Token, relationship))
+                for relationship in TOKEN_LOAD_PROFILES[load_profile]
+            ]
+        )
     if user is not None and not user.is_empty():
         # extract the realm from the user object:
         realm = user.realm
@@ -399,6 +426,7 @@ def get_tokens_paginated_generator(
         locked=locked,
         tokeninfo=tokeninfo,
         maxfail=maxfail,
+        load_profile="export",
     ).order_by(Token.id)
     # Fetch the first ``psize`` tokens
     sql_query = main_sql_query.limit(psize)
@@ -438,6 +466,7 @@ def get_tokens(
     tokeninfo=None,
     maxfail=None,
     for_update=False,
+    load_profile=None,
 ):
     """
     (was getTokensOfType)
@@ -486,6 +515,9 @@ def get_tokens(
         reached maxfail
     :param for_update: If True, a SELECT FOR UPDATE is used to lock the token
     :type for_update: bool
+    :param load_profile: The name of a profile in ``TOKEN_LOAD_PROFILES``,
+        e.g. "auth". The relationships of the profile are loaded eagerly.
+    :type load_profile: str
     :return: A list of tokenclasses (lib.tokenclass).
     :rtype: list
     """
@@ -505,6 +537,7 @@ def get_tokens(
         tokeninfo=tokeninfo,
         maxfail=maxfail,
         for_update=for_update,
+        load_profile=load_profile,
     )
 
     # Warning for unintentional exact serial matches
@@ -602,6 +635,7 @@ def get_tokens_paginate(
         description=description,
         userid=userid,
         allowed_realms=allowed_realms,
+        load_profile="list",
     )
 
     if isinstance(sortby, str):
@@ -627,6 +661,8 @@ def get_tokens_paginate(
     if pagination.has_next:
         next = page + 1
     token_list = []
+    # look up the owners of all tokens on this page at once
+    owner_names = _get_owner_names(tokens)
     for token in tokens:
         tokenobject = create_tokenclass_object(token)
         if isinstance(tokenobject, TokenClass):
@@ -637,7 +673,29 @@ def get_tokens_paginate(
             token_dict["username"] = ""
             token_dict["user_realm"] = ""
             try:
-                userobject = tokenobject.user
+                userobject = None
+                tokenowner = token.first_owner
+                if tokenowner:
+                    username = owner_names.get(
+                        (tokenowner.resolver, tokenowner.user_id)
+                    )
+                    if username is None:
+                        userobject = tokenobject.user
+                    elif username:
+                        userobject = User(
+                            login=username,
+                            resolver=tokenowner.resolver,
+                            realm=tokenowner.realm.name,
+                            uid=tokenowner.user_id,
+                        )
+                    else:
+                        # The user does not exist (anymore). Like
+                        # TokenClass.user, we return an empty login.
+                        userobject = User(
+                            login="",
+                            resolver=tokenowner.resolver,
+                            realm=tokenowner.realm.name,
+                        )
                 if userobject:
                     token_dict["username"] = userobject.login
                     token_dict["user_realm"] = userobject.realm
@@ -666,6 +724,37 @@ def get_tokens_paginate(
     return ret
 
 
+def _get_owner_names(tokens):
+    """
+    Look up the usernames of the owners of the given tokens with one request
+    per resolver.
+    Owners, which could not be looked up, are missing in the result.
+
+    :param tokens: list of Token database objects
+    :return: dictionary with tuples of resolver name and user id as keys and
+        the usernames as values
+    :rtype: dict
+    """
+    userids = {}
+    for token in tokens:
+        tokenowner = token.first_owner
+        if tokenowner and tokenowner.user_id:
+            userids.setdefault(tokenowner.resolver, []).append(tokenowner.user_id)
+    owner_names = {}
+    for resolvername, resolver_userids in userids.items():
+        try:
+            usernames = get_usernames(resolver_userids, resolvername)
+        except Exception as exx:
+            log.warning(
+                f"Users of resolver {resolvername!r} can not be retrieved: {exx}"
+            )
+            log.debug(traceback.format_exc())
+            continue
+        for userid, username in usernames.items():
+            owner_names[(resolvername, userid)] = username
+    return owner_names
+
+
 def get_one_token(*args, silent_fail=False, **kwargs):
     """
     Fetch exactly one token according to the given filter arguments, which are passed to
@@ -1154,6 +1243,61 @@ def import_token(serial, token_dict, tokenrealms=None):
     return token
 
 
+@log_with(log, hide_args=[0])
+def import_tokens(
+    tokens, tokenrealms=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None
+):
+    """
+    Import many tokens, e.g. from a token file. The tokens are imported in
+    chunks of ``chunk_size`` tokens and the token data of each chunk is
+    written to the database in one transaction.
+
+    A token, which can not be imported, does not stop the import. The error
+    is returned instead.
+
+    :param tokens: A dictionary with the serials as keys and the token
+        dictionaries (see ``import_token``) as values or an iterable of
+        tuples (serial, token dictionary), like the generator ``iterOATHcsv``
+    :param tokenrealms: List of realms to set as realms of the tokens
+    :type tokenrealms: list
+    :param chunk_size: The number of tokens per transaction
+    :type chunk_size: int
+    :param progress: A function, which is called with the number of processed
+        tokens after each chunk
+    :return: A dictionary with the number of imported tokens in ``n_imported``
+        and the error messages of the tokens, which could not be imported, in
+        ``errors`` (a dictionary with the serials as keys)
+    :rtype: dict
+    """
+    if isinstance(tokens, dict):
+        tokens = tokens.items()
+    tokens = iter(tokens)
+    n_processed = 0
+    n_imported = 0
+    errors = {}
+    while True:
+        chunk = list(itertools.islice(tokens, chunk_size))
+        if not chunk:
+            break
+        with token_unit_of_work(force=True):
+            imported = []
+            for serial, token_dict in chunk:
+                try:
+                    # A token, which fails, only rolls back its own changes
+                    with db.session.begin_nested():
+                        import_token(serial, token_dict, tokenrealms=tokenrealms)
+                    imported.append(serial)
+                except Exception as exx:
+                    log.warning(f"Could not import token {serial!r}: {exx!r}")
+                    log.debug(traceback.format_exc())
+                    errors[serial] = str(exx)
+        n_imported += len(imported)
+        n_processed += len(chunk)
+        if progress:
+            progress(n_processed)
+    return {"n_imported": n_imported, "errors": errors}
+
+
 @log_with(log)
 def init_token(param, user=None, tokenrealms=None, tokenkind=None):
     """
@@ -2207,7 +2351,7 @@ def check_serial_pass(serial, passw, options=None):
     :rtype: tuple
     """
     reply_dict = {}
-    tokenobject = get_one_token(serial=serial, for_update=True)
+    tokenobject = get_one_token(serial=serial, for_update=True, load_profile="auth")
     res, reply_dict = check_token_list(
         [tokenobject],
         passw,
@@ -2262,7 +2406,9 @@ def check_user_pass(user, passw, options=None):
     :rtype: tuple
     """
     token_type = options.pop("token_type", None)
-    tokenobject_list = get_tokens(user=user, tokentype=token_type, for_update=True)
+    tokenobject_list = get_tokens(
+        user=user, tokentype=token_type, for_update=True, load_profile="auth"
+    )
     reply_dict = {}
     if not tokenobject_list:
         # The user has no tokens assigned
@@ -2384,6 +2530,7 @@ def weigh_token_type(token_obj):
 
 
 @log_with(log, hide_args=[1])
+@token_unit_of_work()
 @libpolicy(reset_all_user_tokens)
 @libpolicy(generic_challenge_response_reset_pin)
 @libpolicy(generic_challenge_response_resync)
@@ -36,21 +36,151 @@ import binascii
 import hmac
 import logging
 import struct
+from collections import OrderedDict
 from hashlib import sha1
+from threading import Lock
 
 from edumfa.lib.crypto import safe_compare
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
 from edumfa.lib.log import log_with
 from edumfa.lib.utils import hexlify_and_unicode
 
 log = logging.getLogger(__name__)
 
+LOOKAHEAD_CONFIG_NAME = "EDUMFA_OTP_LOOKAHEAD_CACHE"
+LOOKAHEAD_SIZE_CONFIG_NAME = "EDUMFA_OTP_LOOKAHEAD_CACHE_SIZE"
+DEFAULT_LOOKAHEAD_SIZE = 10000
+# The maximum number of OTP values, which are kept for a single token.
+# This avoids that checks with a large sync window fill up the memory.
+MAX_LOOKAHEAD_ENTRIES = 100
+
+
+class OtpLookaheadTable:
+    """
+    The OTP values of a single token, which were already calculated,
+    keyed by the counter. Only the values within ``max_entries`` around the
+    current counter of the token are kept.
+    """
+
+    def __init__(self, max_entries=MAX_LOOKAHEAD_ENTRIES):
+        self.max_entries = max_entries
+        self.counter = 0
+        self.values = {}
+
+    def get(self, counter):
+        return self.values.get(counter)
+
+    def put(self, counter, otp):
+        if abs(counter - self.counter) >= self.max_entries:
+            # The value is too far away from the current counter
+            return
+        if counter not in self.values and len(self.values) >= self.max_entries:
+            # The table is full, so we remove the value with the lowest counter
+            self.values.pop(min(list(self.values)), None)
+        self.values[counter] = otp
+
+    def prune(self, counter):
+        """
+        Remove all OTP values, which are too far away from the given counter.
+        This is done before every check, so that the table moves along with
+        the counter of the token, even if the checks fail.
+
+        :param counter: the current counter of the token
+        :type counter: int
+        """
+        self.counter = counter
+        for c in list(self.values):
+            if abs(c - counter) >= self.max_entries:
+                self.values.pop(c, None)
+
+    def advance(self, counter):
+        """
+        Remove all OTP values below the given counter. These values can not
+        be used anymore, since the token counter has advanced.
+
+        :param counter: the new counter of the token
+        :type counter: int
+        """
+        self.counter = counter
+        for c in [c for c in list(self.values) if c < counter]:
+            self.values.pop(c, None)
+
+
+class OtpLookaheadCache:
+    """
+    A process wide cache, which holds one ``OtpLookaheadTable`` per token
+    serial. A table is only returned, if the fingerprint of the token
+    (the encrypted key, the OTP length and the hash function) did not change.
+    The least recently used tables are evicted if the cache exceeds ``size``
+    tokens.
+    """
+
+    def __init__(self, size=DEFAULT_LOOKAHEAD_SIZE):
+        self.size = size
+        self._lock = Lock()
+        self._tables = OrderedDict()
+
+    def get_table(self, serial, fingerprint):
+        """
+        Return the lookahead table of the given token. If there is no table
+        or the token fingerprint has changed, a new table is created.
+
+        :param serial: the serial number of the token
+        :param fingerprint: a hashable object describing the token secret
+        :return: an ``OtpLookaheadTable``
+        """
+        with self._lock:
+            entry = self._tables.get(serial)
+            if entry is None or entry[0] != fingerprint:
+                entry = (fingerprint, OtpLookaheadTable())
+                self._tables[serial] = entry
+            self._tables.move_to_end(serial)
+            while len(self._tables) > self.size:
+                self._tables.popitem(last=False)
+            return entry[1]
+
+    def invalidate(self, serial):
+        """
+        Remove the lookahead table of the given token.
+
+        :param serial: the serial number of the token
+        """
+        with self._lock:
+            self._tables.pop(serial, None)
+
+
+def get_lookahead_cache():
+    """
+    Return the ``OtpLookaheadCache`` of the current application, if the
+    lookahead cache is enabled via ``EDUMFA_OTP_LOOKAHEAD_CACHE``.
+
+    :return: an ``OtpLookaheadCache`` object or None
+    """
+    if not get_app_config_value(LOOKAHEAD_CONFIG_NAME, False):
+        return None
+    app_store = get_app_local_store()
+    try:
+        return app_store["otp_lookahead_cache"]
+    except KeyError:
+        size = int(
+            get_app_config_value(LOOKAHEAD_SIZE_CONFIG_NAME, DEFAULT_LOOKAHEAD_SIZE)
+        )
+        return app_store.setdefault("otp_lookahead_cache", OtpLookaheadCache(size))
+
 
 class HmacOtp:
-    def __init__(self, secObj=None, counter=0, digits=6, hashfunc=sha1):
+    def __init__(self, secObj=None, counter=0, digits=6, hashfunc=sha1, lookahead=None):
+        """
+        :param lookahead: an optional ``OtpLookaheadTable`` with already
+            calculated OTP values of this token
+        """
         self.secretObj = secObj
         self.counter = int(counter)
         self.digits = digits
         self.hashfunc = hashfunc
+        self.lookahead = lookahead
+        if lookahead is not None:
+            lookahead.prune(self.counter)
 
     def hmac(self, counter=None, key=None, challenge=None):
         """
@@ -148,7 +278,7 @@ class HmacOtp:
 
         log.debug(f"OTP range counter: {start!r} - {end!r}")
         for c in range(start, end):
-            otpval = self.generate(c)
+            otpval = self._lookahead_otp(c)
             # log.debug(f"calculating counter {c!r}")
 
             if safe_compare(otpval, anOtpVal):
@@ -156,3 +286,24 @@ class HmacOtp:
                 break
         # return -1 or the counter
         return res
+
+    def _lookahead_otp(self, counter):
+        """
+        Return the OTP value for the given counter. If a lookahead table is
+        available, the value is taken from or stored in the table.
+        Like ``generate`` this increases the internal counter.
+
+        :param counter: the counter
+        :type counter: int
+        :return: the OTP value
+        :rtype: str
+        """
+        if self.lookahead is None:
+            return self.generate(counter)
+        otpval = self.lookahead.get(counter)
+        if otpval is None:
+            otpval = self.generate(counter)
+            self.lookahead.put(counter, otpval)
+        else:
+            self.counter = counter + 1
+        return otpval
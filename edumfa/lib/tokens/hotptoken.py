@@ -66,7 +66,7 @@ from edumfa.lib.utils import (
     is_true,
 )
 
-from .HMAC import HmacOtp
+from .HMAC import HmacOtp, get_lookahead_cache
 
 optional = True
 required = False
@@ -403,6 +403,32 @@ class HotpTokenClass(TokenClass):
         )
         return hashlibStr
 
+    def _get_lookahead_table(self):
+        """
+        Return the table of already calculated OTP values of this token.
+
+        :return: an ``OtpLookaheadTable`` or None, if the OTP lookahead cache
+            is not enabled
+        """
+        cache = get_lookahead_cache()
+        if cache is None:
+            return None
+        fingerprint = (
+            self.token.key_enc,
+            self.token.key_iv,
+            int(self.token.otplen),
+            self.hashlib,
+        )
+        return cache.get_table(self.token.serial, fingerprint)
+
+    def _invalidate_lookahead_table(self):
+        """
+        Remove the table of already calculated OTP values of this token.
+        """
+        cache = get_lookahead_cache()
+        if cache is not None:
+            cache.invalidate(self.token.serial)
+
     def _calc_otp(self, counter):
         """
         Helper function to calculate the OTP value for the given counter
@@ -444,7 +470,14 @@ class HotpTokenClass(TokenClass):
             counter = int(self.get_otp_count())
         if window is None:
             window = int(self.get_count_window())
-        hmac2Otp = HmacOtp(secretHOtp, counter, otplen, self.get_hashlib(self.hashlib))
+        lookahead = self._get_lookahead_table()
+        hmac2Otp = HmacOtp(
+            secretHOtp,
+            counter,
+            otplen,
+            self.get_hashlib(self.hashlib),
+            lookahead=lookahead,
+        )
         res = hmac2Otp.checkOtp(anOtpVal, window)
 
         if res == -1:
@@ -452,6 +485,8 @@ class HotpTokenClass(TokenClass):
         if res != -1:
             # on success, we save the counter
             self.set_otp_count(res + 1)
+            if lookahead is not None:
+                lookahead.advance(res + 1)
             # We could also store it temporarily
             # self.auth_details["matched_otp_counter"] = res
 
@@ -478,13 +513,22 @@ class HotpTokenClass(TokenClass):
         counter = int(self.token.count)
 
         secretHOtp = self.token.get_otpkey()
-        hmac2Otp = HmacOtp(secretHOtp, counter, otplen, self.get_hashlib(self.hashlib))
+        lookahead = self._get_lookahead_table()
+        hmac2Otp = HmacOtp(
+            secretHOtp,
+            counter,
+            otplen,
+            self.get_hashlib(self.hashlib),
+            lookahead=lookahead,
+        )
         res = hmac2Otp.checkOtp(otp, window, symmetric=symmetric)
 
         if inc_counter and res >= 0:
             # As usually the counter is increased in lib.token.checkUserPass,
             # we need to do this manually here:
             self.inc_otp_counter(res)
+            if lookahead is not None:
+                lookahead.advance(res + 1)
         if res == -1:
             msg = f"otp counter {otp!r} was not found"
         else:
@@ -622,6 +666,7 @@ class HotpTokenClass(TokenClass):
 
         ret = True
         self.inc_otp_counter(counter + 1, reset=True)
+        self._invalidate_lookahead_table()
 
         log.debug(f"end. resync was successful: ret: {ret!r}")
         return ret
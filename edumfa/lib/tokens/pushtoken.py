@@ -46,7 +46,8 @@ from edumfa.api.lib.policyhelper import get_pushtoken_add_config
 from edumfa.api.lib.utils import getParam
 from edumfa.lib import _
 from edumfa.lib.apps import _construct_extra_parameters
-from edumfa.lib.challenge import get_challenges
+from edumfa.lib.challenge import get_challenges, get_open_challenges
+from edumfa.lib.challengechannel import get_challenge_channel, get_poll_interval
 from edumfa.lib.config import get_from_config
 from edumfa.lib.crypto import generate_keypair, geturandom
 from edumfa.lib.decorators import check_token_locked
@@ -93,7 +94,6 @@ PUBLIC_KEY_SMARTPHONE = "public_key_smartphone"
 POLLING_ALLOWED = "polling_allowed"
 GWTYPE = "edumfa.lib.smsprovider.FirebaseProvider.FirebaseProvider"
 ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
-DELAY = 1.0
 
 # Timedelta in minutes
 POLL_TIME_WINDOW = 1
@@ -972,7 +972,7 @@ class PushTokenClass(TokenClass):
                 )
             options = {"g": g}
             challenges = []
-            challengeobject_list = get_challenges(serial=serial)
+            challengeobject_list = get_open_challenges(serial=serial)
             for chal in challengeobject_list:
                 # check if the challenge is active and not already answered
                 if chal.get_data() == "challenge_declined":
@@ -1258,17 +1258,22 @@ class PushTokenClass(TokenClass):
                 waiting = int(options.get(self.PUSH_ACTION.WAIT, 20))
                 # Trigger the challenge
                 _t, _m, transaction_id, _attr = self.create_challenge(options=options)
-                # now we need to check and wait for the response to be answered in the challenge table
-                starttime = time.time()
-                while True:
-                    db.session.commit()
-                    otp_counter = self.check_challenge_response(
-                        options={"transaction_id": transaction_id}
-                    )
-                    elapsed_time = time.time() - starttime
-                    if otp_counter >= 0 or elapsed_time > waiting or elapsed_time < 0:
-                        break
-                    time.sleep(DELAY - (elapsed_time % DELAY))
+                # now we need to wait for the response to be answered in the challenge table.
+                # We are notified, when the answer is committed, and only poll as a fallback.
+                poll_interval = get_poll_interval()
+                starttime = time.monotonic()
+                with get_challenge_channel().subscribe(transaction_id) as answered:
+                    while True:
+                        # End the transaction to see the answer and to release the connection
+                        db.session.commit()
+                        otp_counter = self.check_challenge_response(
+                            options={"transaction_id": transaction_id}
+                        )
+                        remaining = waiting - (time.monotonic() - starttime)
+                        if otp_counter >= 0 or remaining <= 0:
+                            break
+                        answered.wait(min(poll_interval, remaining))
+                        answered.clear()
 
         return pin_match, otp_counter, reply
 
@@ -1302,7 +1307,7 @@ class PushTokenClass(TokenClass):
 
         # get the challenges for this transaction ID
         if transaction_id is not None:
-            challengeobject_list = get_challenges(
+            challengeobject_list = get_open_challenges(
                 serial=self.token.serial, transaction_id=transaction_id
             )
 
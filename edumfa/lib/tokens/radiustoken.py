@@ -36,7 +36,7 @@ import logging
 import traceback
 
 import pyrad.packet
-from pyrad.client import Client, Timeout
+from pyrad.client import Timeout
 from pyrad.dictionary import Dictionary
 from pyrad.packet import AccessAccept, AccessChallenge, AccessReject
 
@@ -48,7 +48,12 @@ from edumfa.lib.decorators import check_token_locked
 from edumfa.lib.log import log_with
 from edumfa.lib.policy import ACTION, GROUP, SCOPE
 from edumfa.lib.policydecorators import challenge_response_allowed
-from edumfa.lib.radiusserver import get_radius
+from edumfa.lib.radiusserver import (
+    format_radius_server,
+    get_radius,
+    parse_radius_servers,
+    send_radius_request,
+)
 from edumfa.lib.tokenclass import AUTHENTICATIONMODE, TOKENKIND, TokenClass
 from edumfa.lib.tokens.remotetoken import RemoteTokenClass
 from edumfa.lib.utils import hexlify_and_unicode, is_true, to_bytes, to_unicode
@@ -164,7 +169,8 @@ class RadiusTokenClass(RemoteTokenClass):
 
         communication with RADIUS server: yes
         modification of options: The communication with the RADIUS server can
-            change the options, radius_state, radius_result, radius_message
+            change the options, radius_state, radius_result, radius_message and
+            radius_challenge_server
 
         :param passw: password, which might be pin or pin+otp
         :type passw: string
@@ -189,7 +195,12 @@ class RadiusTokenClass(RemoteTokenClass):
             # The pin is checked remotely
             res = options.get("radius_result")
             if res is None:
-                res = self._check_radius(passw, options=options, radius_state=state)
+                res = self._check_radius(
+                    passw,
+                    options=options,
+                    radius_state=state,
+                    challenge_server=options.get("radius_challenge_server"),
+                )
 
             return res == AccessChallenge
 
@@ -217,6 +228,9 @@ class RadiusTokenClass(RemoteTokenClass):
             options = {}
         message = options.get("radius_message") or "Enter your RADIUS tokencode:"
         state = hexlify_and_unicode(options.get("radius_state") or b"")
+        if options.get("radius_challenge_server"):
+            # The answer has to be sent to the server, which sent the challenge
+            state = f"{state} {options.get('radius_challenge_server')}"
         reply_dict = {"attributes": {"state": transactionid}}
         validity = int(get_from_config("DefaultChallengeValidityTime", 120))
 
@@ -311,11 +325,15 @@ class RadiusTokenClass(RemoteTokenClass):
 
             for challengeobject in challengeobject_list:
                 if challengeobject.is_valid():
-                    state = binascii.unhexlify(challengeobject.data)
+                    state, _, challenge_server = challengeobject.data.partition(" ")
+                    state = binascii.unhexlify(state)
 
                     # challenge is still valid
                     radius_response = self._check_radius(
-                        passw, options=options, radius_state=state
+                        passw,
+                        options=options,
+                        radius_state=state,
+                        challenge_server=challenge_server or None,
                     )
                     if radius_response == AccessAccept:
                         # We found the matching challenge,
@@ -409,7 +427,10 @@ class RadiusTokenClass(RemoteTokenClass):
         result = options.get("radius_result")
         if result is None:
             radius_response = self._check_radius(
-                otpval, options=options, radius_state=state
+                otpval,
+                options=options,
+                radius_state=state,
+                challenge_server=options.get("radius_challenge_server"),
             )
         else:
             radius_response = result
@@ -440,18 +461,24 @@ class RadiusTokenClass(RemoteTokenClass):
 
     @log_with(log)
     @check_token_locked
-    def _check_radius(self, otpval, options=None, radius_state=None):
+    def _check_radius(
+        self, otpval, options=None, radius_state=None, challenge_server=None
+    ):
         """
         run the RADIUS request against the RADIUS server
 
         :param otpval: the OTP value
         :param options: additional token specific options
         :type options: dict
+        :param radius_state: the State of a previous Access-Challenge
+        :param challenge_server: the server, which sent the previous
+            Access-Challenge, like ``radius1:1812``
         :return: counter of the matching OTP value.
         :rtype: AccessAccept, AccessReject, AccessChallenge
         """
         result = AccessReject
         radius_message = None
+        radius_challenge_server = None
         if options is None:
             options = {}
 
@@ -462,12 +489,14 @@ class RadiusTokenClass(RemoteTokenClass):
         radius_timeout = 5
         radius_retries = 3
         radius_enforce_ma = False
+        radius_servers = None
         if radius_identifier:
             # New configuration
             radius_server_object = get_radius(radius_identifier)
             radius_server = radius_server_object.config.server
-            radius_port = radius_server_object.config.port
-            radius_server = f"{radius_server}:{radius_port}"
+            radius_servers = parse_radius_servers(
+                radius_server, radius_server_object.config.port or 1812
+            )
             radius_secret = radius_server_object.get_secret()
             radius_dictionary = radius_server_object.config.dictionary
             radius_timeout = int(radius_server_object.config.timeout or 10)
@@ -490,16 +519,7 @@ class RadiusTokenClass(RemoteTokenClass):
         )
 
         try:
-            # pyrad does not allow to set timeout and retries.
-            # it defaults to retries=3, timeout=5
-
-            # TODO: At the moment we support only one radius server.
-            # No round robin.
-            server = radius_server.split(":")
-            r_server = server[0]
-            r_authport = 1812
-            if len(server) >= 2:
-                r_authport = int(server[1])
+            servers = radius_servers or parse_radius_servers(radius_server)
             nas_identifier = get_from_config("radius.nas_identifier", "eduMFA")
             if not radius_dictionary:
                 radius_dictionary = get_from_config(
@@ -510,63 +530,40 @@ class RadiusTokenClass(RemoteTokenClass):
             )
             log.debug(
                 "constructing client object "
-                f"with server: {r_server!r}, port: {r_authport!r}, secret: {to_unicode(radius_secret)!r}"
-            )
-
-            srv = Client(
-                server=r_server,
-                authport=r_authport,
-                secret=to_bytes(radius_secret),
-                dict=Dictionary(radius_dictionary),
-            )
-
-            # Set retries and timeout of the client
-            srv.timeout = radius_timeout
-            srv.retries = radius_retries
-
-            req = srv.CreateAuthPacket(
-                code=pyrad.packet.AccessRequest,
-                User_Name=radius_user.encode("utf-8"),
-                NAS_Identifier=nas_identifier.encode("ascii"),
+                f"with servers: {servers!r}, secret: {to_unicode(radius_secret)!r}"
             )
 
-            if radius_enforce_ma:
-                req.add_message_authenticator()
-
-            req["User-Password"] = req.PwCrypt(otpval)
-
-            if radius_state:
-                req["State"] = radius_state
-                log.info(f"Sending saved challenge to radius server: {radius_state!r} ")
-
             try:
-                response = srv.SendPacket(req)
+                radius_response = send_radius_request(
+                    servers,
+                    to_bytes(radius_secret),
+                    Dictionary(radius_dictionary),
+                    nas_identifier,
+                    radius_user,
+                    otpval,
+                    timeout=radius_timeout,
+                    retries=radius_retries,
+                    enforce_ma=radius_enforce_ma,
+                    state=radius_state,
+                    challenge_server=(
+                        parse_radius_servers(challenge_server)[0]
+                        if challenge_server
+                        else None
+                    ),
+                )
             except Timeout:
                 log.warning(
-                    f"The remote RADIUS server {r_server} timeout out for user {radius_user}."
+                    f"The remote RADIUS server {radius_server} timeout out for user {radius_user}."
                 )
                 return AccessReject
-
-            message_authenticator_ok = True
-            if radius_enforce_ma:
-                # verify_message_authenticator() raises a generic exception
-                # if the M-A attribute is missing, so check for it first
-                if "Message-Authenticator" not in response:
-                    log.info(f"Radiusserver {r_server} sent no Message-Authenticator")
-                    message_authenticator_ok = False
-                elif not response.verify_message_authenticator(
-                    original_authenticator=req.authenticator
-                ):
-                    log.info(
-                        f"Radiusserver {r_server} sent broken Message-Authenticator"
-                    )
-                    message_authenticator_ok = False
+            r_server = radius_response.server
+            response = radius_response.packet
 
             # An unverifiable response is treated like a rejected one, so that
             # the option updates at the end of this method still happen. Bailing
             # out here would leave "radius_result" unset and make authenticate()
             # send a second request with the same OTP value.
-            if not message_authenticator_ok:
+            if not radius_response.authenticated:
                 radius_state = "<REJECTED>"
                 radius_message = "RADIUS authentication failed"
                 result = AccessReject
@@ -577,6 +574,9 @@ class RadiusTokenClass(RemoteTokenClass):
                     radius_state = response["State"][0]
                 if "Reply-Message" in response:
                     radius_message = response["Reply-Message"][0]
+                radius_challenge_server = format_radius_server(
+                    r_server, radius_response.port
+                )
 
                 result = AccessChallenge
             elif response.code == pyrad.packet.AccessAccept:
@@ -602,4 +602,5 @@ class RadiusTokenClass(RemoteTokenClass):
         options.update({"radius_result": result})
         options.update({"radius_state": radius_state})
         options.update({"radius_message": radius_message})
+        options.update({"radius_challenge_server": radius_challenge_server})
         return result
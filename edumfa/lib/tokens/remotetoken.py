@@ -46,6 +46,7 @@ from edumfa.lib import _
 from edumfa.lib.config import get_from_config
 from edumfa.lib.decorators import check_token_locked
 from edumfa.lib.edumfaserver import get_edumfaserver
+from edumfa.lib.httpsession import http_request
 from edumfa.lib.log import log_with
 from edumfa.lib.policy import ACTION, GROUP, SCOPE
 from edumfa.lib.policydecorators import challenge_response_allowed
@@ -306,8 +307,8 @@ class RemoteTokenClass(TokenClass):
                 # Deprecated
                 params["pass"] = otpval
                 request_url = f"{remoteServer}{remotePath}"
-                r = requests.post(
-                    request_url, data=params, verify=ssl_verify, timeout=60
+                r = http_request(
+                    "POST", request_url, data=params, verify=ssl_verify, timeout=60
                 )
             elif pi_server_obj:
                 r = pi_server_obj.validate_check(
@@ -397,7 +397,14 @@ class TotpTokenClass(HotpTokenClass):
             # No counter, so we take the current token_time
             counter = self._time2counter(server_time, timeStepping=self.timestep)
 
-        hmac2Otp = HmacOtp(secretHOtp, counter, otplen, self.get_hashlib(self.hashlib))
+        lookahead = self._get_lookahead_table()
+        hmac2Otp = HmacOtp(
+            secretHOtp,
+            counter,
+            otplen,
+            self.get_hashlib(self.hashlib),
+            lookahead=lookahead,
+        )
         res = hmac2Otp.checkOtp(anOtpVal, int(window / self.timestep), symmetric=True)
 
         if res != -1 and oCount != 0 and res <= oCount:
@@ -415,6 +422,8 @@ class TotpTokenClass(HotpTokenClass):
         if res != -1:
             # on success, we have to save the last attempt
             self.set_otp_count(res)
+            if lookahead is not None:
+                lookahead.advance(res)
             # We could also store it temporarily
             # self.auth_details["matched_otp_counter"] = res
 
@@ -590,6 +599,7 @@ class TotpTokenClass(HotpTokenClass):
 
             # The OTP value that was used for resync must not be used again!
             self.set_otp_count(res2 + 1)
+            self._invalidate_lookahead_table()
 
             ret = True
 
@@ -0,0 +1,338 @@
+#
+# License:  AGPLv3
+# This file is part of eduMFA. eduMFA is a fork of privacyIDEA which was forked from LinOTP.
+# Copyright (c) 2024 eduMFA Project-Team
+#
+# This code is free software; you can redistribute it and/or
+# modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or any later version.
+#
+# This code is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU AFFERO GENERAL PUBLIC LICENSE for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+__doc__ = """
+This module sends a request to one of several upstream servers, e.g. the
+RADIUS servers of a RADIUS server definition or the URLs of a remote eduMFA
+server definition.
+
+The latency and the health of every upstream are tracked. An upstream, which
+failed several times in a row, is considered down for some time and is only
+tried after the healthy upstreams. Depending on ``EDUMFA_UPSTREAM_FANOUT``,
+the next upstream is queried
+
+* ``"failover"`` (default): only if the previous upstream failed,
+* ``"hedge"``: if the previous upstream did not answer within its usual
+  latency (the ``EDUMFA_UPSTREAM_HEDGE_PERCENTILE`` of its latencies) or failed,
+* ``"parallel"``: at the same time.
+
+Hedging and parallel requests send the same request, e.g. an OTP value, to
+several upstreams, so they have to be enabled explicitly.
+
+The first successful answer is returned. A negative answer is only returned
+after all pending requests have finished, so that a slow acceptance is not
+overtaken by a fast rejection.
+
+There should only be one registry per application, which is stored in the
+app-local store.
+
+This module is tested in tests/test_lib_upstream.py.
+"""
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+
+from flask import current_app
+
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
+
+log = logging.getLogger(__name__)
+
+FANOUT_CONFIG_NAME = "EDUMFA_UPSTREAM_FANOUT"
+HEDGE_PERCENTILE_CONFIG_NAME = "EDUMFA_UPSTREAM_HEDGE_PERCENTILE"
+HEDGE_DELAY_CONFIG_NAME = "EDUMFA_UPSTREAM_HEDGE_DELAY"
+WORKERS_CONFIG_NAME = "EDUMFA_UPSTREAM_WORKERS"
+FANOUT_MODES = ("failover", "hedge", "parallel")
+DEFAULT_FANOUT = "failover"
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_DELAY = 2.0
+DEFAULT_WORKERS = 16
+# The number of latencies, which are kept per upstream, and the number of
+# latencies, which are needed to calculate the hedge delay
+LATENCY_SAMPLES = 100
+MIN_LATENCY_SAMPLES = 10
+# An upstream is considered down for DOWN_TIME seconds after MAX_FAILURES
+# consecutive failures
+MAX_FAILURES = 3
+DOWN_TIME = 30
+
+
+class UpstreamStats:
+    """
+    The latencies and the failures of one upstream.
+    """
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.down_until = 0
+
+    def percentile(self, percentile):
+        """
+        Return the given percentile of the latencies or None, if there are
+        not enough latencies.
+        """
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+
+class UpstreamRegistry:
+    """
+    Tracks the latency and the health of the upstreams and sends the requests
+    to several upstreams via a thread pool.
+    """
+
+    def __init__(
+        self,
+        fanout=DEFAULT_FANOUT,
+        hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+        hedge_delay=DEFAULT_HEDGE_DELAY,
+        workers=DEFAULT_WORKERS,
+    ):
+        if fanout not in FANOUT_MODES:
+            log.warning(f"Unknown upstream fan-out mode: {fanout!r}")
+            fanout = DEFAULT_FANOUT
+        self.fanout = fanout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.workers = workers
+        self._lock = Lock()
+        self._stats = {}
+        self._executor = None
+
+    def _get_stats(self, upstream):
+        # The lock has to be held by the caller
+        try:
+            return self._stats[upstream]
+        except KeyError:
+            return self._stats.setdefault(upstream, UpstreamStats())
+
+    def record(self, upstream, latency, ok):
+        """
+        Record the result of a request to an upstream.
+
+        :param upstream: the name of the upstream
+        :param latency: the duration of the request in seconds
+        :param ok: False, if the request failed
+        """
+        with self._lock:
+            stats = self._get_stats(upstream)
+            stats.requests += 1
+            if ok:
+                stats.latencies.append(latency)
+                if stats.down_until:
+                    log.info(f"The upstream {upstream!r} is available again.")
+                stats.consecutive_failures = 0
+                stats.down_until = 0
+            else:
+                stats.failures += 1
+                stats.consecutive_failures += 1
+                if stats.consecutive_failures >= MAX_FAILURES:
+                    if not stats.down_until:
+                        log.warning(
+                            f"The upstream {upstream!r} failed "
+                            f"{stats.consecutive_failures} times in a row."
+                        )
+                    stats.down_until = time.monotonic() + DOWN_TIME
+
+    def is_healthy(self, upstream):
+        with self._lock:
+            stats = self._stats.get(upstream)
+            return stats is None or stats.down_until <= time.monotonic()
+
+    def order(self, upstreams):
+        """
+        Return the upstreams in the order, in which they should be queried.
+        The healthy upstreams keep their configured order and are followed by
+        the upstreams, which are down.
+        """
+        healthy = [u for u in upstreams if self.is_healthy(u)]
+        return healthy + [u for u in upstreams if u not in healthy]
+
+    def get_hedge_delay(self, upstream):
+        """
+        Return the number of seconds, after which the next upstream is
+        queried, if the given upstream did not answer.
+        """
+        with self._lock:
+            stats = self._stats.get(upstream)
+            delay = stats.percentile(self.hedge_percentile) if stats else None
+        return self.hedge_delay if delay is None else delay
+
+    def get_stats(self):
+        """
+        Return the number of requests and failures, the health and the median
+        and hedge percentile of the latencies of every upstream.
+
+        :return: dict
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                upstream: {
+                    "requests": stats.requests,
+                    "failures": stats.failures,
+                    "healthy": stats.down_until <= now,
+                    "latency_median": stats.percentile(50),
+                    "latency_hedge": stats.percentile(self.hedge_percentile),
+                }
+                for upstream, stats in self._stats.items()
+            }
+
+    def _call(self, upstream, func):
+        start = time.monotonic()
+        try:
+            result = func(upstream)
+        except Exception:
+            self.record(upstream, time.monotonic() - start, False)
+            raise
+        self.record(upstream, time.monotonic() - start, True)
+        return result
+
+    def _submit(self, app, upstream, func):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="upstream"
+                )
+            executor = self._executor
+
+        def task():
+            with app.app_context():
+                return self._call(upstream, func)
+
+        return executor.submit(task)
+
+    def request(self, upstreams, func, is_success=None, fanout=None):
+        """
+        Call ``func(upstream)`` for the upstreams according to the fan-out
+        mode and return the first successful result.
+
+        ``func`` is run in a thread of the pool with an application context,
+        but without a request context. It must not access the database. An
+        exception raised by ``func`` counts as a failure of the upstream.
+
+        :param upstreams: the list of upstream names
+        :param func: a function, which sends the request to an upstream
+        :param is_success: a function, which returns True for a successful
+            result. By default, every result is successful.
+        :param fanout: overrides the configured fan-out mode, e.g.
+            "failover" for requests, which must not be sent twice.
+        :return: the first successful result or, if there is none, the first
+            result. If all upstreams failed, the last exception is raised.
+        """
+        is_success = is_success or (lambda result: True)
+        fanout = fanout or self.fanout
+        remaining = self.order(list(upstreams))
+        if len(remaining) == 1:
+            return self._call(remaining[0], func)
+
+        app = current_app._get_current_object()
+        pending = {}
+        answers = []
+        error = None
+
+        def launch():
+            upstream = remaining.pop(0)
+            log.debug(f"Sending request to upstream {upstream!r}")
+            pending[self._submit(app, upstream, func)] = upstream
+            return upstream
+
+        last = launch()
+        while fanout == "parallel" and remaining:
+            launch()
+        while pending:
+            timeout = None
+            if fanout == "hedge" and remaining and not answers:
+                timeout = self.get_hedge_delay(last)
+            done, _not_done = wait(
+                pending, timeout=timeout, return_when=FIRST_COMPLETED
+            )
+            if not done:
+                log.info(
+                    f"The upstream {last!r} did not answer within {timeout:.3f}s, "
+                    "sending a hedged request."
+                )
+                last = launch()
+                continue
+            for future in done:
+                upstream = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exx:
+                    log.warning(f"The request to upstream {upstream!r} failed: {exx!r}")
+                    error = exx
+                    if remaining and not answers and fanout != "parallel":
+                        last = launch()
+                    continue
+                if is_success(result):
+                    return result
+                answers.append(result)
+        if answers:
+            return answers[0]
+        raise error
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_upstream_registry():
+    """
+    Return the ``UpstreamRegistry`` of the current application.
+    If there is no such object yet, create one and write it to the app-local
+    store. This respects the ``EDUMFA_UPSTREAM_*`` config options.
+
+    :return: an ``UpstreamRegistry`` object
+    """
+    app_store = get_app_local_store()
+    try:
+        return app_store["upstream_registry"]
+    except KeyError:
+        registry = UpstreamRegistry(
+            fanout=get_app_config_value(FANOUT_CONFIG_NAME, DEFAULT_FANOUT),
+            hedge_percentile=float(
+                get_app_config_value(
+                    HEDGE_PERCENTILE_CONFIG_NAME, DEFAULT_HEDGE_PERCENTILE
+                )
+            ),
+            hedge_delay=float(
+                get_app_config_value(HEDGE_DELAY_CONFIG_NAME, DEFAULT_HEDGE_DELAY)
+            ),
+            workers=int(get_app_config_value(WORKERS_CONFIG_NAME, DEFAULT_WORKERS)),
+        )
+        log.info(f"Created a new upstream registry: {registry!r}")
+        return app_store.setdefault("upstream_registry", registry)
+
+
+def upstream_request(upstreams, func, is_success=None, fanout=None):
+    """
+    Shortcut to send a request via the application-global upstream registry.
+    See ``UpstreamRegistry.request``.
+    """
+    return get_upstream_registry().request(upstreams, func, is_success, fanout)
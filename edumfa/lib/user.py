@@ -51,7 +51,13 @@ from .realm import (
     realm_is_defined,
 )
 from .resolver import get_resolver_object, get_resolver_type
-from .usercache import cache_username, delete_user_cache, user_cache, user_init
+from .usercache import (
+    cache_username,
+    delete_user_cache,
+    is_cache_enabled,
+    user_cache,
+    user_init,
+)
 
 log = logging.getLogger(__name__)
 
@@ -787,6 +793,29 @@ def get_username(userid, resolvername):
     return username
 
 
+@log_with(log)
+def get_usernames(userids, resolvername):
+    """
+    Determine the usernames for a list of ids in a resolver.
+    The resolver looks up the users with as few requests as possible.
+    If the user cache is enabled, the usernames are read from the user cache.
+
+    :param userids: The ids of the users in the resolver
+    :type userids: list
+    :param resolvername: The name of the resolver
+    :return: dictionary with the userids as keys and the usernames as values.
+        If a user does not exist, the username is "".
+    :rtype: dict
+    """
+    if is_cache_enabled():
+        return {userid: get_username(userid, resolvername) for userid in userids}
+    usernames = {}
+    y = get_resolver_object(resolvername)
+    if y:
+        usernames = y.getUsernames([userid for userid in userids if userid])
+    return {userid: usernames.get(userid, "") for userid in userids}
+
+
 def log_used_user(user, other_text=""):
     """
     This creates a log message combined of a user and another text.
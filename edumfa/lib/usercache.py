@@ -22,14 +22,114 @@
 import datetime
 import functools
 import logging
+import time
+from collections import OrderedDict
+from threading import Lock
 
 from sqlalchemy import and_
 
 from edumfa.lib.config import get_from_config
+from edumfa.lib.framework import get_app_config_value, get_app_local_store
 from edumfa.models import UserCache, db
 
 log = logging.getLogger(__name__)
 EXPIRATION_SECONDS = "UserCacheExpiration"
+HOT_CACHE_SIZE_CONFIG_NAME = "EDUMFA_USER_CACHE_HOT_SIZE"
+HOT_CACHE_TTL_CONFIG_NAME = "EDUMFA_USER_CACHE_HOT_TTL"
+DEFAULT_HOT_CACHE_TTL = 30
+
+
+class HotUserCache:
+    """
+    A process-local tier in front of the ``usercache`` table, which saves
+    the database round trip for users that are looked up repeatedly.
+
+    Entries are stored by ``("login", used_login, resolver)`` and by
+    ``("uid", user_id, resolver)``. The cache holds at most ``size`` entries
+    for at most ``ttl`` seconds, but never longer than the corresponding
+    entry in the database is valid.
+    """
+
+    def __init__(self, size, ttl=DEFAULT_HOT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Return the cached ``(username, resolver, user_id)`` for the given key.
+
+        :param key: a tuple ``("login", used_login, resolver)`` or
+            ``("uid", user_id, resolver)``
+        :return: tuple or None, if the key is not cached or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expiry, timestamp, value = entry
+            if (
+                expiry < time.monotonic()
+                or timestamp < datetime.datetime.now() - get_cache_time()
+            ):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, username, used_login, resolver, user_id, timestamp):
+        """
+        Store an entry of the user cache under both keys.
+
+        :param timestamp: the timestamp of the entry in the database
+        """
+        value = (username, resolver, user_id)
+        expiry = time.monotonic() + self.ttl
+        with self._lock:
+            for key in (("login", used_login, resolver), ("uid", user_id, resolver)):
+                self._entries[key] = (expiry, timestamp, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, resolver=None, username=None):
+        """
+        Remove all entries of the given resolver and/or username.
+        If no parameter is given, all entries are removed.
+        """
+        with self._lock:
+            if resolver is None and username is None:
+                self._entries.clear()
+                return
+            for key, (_expiry, _timestamp, value) in list(self._entries.items()):
+                if (resolver is None or value[1] == resolver) and (
+                    username is None or value[0] == username
+                ):
+                    del self._entries[key]
+
+
+def get_hot_user_cache():
+    """
+    Return the ``HotUserCache`` of the current application, if it is enabled
+    via ``EDUMFA_USER_CACHE_HOT_SIZE``.
+
+    :return: a ``HotUserCache`` object or None
+    """
+    size = int(get_app_config_value(HOT_CACHE_SIZE_CONFIG_NAME, 0))
+    if size <= 0:
+        return None
+    app_store = get_app_local_store()
+    try:
+        return app_store["hot_user_cache"]
+    except KeyError:
+        cache = HotUserCache(
+            size,
+            ttl=int(
+                get_app_config_value(HOT_CACHE_TTL_CONFIG_NAME, DEFAULT_HOT_CACHE_TTL)
+            ),
+        )
+        return app_store.setdefault("hot_user_cache", cache)
 
 
 class user_cache:
@@ -107,6 +207,10 @@ def delete_user_cache(resolver=None, username=None, expired=None):
     )
     rowcount = db.session.query(UserCache).filter(filter_condition).delete()
     db.session.commit()
+    hot_cache = get_hot_user_cache()
+    if hot_cache is not None and not expired:
+        # Expired entries are not returned by the hot cache anyway
+        hot_cache.delete(resolver=resolver, username=username)
     log.info(
         f"Deleted {rowcount} entries from the user cache (resolver={resolver!r}, username={username!r}, expired={expired!r})"
     )
@@ -130,6 +234,9 @@ def add_to_cache(username, used_login, resolver, user_id):
             f"Adding record to cache: ({username!r}, {used_login!r}, {resolver!r}, {user_id!r}, {timestamp!r})"
         )
         record.save()
+        hot_cache = get_hot_user_cache()
+        if hot_cache is not None:
+            hot_cache.put(username, used_login, resolver, user_id, timestamp)
 
 
 def retrieve_latest_entry(filter_condition):
@@ -145,6 +252,56 @@ def retrieve_latest_entry(filter_condition):
     )
 
 
+def retrieve_latest_logins(used_login, resolvers):
+    """
+    Return the most recently added, non-expired entries in the user cache for
+    the given login name in each of the given resolvers. The process-local hot
+    cache is checked first, the remaining resolvers are looked up with a
+    single query.
+
+    :param used_login: login name that was used in request
+    :param resolvers: list of resolver names, ordered by priority
+    :return: dict of resolver name to a tuple ``(username, resolver, user_id)``
+    """
+    entries = {}
+    missing = []
+    hot_cache = get_hot_user_cache()
+    for resolvername in resolvers:
+        value = (
+            hot_cache.get(("login", used_login, resolvername)) if hot_cache else None
+        )
+        if value:
+            entries[resolvername] = value
+            # Resolvers with a lower priority are not considered anyway
+            break
+        missing.append(resolvername)
+    if missing:
+        filter_condition = and_(
+            create_filter(used_login=used_login), UserCache.resolver.in_(missing)
+        )
+        for result in (
+            UserCache.query.filter(filter_condition)
+            .order_by(UserCache.timestamp.desc())
+            .all()
+        ):
+            if result.resolver in entries:
+                continue
+            entries[result.resolver] = (
+                result.username,
+                result.resolver,
+                result.user_id,
+            )
+            if hot_cache is not None:
+                hot_cache.put(
+                    result.username,
+                    result.used_login,
+                    result.resolver,
+                    result.user_id,
+                    result.timestamp,
+                )
+    return entries
+
+
 def create_filter(
     username=None, used_login=None, resolver=None, user_id=None, expired=False
 ):
@@ -189,11 +346,26 @@ def cache_username(wrapped_function, userid, resolvername):
     After a successful lookup, the entry is added to the cache.
     """
 
-    # try to fetch the record from the UserCache
+    # try to fetch the record from the hot cache or the UserCache
+    hot_cache = get_hot_user_cache()
+    value = hot_cache.get(("uid", userid, resolvername)) if hot_cache else None
+    if value:
+        log.debug(
+            f"Found username of {userid!r}/{resolvername!r} in hot cache: {value[0]!r}"
+        )
+        return value[0]
     filter_conditions = create_filter(user_id=userid, resolver=resolvername)
     result = retrieve_latest_entry(filter_conditions)
     if result:
         username = result.username
+        if hot_cache is not None:
+            hot_cache.put(
+                username,
+                result.used_login,
+                resolvername,
+                userid,
+                result.timestamp,
+            )
         log.debug(
             f"Found username of {userid!r}/{resolvername!r} in cache: {username!r}"
         )
@@ -220,17 +392,13 @@ def user_init(wrapped_function, self):
     else:
         # In order to query the user cache, we need to find out the resolver
         resolvers = self.get_ordererd_resolvers()
+    # Fetch the cached entries of all resolvers at once
+    cached_entries = retrieve_latest_logins(self.used_login, resolvers)
     for resolvername in resolvers:
-        # If we could figure out a resolver, we can query the user cache
-        filter_conditions = create_filter(
-            used_login=self.used_login, resolver=resolvername
-        )
-        result = retrieve_latest_entry(filter_conditions)
+        result = cached_entries.get(resolvername)
         if result:
             # Cached user exists, retrieve information and exit early
-            self.login = result.username
-            self.resolver = result.resolver
-            self.uid = result.user_id
+            self.login, self.resolver, self.uid = result
             return
         else:
             # If the user does not exist in the cache, we actually query the resolver
@@ -1,4 +1,7 @@
+from functools import lru_cache
+
 import bcrypt
+from passlib.context import CryptContext
 
 from edumfa.lib.utils import to_bytes
 
@@ -33,3 +36,29 @@ def verify_with_crypt_context(
         password_bytes = to_bytes(password)[:72]
         hash_bytes = to_bytes(password_hash)
         return bcrypt.checkpw(password_bytes, hash_bytes)
+
+
+@lru_cache(maxsize=16)
+def _get_crypt_context(schemes):
+    return CryptContext(list(schemes))
+
+
+def verify_with_schemes(schemes, password, password_hash):
+    """
+    Verify a password hash with a CryptContext of the given hash algorithms.
+
+    Contrary to ``verify_with_crypt_context`` all arguments can be pickled,
+    so it can be run in a worker process of the KDF pool.
+
+    :param schemes: the hash algorithms of the context
+    :type schemes: tuple
+    :param password: plaintext password to verify
+    :type password: str | bytes
+    :param password_hash: encoded password hash from storage
+    :type password_hash: str | bytes
+    :return: True if the password matches, otherwise False
+    :rtype: bool
+    """
+    return verify_with_crypt_context(
+        _get_crypt_context(tuple(schemes)), password, password_hash
+    )
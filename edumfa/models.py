@@ -26,12 +26,13 @@
 import binascii
 import logging
 import traceback
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from json import dumps, loads
 
 from dateutil.tz import tzutc
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import BigInteger, and_
+from sqlalchemy import BigInteger, and_, inspect
 from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.compiler import compiles
@@ -66,6 +67,9 @@ log = logging.getLogger(__name__)
 implicit_returning = True
 EDUMFA_TIMESTAMP = "__timestamp__"
 SAFE_STORE = "EDUMFA_DB_SAFE_STORE"
+TOKEN_UNIT_OF_WORK = "EDUMFA_TOKEN_UNIT_OF_WORK"
+# The key in the session info, which marks an active token unit of work
+TOKEN_UNIT_OF_WORK_KEY = "edumfa_token_unit_of_work"
 
 BigIntegerType = (
     BigInteger()
@@ -127,6 +131,10 @@ def save_config_timestamp(invalidate_config=True):
             Description="config timestamp. last changed.",
         )
         db.session.add(new_timestamp)
+    # Announce the change to the other processes after the commit
+    from edumfa.lib.configchannel import mark_config_changed
+
+    mark_config_changed(db.session)
     if invalidate_config:
         # We have just modified the config. From now on, the request handling
         # should operate on the *new* config. Hence, we need to invalidate
@@ -138,6 +146,51 @@ def save_config_timestamp(invalidate_config=True):
         invalidate_config_object()
 
 
+@contextmanager
+def token_unit_of_work(force=False):
+    """
+    Buffer the modifications of the token state (counters, fail counters,
+    token info, owners and realms) and write them to the database in one transaction
+    at the end of the block. Without a unit of work every modification is
+    committed on its own.
+
+    The unit of work is only active, if ``EDUMFA_TOKEN_UNIT_OF_WORK`` is set
+    or if ``force`` is set. Nested units of work are merged into the
+    outermost one. It can be used as a context manager or as a decorator.
+    """
+    session = db.session
+    if session.info.get(TOKEN_UNIT_OF_WORK_KEY) or not (
+        force or get_app_config_value(TOKEN_UNIT_OF_WORK, False)
+    ):
+        yield
+        return
+    session.info[TOKEN_UNIT_OF_WORK_KEY] = True
+    try:
+        yield
+    except Exception:
+        session.info.pop(TOKEN_UNIT_OF_WORK_KEY, None)
+        # Without a unit of work, the modifications that were done before the
+        # error would already be written to the database.
+        try:
+            session.commit()
+        except Exception as exx:  # pragma: no cover
+            log.warning(f"Could not write the buffered token state: {exx}")
+            session.rollback()
+        raise
+    session.info.pop(TOKEN_UNIT_OF_WORK_KEY, None)
+    session.commit()
+
+
+def commit_token_state():
+    """
+    Commit the modifications of the token state, unless a token unit of work
+    is active. In this case the modifications are committed at the end of
+    the unit of work.
+    """
+    if not db.session.info.get(TOKEN_UNIT_OF_WORK_KEY):
+        db.session.commit()
+
+
 class TimestampMethodsMixin:
     """
     This class mixes in the table functions including update of the timestamp
@@ -202,6 +255,11 @@ class Token(MethodsMixin, db.Model):
     info_list = db.relationship("TokenInfo", lazy="select", backref="token")
     # This creates an attribute "token" in the TokenOwner object
     owners = db.relationship("TokenOwner", lazy="dynamic", backref="token")
+    # The dynamic "owners" can not be loaded eagerly, so this read-only list
+    # is used by the token load profiles
+    owner_list = db.relationship(
+        "TokenOwner", lazy="select", viewonly=True, order_by="TokenOwner.id"
+    )
 
     def __init__(
         self,
@@ -250,8 +308,19 @@ class Token(MethodsMixin, db.Model):
 
     @property
     def first_owner(self):
+        if "owner_list" not in inspect(self).unloaded:
+            # The owners have already been loaded
+            return self.owner_list[0] if self.owner_list else None
         return self.owners.first()
 
+    def save(self):
+        db.session.add(self)
+        if self.id is None:
+            # We need the id of a new token
+            db.session.flush()
+        commit_token_state()
+        return self.id
+
     @log_with(log)
     def delete(self):
         # some DBs (e.g. DB2) run in deadlock, if the TokenRealm entry
@@ -266,7 +335,7 @@ class Token(MethodsMixin, db.Model):
             TokenTokengroup.token_id == self.id
         ).delete()
         db.session.delete(self)
-        db.session.commit()
+        commit_token_state()
         return ret
 
     @staticmethod
@@ -359,7 +428,7 @@ class Token(MethodsMixin, db.Model):
                     # If the realm is not yet attached to the token
                     Tr = TokenRealm(token_id=self.id, realm_id=r.id)
                     db.session.add(Tr)
-        db.session.commit()
+        commit_token_state()
 
     def get_realms(self):
         """
@@ -596,10 +665,29 @@ class Token(MethodsMixin, db.Model):
         for k, v in info.items():
             if k.endswith(".type"):
                 types[".".join(k.split(".")[:-1])] = v
-        for k, v in info.items():
-            if not k.endswith(".type"):
-                TokenInfo(self.id, k, v, Type=types.get(k)).save(persistent=False)
-        db.session.commit()
+        keys = [k for k in info if not k.endswith(".type")]
+        # Read all existing entries at once and update or insert them in
+        # one flush
+        existing = {
+            ti.Key: ti
+            for ti in TokenInfo.query.filter(
+                TokenInfo.token_id == self.id, TokenInfo.Key.in_(keys)
+            )
+        }
+        new_entries = [
+            TokenInfo(self.id, k, info[k], Type=types.get(k))
+            for k in keys
+            if k not in existing
+        ]
+        for k, ti in existing.items():
+            ti.Value = convert_column_to_unicode(info[k])
+            ti.Type = types.get(k)
+            ti.Description = None
+        if new_entries:
+            db.session.add_all(new_entries)
+            # The new entries are not yet part of the loaded info list
+            db.session.expire(self, ["info_list"])
+        commit_token_state()
 
     def del_info(self, key=None):
         """
@@ -613,8 +701,14 @@ class Token(MethodsMixin, db.Model):
             tokeninfos = TokenInfo.query.filter_by(token_id=self.id, Key=key)
         else:
             tokeninfos = TokenInfo.query.filter_by(token_id=self.id)
+        deleted = False
         for ti in tokeninfos:
-            ti.delete()
+            db.session.delete(ti)
+            deleted = True
+        if deleted:
+            # The deleted entries would otherwise stay in the loaded info list
+            db.session.expire(self, ["info_list"])
+            commit_token_state()
 
     def del_tokengroup(self, tokengroup=None, tokengroup_id=None):
         """
@@ -725,7 +819,7 @@ class TokenInfo(MethodsMixin, db.Model):
         if ti is None:
             # create a new one
             db.session.add(self)
-            db.session.commit()
+            commit_token_state()
             if get_app_config_value(SAFE_STORE, False):
                 ti = ti_func()
                 ret = ti.id
@@ -742,7 +836,7 @@ class TokenInfo(MethodsMixin, db.Model):
             )
             ret = ti.id
         if persistent:
-            db.session.commit()
+            commit_token_state()
         return ret
 
 
@@ -1243,7 +1337,7 @@ class TokenOwner(MethodsMixin, db.Model):
         if to is None:
             # This very assignment does not exist, yet:
             db.session.add(self)
-            db.session.commit()
+            commit_token_state()
             if get_app_config_value(SAFE_STORE, False):
                 to = to_func()
                 ret = to.id
@@ -1254,7 +1348,7 @@ class TokenOwner(MethodsMixin, db.Model):
             # There is nothing to update
 
         if persistent:
-            db.session.commit()
+            commit_token_state()
         return ret
 
 
@@ -1543,18 +1637,44 @@ class Challenge(MethodsMixin, db.Model):
         return f"{descr}"
 
 
-def cleanup_challenges():
+def cleanup_challenges(chunk_size=None):
     """
     Delete all challenges, that have expired.
 
-    :return: None
+    :param chunk_size: If this is set, the challenges are deleted in chunks of
+        this size. Each chunk is deleted in its own transaction, so that the
+        table is not locked for a long time.
+    :type chunk_size: int
+    :return: the number of deleted challenges
     """
     c_now = datetime.utcnow()
+    deleted = 0
     try:
-        Challenge.query.with_for_update().filter(Challenge.expiration < c_now).delete()
-        db.session.commit()
+        if not chunk_size:
+            deleted = (
+                Challenge.query.with_for_update()
+                .filter(Challenge.expiration < c_now)
+                .delete()
+            )
+            db.session.commit()
+            return deleted
+        while True:
+            ids = [
+                row.id
+                for row in db.session.query(Challenge.id)
+                .filter(Challenge.expiration < c_now)
+                .limit(chunk_size)
+            ]
+            if ids:
+                deleted += Challenge.query.filter(Challenge.id.in_(ids)).delete(
+                    synchronize_session=False
+                )
+            db.session.commit()
+            if len(ids) < chunk_size:
+                break
     except (OperationalError, IntegrityError) as e:
         log.warning(f"Error in cleanup_challenges: {e}")
+    return deleted
 
 
 # -----------------------------------------------------------------------------
@@ -2999,14 +3119,24 @@ class AuthCache(MethodsMixin, db.Model):
     # We can hash the password like this:
     # binascii.hexlify(hashlib.sha256("secret123456").digest())
     authentication = db.Column(db.Unicode(255), default="")
+    # A keyed fingerprint of the credentials to find the matching entry by index
+    fingerprint = db.Column(db.Unicode(64), index=True)
 
     def __init__(
-        self, username, realm, resolver, authentication, first_auth=None, last_auth=None
+        self,
+        username,
+        realm,
+        resolver,
+        authentication,
+        first_auth=None,
+        last_auth=None,
+        fingerprint=None,
     ):
         self.username = username
         self.realm = realm
         self.resolver = resolver
         self.authentication = authentication
+        self.fingerprint = fingerprint
         self.first_auth = first_auth if first_auth else datetime.utcnow()
         self.last_auth = last_auth if last_auth else self.first_auth
 
@@ -0,0 +1,40 @@
+"""Add fingerprint to authcache
+
+Revision ID: 3f1c2d7e8a90
+Revises: 9cad6f046bd2
+Create Date: 2026-10-18 10:12:41.381207
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "3f1c2d7e8a90"
+down_revision = "9cad6f046bd2"
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.exc import InternalError, OperationalError, ProgrammingError
+
+
+def upgrade():
+    try:
+        op.add_column(
+            "authcache",
+            sa.Column("fingerprint", sa.Unicode(length=64), nullable=True),
+        )
+        op.create_index(
+            op.f("ix_authcache_fingerprint"),
+            "authcache",
+            ["fingerprint"],
+            unique=False,
+        )
+    except (OperationalError, ProgrammingError, InternalError) as exx:
+        print("Looks like the fingerprint already exists in the authcache table.")
+        print(exx)
+    except Exception as exx:
+        print("Could not add fingerprint to authcache table.")
+        print(exx)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_authcache_fingerprint"), table_name="authcache")
+    op.drop_column("authcache", "fingerprint")
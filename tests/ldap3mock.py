@@ -470,19 +470,11 @@ class Connection:
         for condition in this_filter:
             search_filter.remove(condition)
 
-        try:
-            search_filter = list(search_filter[0])
-            for sub_filter in search_filter:
-                if not isinstance(sub_filter, list):
-                    candidates = self.operation.get(sub_filter)(
-                        base, search_filter, candidates
-                    )
-                else:
-                    candidates = self.operation.get(sub_filter[0])(
-                        base, sub_filter, candidates
-                    )
-        except IndexError:
-            pass
+        # All remaining conditions are nested filters
+        for sub_filter in search_filter:
+            candidates = self.operation.get(sub_filter[0])(
+                base, list(sub_filter), candidates
+            )
 
         candidates = self._invert_results(candidates)
 
@@ -630,9 +622,8 @@ class Connection:
             # Just for debugging purposes
             s = f"{exx}"
 
-        for item in s_filter:
-            if item[0] in self.operation:
-                candidates = self.operation.get(item[0])(search_base, s_filter)
+        if s_filter and s_filter[0] in self.operation:
+            candidates = self.operation.get(s_filter[0])(search_base, s_filter)
         self.response = Connection._deDuplicate(candidates)
 
         return True
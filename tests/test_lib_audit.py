@@ -10,13 +10,20 @@ import types
 from unittest import mock
 
 import sqlalchemy.engine
+from sqlalchemy import event
 from testfixtures import log_capture
 
 from edumfa.config import TestingConfig
 from edumfa.lib.audit import getAudit, search
 from edumfa.lib.auditmodules.containeraudit import Audit as ContainerAudit
 from edumfa.lib.auditmodules.loggeraudit import Audit as LoggerAudit
-from edumfa.lib.auditmodules.sqlaudit import column_length
+from edumfa.lib.auditmodules.sqlaudit import (
+    AuditWriter,
+    column_length,
+    write_log_entries,
+)
+from edumfa.lib.framework import get_app_local_store
+from edumfa.models import Audit as LogEntry
 
 from .base import MyTestCase, OverrideConfigTestCase
 
@@ -370,6 +377,93 @@ class AuditTestCase(MyTestCase):
             audit_log.auditdata[0].keys(),
         )
 
+    def test_12_async_audit(self):
+        self.app.config["EDUMFA_AUDIT_ASYNC"] = True
+        self.app.config["EDUMFA_AUDIT_ASYNC_BATCH_SIZE"] = 2
+        audit = getAudit(self.app.config)
+        writer = audit._get_writer()
+        self.assertIs(getAudit(self.app.config)._get_writer(), writer)
+        for i in range(5):
+            audit.log({"action": "test12", "serial": f"async{i}", "success": True})
+            audit.finalize_log()
+        writer.flush()
+        audit_log = self.Audit.search({"action": "test12"})
+        self.assertEqual(audit_log.total, 5)
+        self.assertEqual(
+            {entry.get("serial") for entry in audit_log.auditdata},
+            {f"async{i}" for i in range(5)},
+        )
+        for entry in audit_log.auditdata:
+            self.assertEqual(entry.get("sig_check"), "OK")
+        # the writer writes the waiting entries, when it is stopped
+        audit.log({"action": "test12", "serial": "async5"})
+        audit.finalize_log()
+        writer.stop()
+        self.assertEqual(self.Audit.search({"action": "test12"}).total, 6)
+        get_app_local_store().pop("sqlaudit.writer")
+        self.app.config.pop("EDUMFA_AUDIT_ASYNC")
+        self.app.config.pop("EDUMFA_AUDIT_ASYNC_BATCH_SIZE")
+
+        # a full queue drops entries, if the writer does not block
+        writer = AuditWriter(audit.engine, queue_size=1, block=False)
+        writer.put(LogEntry(action="test12"))
+        writer.put(LogEntry(action="test12"))
+        self.assertEqual(writer.dropped, 1)
+        self.assertEqual(writer.queue.qsize(), 1)
+
+    def test_13_batch_signature(self):
+        entries = [LogEntry(action="test13", serial=f"batch{i}") for i in range(3)]
+        selects = []
+
+        def count_select(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith("SELECT"):
+                selects.append(statement)
+
+        event.listen(self.Audit.engine, "before_cursor_execute", count_select)
+        try:
+            write_log_entries(
+                self.Audit.session, entries, self.Audit.sign_object, batch_sign=True
+            )
+        finally:
+            event.remove(self.Audit.engine, "before_cursor_execute", count_select)
+        # the entries are read back with a single query
+        self.assertEqual(len(selects), 1)
+        db_entries = list(self.Audit.search_query({"action": "test13"}))
+        self.assertEqual(len(db_entries), 3)
+        # all entries of the batch share one signature
+        self.assertEqual(len({le.signature for le in db_entries}), 1)
+        self.assertTrue(db_entries[0].signature.startswith("merkle:"))
+        audit_log = self.Audit.search({"action": "test13"})
+        self.assertEqual(
+            [entry.get("sig_check") for entry in audit_log.auditdata], ["OK"] * 3
+        )
+        self.assertEqual(audit_log.auditdata[1].get("missing_line"), "OK")
+        # the batch was only verified once
+        self.assertEqual(len(self.Audit.verified_batches), 1)
+
+        # a modified entry invalidates the signature of the batch
+        db_entries[1].serial = "modified"
+        self.Audit.session.merge(db_entries[1])
+        self.Audit.session.commit()
+        audit_log = self.Audit.search({"action": "test13"})
+        self.assertEqual(
+            [entry.get("sig_check") for entry in audit_log.auditdata], ["FAIL"] * 3
+        )
+
+        # a deleted entry also invalidates the batch
+        entries = [LogEntry(action="test13b", serial=f"batch{i}") for i in range(3)]
+        write_log_entries(
+            self.Audit.session, entries, self.Audit.sign_object, batch_sign=True
+        )
+        self.Audit.session.query(LogEntry).filter(
+            LogEntry.action == "test13b", LogEntry.serial == "batch2"
+        ).delete()
+        self.Audit.session.commit()
+        audit_log = self.Audit.search({"action": "test13b"})
+        self.assertEqual(
+            [entry.get("sig_check") for entry in audit_log.auditdata], ["FAIL"] * 2
+        )
+
 
 class AuditColumnLengthTestCase(OverrideConfigTestCase):
     class Config(TestingConfig):
@@ -9,10 +9,12 @@ import datetime
 from passlib.hash import argon2
 
 from edumfa.lib.authcache import (
+    _fingerprint,
     _hash_password,
     add_to_cache,
     cleanup,
     delete_from_cache,
+    delete_unindexed_entries,
     update_cache,
     verify_in_cache,
 )
@@ -231,3 +233,64 @@ class AuthCacheTestCase(MyTestCase):
 
         auth = AuthCache.query.filter(AuthCache.username == self.username).first()
         self.assertEqual(auth, None)
+
+    def test_07_fingerprint(self):
+        # Remove the entries of the previous tests
+        AuthCache.query.delete()
+        r1 = add_to_cache(self.username, self.realm, self.resolver, self.password)
+        auth = AuthCache.query.filter(AuthCache.id == r1).first()
+        self.assertEqual(
+            auth.fingerprint,
+            _fingerprint(self.username, self.realm, self.resolver, self.password),
+        )
+        self.assertNotEqual(
+            auth.fingerprint,
+            _fingerprint(self.username, self.realm, self.resolver, "other"),
+        )
+        # The fingerprint depends on the key
+        self.app.config["EDUMFA_AUTH_CACHE_KEY"] = "other key"
+        self.assertNotEqual(
+            auth.fingerprint,
+            _fingerprint(self.username, self.realm, self.resolver, self.password),
+        )
+        self.app.config.pop("EDUMFA_AUTH_CACHE_KEY")
+
+        # An entry without fingerprint is still verified
+        now = datetime.datetime.utcnow()
+        legacy = AuthCache(
+            "legacy",
+            self.realm,
+            self.resolver,
+            _hash_password("legacy password"),
+            first_auth=now,
+            last_auth=now,
+        )
+        legacy.save()
+        self.assertIsNone(legacy.fingerprint)
+        self.assertTrue(
+            verify_in_cache(
+                "legacy",
+                self.realm,
+                self.resolver,
+                "legacy password",
+                first_auth=now - datetime.timedelta(minutes=5),
+            )
+        )
+        self.assertTrue(
+            verify_in_cache(
+                self.username,
+                self.realm,
+                self.resolver,
+                self.password,
+                first_auth=now - datetime.timedelta(minutes=5),
+            )
+        )
+
+        # Only the unindexed entry is deleted
+        self.assertEqual(delete_unindexed_entries(), 1)
+        self.assertEqual(AuthCache.query.filter_by(username="legacy").count(), 0)
+        self.assertEqual(AuthCache.query.filter(AuthCache.id == r1).count(), 1)
+        self.assertEqual(
+            delete_from_cache(self.username, self.realm, self.resolver, self.password),
+            1,
+        )
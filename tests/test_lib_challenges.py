@@ -4,12 +4,38 @@ This test file tests the lib.challenge methods.
 This tests the token functions on an interface level
 """
 
+import datetime
+import os
+import socket
+import tempfile
+
+from sqlalchemy import update
+
 from edumfa.lib import _
-from edumfa.lib.challenge import extract_answered_challenges, get_challenges
+from edumfa.lib.challenge import (
+    ChallengeCache,
+    extract_answered_challenges,
+    get_challenge_cache,
+    get_challenges,
+    get_open_challenges,
+)
+from edumfa.lib.challengechannel import (
+    LocalChallengeChannel,
+    SocketChallengeChannel,
+    get_challenge_channel,
+    mark_challenge_changed,
+)
 from edumfa.lib.error import ParameterError, TokenAdminError
+from edumfa.lib.framework import get_app_local_store
 from edumfa.lib.policy import ACTION, SCOPE, delete_policy, set_policy
-from edumfa.lib.token import init_token
-from edumfa.models import Challenge, db
+from edumfa.lib.token import (
+    check_serial_pass,
+    check_user_pass,
+    init_token,
+    remove_token,
+)
+from edumfa.lib.user import User
+from edumfa.models import Challenge, cleanup_challenges, db
 
 from .base import MyTestCase
 
@@ -78,3 +104,199 @@ class ChallengeTestCase(MyTestCase):
         self.assertEqual(len(challenges), 2)
         self.assertEqual(len(answered), 1)
         self.assertEqual(answered[0].transaction_id, transaction_id1)
+
+    def test_03_challenge_channel(self):
+        channel = get_challenge_channel()
+        self.assertIsInstance(channel, LocalChallengeChannel)
+        self.assertIs(channel, get_challenge_channel())
+        chal = Challenge("CHAL3", transaction_id="tid3", challenge="c3")
+        chal.save()
+        with channel.subscribe("tid3") as answered, channel.subscribe("tid4") as other:
+            self.assertFalse(answered.is_set())
+            # The answer is announced after the commit
+            chal.set_otp_status(True)
+            db.session.flush()
+            self.assertFalse(answered.is_set())
+            chal.save()
+            self.assertTrue(answered.is_set())
+            self.assertFalse(other.is_set())
+            # A rolled back change is not announced
+            mark_challenge_changed(db.session, "tid4")
+            db.session.rollback()
+            db.session.commit()
+            self.assertFalse(other.is_set())
+        self.assertEqual(channel._waiters, {})
+        chal.delete()
+
+    def test_04_socket_challenge_channel(self):
+        with tempfile.TemporaryDirectory() as directory:
+            channel = SocketChallengeChannel(directory)
+            # Another process of the node
+            other = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            other.bind(os.path.join(directory, "1.sock"))
+            other.settimeout(5)
+            # A process, which does not exist anymore
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            stale.bind(os.path.join(directory, "2.sock"))
+            stale.close()
+            changed = []
+            try:
+                channel.add_listener(lambda *args: changed.append(args))
+                with channel.subscribe("tid5") as answered:
+                    socket_name = os.path.join(directory, f"{os.getpid()}.sock")
+                    self.assertTrue(os.path.exists(socket_name))
+                    channel.notify("tid5", "CHAL5")
+                    self.assertTrue(answered.is_set())
+                    self.assertEqual(other.recv(256), b"tid5\nCHAL5")
+                    self.assertFalse(os.path.exists(os.path.join(directory, "2.sock")))
+                    # A notification of another process wakes the waiting request
+                    answered.clear()
+                    other.sendto(b"tid5\n", channel._socket_name)
+                    self.assertTrue(answered.wait(5))
+                receiver = channel._thread
+            finally:
+                channel.close()
+                other.close()
+            # The receiver thread is stopped and the socket is removed
+            self.assertFalse(receiver.is_alive())
+            self.assertFalse(os.path.exists(socket_name))
+            self.assertEqual(changed, [("tid5", "CHAL5"), ("tid5", None)])
+
+            # Without a configured channel, the socket channel is used, if
+            # the directory is writable
+            self.app.config["EDUMFA_CHALLENGE_CHANNEL_DIR"] = directory
+            get_app_local_store().pop("challenge_channel", None)
+            try:
+                channel = get_challenge_channel()
+                self.assertIsInstance(channel, SocketChallengeChannel)
+                self.assertEqual(channel.directory, directory)
+            finally:
+                get_app_local_store().pop("challenge_channel").close()
+                self.app.config.pop("EDUMFA_CHALLENGE_CHANNEL_DIR")
+        self.assertIsInstance(get_challenge_channel(), LocalChallengeChannel)
+
+    def test_05_challenge_cache(self):
+        self.assertIsNone(get_challenge_cache())
+        self.assertRaises(ValueError, get_open_challenges)
+        chal = Challenge("CHAL6", transaction_id="tid6", challenge="c6")
+        chal.save()
+        # Without the cache, the challenges of the database session are returned
+        self.assertIs(get_open_challenges(transaction_id="tid6")[0], chal)
+
+        self.app.config["EDUMFA_CHALLENGE_CACHE_SIZE"] = 10
+        try:
+            cache = get_challenge_cache()
+            self.assertIsInstance(cache, ChallengeCache)
+            self.assertIs(cache, get_challenge_cache())
+            self.assertEqual(get_open_challenges(serial="CHAL7"), [])
+            chals = get_open_challenges(transaction_id="tid6")
+            self.assertEqual(len(chals), 1)
+            self.assertIsNot(chals[0], chal)
+            self.assertEqual(chals[0].get(), chal.get())
+            self.assertEqual(
+                get_open_challenges(serial="CHAL7", transaction_id="tid6"), []
+            )
+            self.assertEqual(len(get_open_challenges(serial="CHAL6")), 1)
+
+            # A change of another process is not seen before the entry expires
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(Challenge.__table__)
+                    .where(Challenge.transaction_id == "tid6")
+                    .values(otp_valid=True)
+                )
+            self.assertFalse(get_open_challenges(transaction_id="tid6")[0].otp_valid)
+            # A committed change is announced and drops the cache entries
+            db.session.expire_all()
+            chal.set_data("challenge_declined")
+            chal.save()
+            chals = get_open_challenges(transaction_id="tid6")
+            self.assertTrue(chals[0].otp_valid)
+            self.assertEqual(chals[0].data, "challenge_declined")
+            # A new challenge for the serial is found
+            Challenge("CHAL7", transaction_id="tid7", challenge="c7").save()
+            self.assertEqual(len(get_open_challenges(serial="CHAL7")), 1)
+            # A bulk delete drops the cache entries
+            get_open_challenges(transaction_id="tid7")
+            Challenge.query.filter(Challenge.transaction_id == "tid7").delete()
+            db.session.commit()
+            self.assertEqual(get_open_challenges(transaction_id="tid7"), [])
+            self.assertEqual(get_open_challenges(serial="CHAL7"), [])
+            Challenge("CHAL7", transaction_id="tid7", challenge="c7").save()
+            # Expired entries are read again
+            cache.ttl = 0
+            cache.clear()
+            get_open_challenges(serial="CHAL7")
+            Challenge.query.filter_by(serial="CHAL7").delete()
+            db.session.commit()
+            self.assertEqual(get_open_challenges(serial="CHAL7"), [])
+            # The least recently used entries are evicted
+            small = ChallengeCache(2)
+            for key in ["a", "b", "c"]:
+                small.put(("serial", key), [], small.generation)
+            self.assertIsNone(small.get(("serial", "a")))
+            self.assertEqual(small.get(("serial", "c")), ())
+            # A result, which was read before an invalidation, is not stored
+            generation = small.generation
+            small.invalidate("tid8", "d")
+            small.put(("serial", "d"), [], generation)
+            self.assertIsNone(small.get(("serial", "d")))
+        finally:
+            self.app.config.pop("EDUMFA_CHALLENGE_CACHE_SIZE", None)
+        chal.delete()
+
+    def test_06_challenge_cache_after_authentication(self):
+        self.setUp_user_realms()
+        user = User("cornelius", self.realm1)
+        set_policy(
+            "chalresp",
+            scope=SCOPE.AUTHZ,
+            action=f"{ACTION.CHALLENGERESPONSE}=hotp",
+        )
+        for serial in ["CHAL10", "CHAL11"]:
+            init_token(
+                {
+                    "serial": serial,
+                    "otpkey": "3132333435363738393031323334353637383930",
+                    "pin": "pin",
+                },
+                user=user,
+            )
+        self.app.config["EDUMFA_CHALLENGE_CACHE_SIZE"] = 10
+        try:
+            r = check_user_pass(user, "pin")
+            self.assertFalse(r[0])
+            transaction_id = r[1].get("transaction_id")
+            self.assertEqual(len(get_open_challenges(transaction_id=transaction_id)), 2)
+            self.assertEqual(len(get_open_challenges(serial="CHAL11")), 1)
+            # The successful response of the first token deletes the challenges
+            # of both tokens
+            r = check_serial_pass(
+                "CHAL10", "755224", options={"transaction_id": transaction_id}
+            )
+            self.assertTrue(r[0])
+            db.session.commit()
+            self.assertEqual(get_challenges(transaction_id=transaction_id), [])
+            self.assertEqual(get_open_challenges(transaction_id=transaction_id), [])
+            self.assertEqual(get_open_challenges(serial="CHAL11"), [])
+        finally:
+            self.app.config.pop("EDUMFA_CHALLENGE_CACHE_SIZE", None)
+            delete_policy("chalresp")
+            remove_token("CHAL10")
+            remove_token("CHAL11")
+
+    def test_07_cleanup_challenges(self):
+        Challenge.query.delete()
+        db.session.commit()
+        for i in range(5):
+            Challenge("CHAL9", challenge=f"c{i}", validitytime=-10).save()
+        Challenge("CHAL9", challenge="valid").save()
+        self.assertEqual(cleanup_challenges(chunk_size=2), 5)
+        self.assertEqual(cleanup_challenges(chunk_size=2), 0)
+        chals = get_challenges(serial="CHAL9")
+        self.assertEqual([c.challenge for c in chals], ["valid"])
+        # Without a chunk size, all expired challenges are deleted at once
+        chals[0].expiration = datetime.datetime.utcnow() - datetime.timedelta(1)
+        chals[0].save()
+        self.assertEqual(cleanup_challenges(), 1)
+        self.assertEqual(get_challenges(serial="CHAL9"), [])
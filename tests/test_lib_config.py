@@ -9,6 +9,7 @@ import importlib
 from flask import current_app
 
 from edumfa.lib.config import (
+    SharedConfigClass,
     delete_edumfa_config,
     get_config_object,
     get_edumfa_config,
@@ -32,6 +33,12 @@ from edumfa.lib.config import (
     set_edumfa_config,
     this,
 )
+from edumfa.lib.configchannel import (
+    FileConfigChannel,
+    PollConfigChannel,
+    get_config_channel,
+)
+from edumfa.lib.framework import get_app_local_store
 from edumfa.lib.resolvers.PasswdIdResolver import IdResolver as PWResolver
 from edumfa.lib.tokens.hotptoken import HotpTokenClass
 from edumfa.lib.tokens.totptoken import TotpTokenClass
@@ -296,3 +303,66 @@ class ConfigTestCase(MyTestCase):
         self.assertNotIn("tan", ttypes)
         self.assertNotIn("daplug", ttypes)
         self.assertNotIn("paper", ttypes)
+
+    def test_11_config_channel(self):
+        import os
+        import tempfile
+
+        # By default, the processes only poll the database
+        self.assertIsInstance(get_config_channel(), PollConfigChannel)
+        self.assertIsNone(get_config_channel().get_version())
+
+        tmpdir = tempfile.mkdtemp()
+        channel_file = os.path.join(tmpdir, "config.version")
+        current_app.config["EDUMFA_CONFIG_CHANNEL"] = "file"
+        current_app.config["EDUMFA_CONFIG_CHANNEL_FILE"] = channel_file
+        current_app.config["EDUMFA_CHECK_RELOAD_CONFIG"] = 3600
+        get_app_local_store().pop("config_channel", None)
+        try:
+            channel = get_config_channel()
+            self.assertIsInstance(channel, FileConfigChannel)
+            self.assertIsNone(channel.get_version())
+            shared_config = SharedConfigClass()
+            self.assertTrue(shared_config._reload_due())
+            shared_config.reload_and_clone()
+            timestamp = shared_config.timestamp
+            # Nothing changed, no need to read the database
+            self.assertFalse(shared_config._reload_due())
+            # A config change is announced after the commit
+            set_edumfa_config(key="channel_key", value="v1")
+            version = channel.get_version()
+            self.assertIsNotNone(version)
+            self.assertEqual(
+                shared_config.reload_and_clone().get_config("channel_key"), "v1"
+            )
+            self.assertGreater(shared_config.timestamp, timestamp)
+            self.assertEqual(shared_config.channel_version, version)
+            self.assertFalse(shared_config._reload_due())
+            # A notification is detected even if the modification time of the
+            # file does not change, e.g. due to a coarse timestamp resolution
+            mtime_ns = os.stat(channel_file).st_mtime_ns
+            channel.notify()
+            os.utime(channel_file, ns=(mtime_ns, mtime_ns))
+            self.assertNotEqual(channel.get_version(), version)
+            self.assertTrue(shared_config._reload_due())
+            shared_config.reload_and_clone()
+            version = channel.get_version()
+            self.assertEqual(shared_config.channel_version, version)
+            # A rolled back change is not announced
+            save_config_timestamp(False)
+            db.session.rollback()
+            self.assertEqual(channel.get_version(), version)
+            # With a jitter, the reload is delayed
+            current_app.config["EDUMFA_CONFIG_RELOAD_JITTER"] = 3600
+            channel.notify()
+            self.assertFalse(shared_config._reload_due())
+            self.assertIsNotNone(shared_config.channel_reload_after)
+            delete_edumfa_config("channel_key")
+        finally:
+            current_app.config.pop("EDUMFA_CONFIG_CHANNEL")
+            current_app.config.pop("EDUMFA_CONFIG_CHANNEL_FILE")
+            current_app.config.pop("EDUMFA_CONFIG_RELOAD_JITTER", None)
+            current_app.config.pop("EDUMFA_CHECK_RELOAD_CONFIG")
+            get_app_local_store().pop("config_channel", None)
+            os.unlink(channel_file)
+            os.rmdir(tmpdir)
@@ -16,6 +16,10 @@ from PyKCS11 import PyKCS11Error
 
 from edumfa.config import TestingConfig
 from edumfa.lib.crypto import (
+    DEFAULT_HASH_ALGO_LIST,
+    DEFAULT_HASH_ALGO_PARAMS,
+    DecryptedKeyCache,
+    SecretObj,
     Sign,
     aes_decrypt_b64,
     aes_encrypt_b64,
@@ -28,12 +32,15 @@ from edumfa.lib.crypto import (
     generate_keypair,
     generate_password,
     get_alphanum_str,
+    get_crypt_context,
     get_hsm,
     get_rand_digit_str,
+    get_secret_cache,
     geturandom,
     hash,
     hash_with_pepper,
     init_hsm,
+    merkle_root,
     pass_hash,
     set_hsm_password,
     urandom,
@@ -41,6 +48,7 @@ from edumfa.lib.crypto import (
     verify_with_pepper,
 )
 from edumfa.lib.error import HSMException
+from edumfa.lib.framework import get_app_local_store
 from edumfa.lib.security.aeshsm import AESHardwareSecurityModule
 from edumfa.lib.security.default import DefaultSecurityModule, SecurityModule
 from edumfa.lib.utils import to_bytes, to_unicode
@@ -318,6 +326,56 @@ class CryptoTestCase(MyTestCase):
         self.assertEqual(to_bytes(b_str), b_str)
         self.assertEqual(to_bytes(u_str), u_str.encode("utf8"))
 
+    def test_06_secret_cache(self):
+        import hashlib
+        import os
+        from unittest import mock
+
+        otpkey = "3132333435363738393031323334353637383930"
+        iv = os.urandom(16)
+        enc_key = binascii.unhexlify(encrypt(otpkey, iv))
+        digest = SecretObj(enc_key, iv).hmac_digest(b"data", hashlib.sha1)
+
+        # The cache is disabled by default
+        self.assertIsNone(get_secret_cache())
+        current_app.config["EDUMFA_SECRET_CACHE"] = True
+        try:
+            cache = get_secret_cache()
+            self.assertIsInstance(cache, DecryptedKeyCache)
+            with mock.patch("edumfa.lib.crypto.decrypt", wraps=decrypt) as mock_decrypt:
+                self.assertEqual(
+                    SecretObj(enc_key, iv).hmac_digest(b"data", hashlib.sha1), digest
+                )
+                self.assertEqual(
+                    SecretObj(enc_key, iv).hmac_digest(b"data", hashlib.sha1), digest
+                )
+                # The key was only decrypted once
+                mock_decrypt.assert_called_once()
+            cached = cache.get(enc_key, iv)
+            self.assertEqual(cached, binascii.unhexlify(otpkey))
+            # The cache hands out copies
+            cached[0] = 0
+            self.assertEqual(cache.get(enc_key, iv), binascii.unhexlify(otpkey))
+            cache.clear()
+            self.assertIsNone(cache.get(enc_key, iv))
+        finally:
+            current_app.config["EDUMFA_SECRET_CACHE"] = False
+            get_app_local_store().pop("secret_cache", None)
+
+        # Evicted and expired keys are zeroed
+        cache = DecryptedKeyCache(size=1, ttl=60)
+        cache.put(b"k1", b"iv", b"secret1")
+        bkey1 = cache._keys[(b"k1", b"iv")][1]
+        cache.put(b"k2", b"iv", b"secret2")
+        self.assertIsNone(cache.get(b"k1", b"iv"))
+        self.assertEqual(bkey1, bytearray(7))
+        self.assertEqual(cache.get(b"k2", b"iv"), b"secret2")
+        cache = DecryptedKeyCache(size=1, ttl=-1)
+        cache.put(b"k1", b"iv", b"secret1")
+        bkey1 = cache._keys[(b"k1", b"iv")][1]
+        self.assertIsNone(cache.get(b"k1", b"iv"))
+        self.assertEqual(bkey1, bytearray(7))
+
     def test_10_generate_keypair(self):
         keypub, keypriv = generate_keypair(rsa_keysize=4096)
         self.assertTrue(keypub.startswith("-----BEGIN RSA PUBLIC KEY-----"), keypub)
@@ -777,6 +835,16 @@ class SignObjectTestCase(MyTestCase):
         long_data = b"\x01\x02" * 5000
         self.assertTrue(so.verify(long_data, long_data_sig, verify_old_sigs=True))
 
+    def test_02_merkle_root(self):
+        root = merkle_root(["a", "b", "c"])
+        self.assertEqual(len(root), 64)
+        self.assertEqual(root, merkle_root(["a", "b", "c"]))
+        # the root depends on the order and the number of the leaves
+        self.assertNotEqual(root, merkle_root(["b", "a", "c"]))
+        self.assertNotEqual(root, merkle_root(["a", "b"]))
+        self.assertNotEqual(root, merkle_root(["a", "b", "c", "c"]))
+        self.assertNotEqual(merkle_root(["a"]), merkle_root([]))
+
 
 class DefaultHashAlgoListTestCase(MyTestCase):
     """Check if the default hash algorithm list is used."""
@@ -830,6 +898,20 @@ class CustomParamsDefaultHashAlgoListTestCase(OverrideConfigTestCase):
         # Checks if the password can also be verified with pbkdf2_sha512 from "DEFAULT_HASH_ALGO_LIST".
         self.assertTrue(verify_pass_hash(password, pbkdf2_sha512_hash))
 
+    def test_02_cached_crypt_context(self):
+        params = {"argon2__rounds": 5, "argon2__memory_cost": 768}
+        ctx = get_crypt_context(DEFAULT_HASH_ALGO_LIST, params)
+        self.assertIs(ctx, get_crypt_context(list(DEFAULT_HASH_ALGO_LIST), params))
+        # Other parameters result in another context
+        self.assertIsNot(ctx, get_crypt_context(DEFAULT_HASH_ALGO_LIST))
+        self.assertIsNot(ctx, get_crypt_context(["pbkdf2_sha512"], params))
+        # pass_hash uses the cached context and does not modify the defaults
+        ph = pass_hash("password")
+        self.assertIn("t=5", ph.split("$")[3], ph)
+        contexts = get_app_local_store()["crypt_contexts"]
+        self.assertIn(tuple(DEFAULT_HASH_ALGO_LIST), [k[0] for k in contexts])
+        self.assertEqual(DEFAULT_HASH_ALGO_PARAMS, {"argon2__rounds": 9})
+
 
 class CustomHashAlgoListTestCase(OverrideConfigTestCase):
     """Test for custom list of hash algorithms in edumfa.cfg"""
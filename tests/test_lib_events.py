@@ -27,6 +27,7 @@ from edumfa.lib.event import (
     delete_event,
     enable_event,
     get_handler_object,
+    index_events,
     set_event,
 )
 from edumfa.lib.eventhandler.base import CONDITION, BaseEventHandler
@@ -167,6 +168,38 @@ class EventHandlerLibTestCase(MyTestCase):
         h_obj = get_handler_object("Federation")
         self.assertEqual(type(h_obj), FederationEventHandler)
 
+    def test_03_index_events(self):
+        events = [
+            {"id": 1, "event": ["token_init"], "position": "post", "active": True},
+            {
+                "id": 2,
+                "event": ["token_init", "token_init", "token_delete"],
+                "position": "post",
+                "active": True,
+            },
+            {"id": 3, "event": ["token_init"], "position": "pre", "active": True},
+            {"id": 4, "event": ["token_init"], "position": "post", "active": False},
+        ]
+        index = index_events(events)
+        self.assertEqual([e.get("id") for e in index[("token_init", "post")]], [1, 2])
+        self.assertEqual([e.get("id") for e in index[("token_init", "pre")]], [3])
+        self.assertEqual([e.get("id") for e in index[("token_delete", "post")]], [2])
+        self.assertNotIn(("token_delete", "pre"), index)
+
+        # The index of the config object is used to find the handled events
+        eid = set_event(
+            "index", ["token_init", "token_delete"], "UserNotification", "sendmail"
+        )
+        event_config = EventConfiguration()
+        self.assertIn(("token_delete", "post"), get_config_object().event_index)
+        self.assertEqual(
+            [e.get("id") for e in event_config.get_handled_events("token_delete")],
+            [eid],
+        )
+        self.assertEqual(event_config.get_handled_events("token_delete", "pre"), [])
+        delete_event(eid)
+        self.assertEqual(EventConfiguration().get_handled_events("token_delete"), [])
+
 
 class BaseEventHandlerTestCase(MyTestCase):
     def test_01_basefunctions(self):
@@ -701,6 +734,41 @@ class BaseEventHandlerTestCase(MyTestCase):
         )
         self.assertTrue(r)
 
+    def test_09_shared_lookups(self):
+        self.setUp_user_realms()
+        serial = "pw01"
+        user = User("cornelius", "realm1")
+        init_token(
+            {"serial": serial, "type": "pw", "otppin": "test", "otpkey": "secret"},
+            user=user,
+        )
+        builder = EnvironBuilder(method="POST", data={"serial": serial}, headers={})
+        req = Request(builder.get_environ())
+        req.all_data = {"serial": serial}
+        req.User = user
+        resp = Response()
+        resp.data = """{"result": {"value": true}}"""
+        lookups = {}
+        options = {"g": {}, "request": req, "response": resp, "lookups": lookups}
+        with mock.patch(
+            "edumfa.lib.eventhandler.base.get_tokens",
+            wraps=get_tokens,
+        ) as mock_get_tokens:
+            # the token is only looked up once for all handlers of the event
+            for tokentype, result in [("pw", True), ("hotp", False), ("pw", True)]:
+                options["handler_def"] = {
+                    "conditions": {CONDITION.TOKENTYPE: tokentype}
+                }
+                self.assertEqual(
+                    BaseEventHandler().check_condition(options=options), result
+                )
+            mock_get_tokens.assert_called_once()
+            # after an action was executed, the token is looked up again
+            lookups.clear()
+            self.assertTrue(BaseEventHandler().check_condition(options=options))
+            self.assertEqual(mock_get_tokens.call_count, 2)
+        remove_token(serial)
+
 
 class CounterEventTestCase(MyTestCase):
     def test_01_event_counter(self):
@@ -2681,7 +2749,7 @@ class WebhookTestCase(MyTestCase):
         super().setUp()
         self.setUp_user_realms()
 
-    @patch("requests.post")
+    @patch("edumfa.lib.eventhandler.webhookeventhandler.http_request")
     def test_01_send_webhook(self, mock_post):
         with mock.patch("logging.Logger.info") as mock_log:
             mock_post.return_value.status_code = 200
@@ -2802,7 +2870,7 @@ class WebhookTestCase(MyTestCase):
             text = "Unknown content type value: False_Type"
             mock_log.assert_any_call(text)
 
-    @patch("requests.post")
+    @patch("edumfa.lib.eventhandler.webhookeventhandler.http_request")
     def test_05_wrong_url(self, mock_post):
         mock_post.side_effect = requests.exceptions.ConnectionError()
 
@@ -2823,7 +2891,7 @@ class WebhookTestCase(MyTestCase):
         res = t_handler.do("post_webhook", options=options)
         self.assertFalse(res)
 
-    @patch("requests.post")
+    @patch("edumfa.lib.eventhandler.webhookeventhandler.http_request")
     def test_06_replace_function(self, mock_post):
         with mock.patch("logging.Logger.info") as mock_log:
             mock_post.return_value.status_code = 200
@@ -2850,7 +2918,7 @@ class WebhookTestCase(MyTestCase):
             mock_log.assert_any_call(text)
             mock_log.assert_called_with(200)
 
-    @patch("requests.post")
+    @patch("edumfa.lib.eventhandler.webhookeventhandler.http_request")
     def test_07_replace_function_error(self, mock_post):
         with mock.patch("logging.Logger.warning") as mock_log:
             with mock.patch("logging.Logger.info") as mock_info:
@@ -2896,7 +2964,7 @@ class WebhookTestCase(MyTestCase):
                 mock_info.assert_any_call(text)
                 mock_info.assert_called_with(200)
 
-    @patch("requests.post")
+    @patch("edumfa.lib.eventhandler.webhookeventhandler.http_request")
     def test_08_replace_function_typo(self, mock_post):
         with mock.patch("logging.Logger.warning") as mock_log:
             with mock.patch("logging.Logger.info") as mock_info:
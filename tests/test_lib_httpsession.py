@@ -0,0 +1,120 @@
+"""
+This file contains the tests for the HTTP session registry.
+
+In particular, this tests
+lib/httpsession.py
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import responses
+
+from edumfa.lib.framework import get_app_local_store
+from edumfa.lib.httpsession import (
+    NullSessionRegistry,
+    SharedSessionRegistry,
+    _get_target,
+    get_session_registry,
+    http_request,
+)
+
+from .base import MyTestCase
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # Return the client port, so that the test can check, if the
+        # connection was reused
+        body = str(self.client_address[1]).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "session=secret")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPSessionTestCase(MyTestCase):
+    def tearDown(self):
+        get_app_local_store().pop("http_session_registry", None)
+        self.app.config.pop("EDUMFA_HTTP_SESSION_REGISTRY_CLASS", None)
+        self.app.config.pop("EDUMFA_HTTP_TARGETS", None)
+        super().tearDown()
+
+    def test_01_get_target(self):
+        self.assertEqual(
+            _get_target("https://Example.com/path"), "https://example.com:443"
+        )
+        self.assertEqual(_get_target("http://example.com/"), "http://example.com:80")
+        self.assertEqual(
+            _get_target("https://user:pw@example.com:8443/x?y=1"),
+            "https://example.com:8443",
+        )
+
+    def test_02_registry_config(self):
+        registry = get_session_registry()
+        self.assertIsInstance(registry, SharedSessionRegistry)
+        self.assertIs(registry, get_session_registry())
+        get_app_local_store().pop("http_session_registry")
+
+        self.app.config["EDUMFA_HTTP_SESSION_REGISTRY_CLASS"] = "null"
+        self.app.config["EDUMFA_HTTP_TARGETS"] = {
+            "https://remote.example.com": {"pool_size": 3, "retries": 2}
+        }
+        registry = get_session_registry()
+        self.assertIsInstance(registry, NullSessionRegistry)
+        session = registry.create_session("https://remote.example.com:443")
+        adapter = session.get_adapter("https://remote.example.com/validate/check")
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertEqual(adapter.max_retries.total, 2)
+        # Read errors are not retried
+        self.assertFalse(adapter.max_retries.read)
+        session = registry.create_session("https://other.example.com:443")
+        adapter = session.get_adapter("https://other.example.com/")
+        self.assertEqual(adapter._pool_maxsize, 10)
+        self.assertEqual(adapter.max_retries.total, 0)
+
+    @responses.activate
+    def test_03_shared_sessions(self):
+        responses.add(
+            responses.POST, "https://remote.example.com/validate/check", json={}
+        )
+        registry = get_session_registry()
+        session = registry.get_session("https://remote.example.com/validate/check")
+        self.assertIs(session, registry.get_session("https://REMOTE.example.com/"))
+        self.assertIsNot(
+            session, registry.get_session("https://remote.example.com:8443/")
+        )
+        r = http_request(
+            "POST", "https://remote.example.com/validate/check", data={"pass": "1"}
+        )
+        self.assertEqual(r.status_code, 200)
+        registry.clear()
+        self.assertIsNot(
+            session, registry.get_session("https://remote.example.com/validate/check")
+        )
+
+    def test_04_keep_alive(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        try:
+            # The shared registry reuses the connection
+            ports = {http_request("GET", url, timeout=5).text for _i in range(3)}
+            self.assertEqual(len(ports), 1)
+            # The cookies of a response are not sent with the next request
+            self.assertEqual(len(get_session_registry().get_session(url).cookies), 0)
+            # The null registry uses a new connection for every request
+            registry = NullSessionRegistry()
+            ports = {registry.request("GET", url, timeout=5).text for _i in range(3)}
+            self.assertEqual(len(ports), 3)
+        finally:
+            get_session_registry().clear()
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,113 @@
+"""
+This file contains the tests for the KDF pool.
+
+In particular, this tests
+lib/kdfpool.py
+"""
+
+import time
+
+from passlib.hash import argon2
+
+from edumfa.lib.authcache import add_to_cache, verify_in_cache
+from edumfa.lib.crypto import pass_hash, verify_pass_hash
+from edumfa.lib.error import ServerBusyError
+from edumfa.lib.framework import get_app_local_store
+from edumfa.lib.kdfpool import KDFPool, get_kdf_pool, run_kdf
+from edumfa.lib.monitoringstats import get_values
+from edumfa.lib.utils.password_hash import verify_with_schemes
+
+from .base import MyTestCase
+
+
+class KDFPoolTestCase(MyTestCase):
+    def tearDown(self):
+        pool = get_app_local_store().pop("kdf_pool", None)
+        if pool:
+            pool.shutdown()
+        self.app.config.pop("EDUMFA_KDF_POOL_SIZE", None)
+        self.app.config.pop("EDUMFA_KDF_POOL_FULL", None)
+        super().tearDown()
+
+    def test_01_no_pool(self):
+        self.assertIsNone(get_kdf_pool())
+        # The verification is run in the current process
+        ph = argon2.using(rounds=1).hash("test")
+        self.assertTrue(run_kdf(argon2.verify, "test", ph))
+        self.assertFalse(run_kdf(argon2.verify, "wrong", ph))
+
+    def test_02_verify_in_pool(self):
+        self.app.config["EDUMFA_KDF_POOL_SIZE"] = 1
+        pool = get_kdf_pool()
+        self.assertIsInstance(pool, KDFPool)
+        self.assertIs(pool, get_kdf_pool())
+        self.assertEqual(pool.queue_size, 4)
+        self.assertFalse(pool.reject)
+
+        ph = pass_hash("1234")
+        self.assertTrue(verify_pass_hash("1234", ph))
+        self.assertFalse(verify_pass_hash("4321", ph))
+        self.assertTrue(
+            pool.run(verify_with_schemes, ("argon2", "pbkdf2_sha512"), "1234", ph)
+        )
+        # Exceptions of the worker are raised in the caller
+        self.assertRaises(ValueError, pool.run, argon2.verify, "1234", "invalid")
+
+        # The auth cache is verified in the pool
+        add_to_cache("kdfuser", "realm1", "resolver1", "password")
+        self.assertTrue(verify_in_cache("kdfuser", "realm1", "resolver1", "password"))
+        self.assertFalse(verify_in_cache("kdfuser", "realm1", "resolver1", "wrong"))
+
+        stats = pool.get_stats()
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["rejected"], 0)
+        # A wrong password does not match the fingerprint and is not verified
+        self.assertGreaterEqual(stats["verified"], 4)
+        # The counters are reset
+        self.assertEqual(pool.get_stats()["verified"], 0)
+
+    def test_03_saturated_pool(self):
+        ph = argon2.using(rounds=1).hash("test")
+        pool = KDFPool(1, 1, reject=True)
+        try:
+            # Occupy the only slot
+            pool._slots.acquire()
+            self.assertRaises(ServerBusyError, pool.run, argon2.verify, "test", ph)
+            pool._slots.release()
+            self.assertTrue(pool.run(argon2.verify, "test", ph))
+            # A forked process does not use the workers of its parent
+            executor = pool._executor
+            pool._pid = -1
+            self.assertTrue(pool.run(argon2.verify, "test", ph))
+            self.assertIsNot(pool._executor, executor)
+            executor.shutdown()
+            # Without fast reject, the verification waits for a free slot
+            pool.reject = False
+            pool.timeout = 0.1
+            pool._slots.acquire()
+            self.assertRaises(ServerBusyError, pool.run, argon2.verify, "test", ph)
+            pool._slots.release()
+            # A verification, which does not finish in time, is rejected
+            self.assertRaises(ServerBusyError, pool.run, time.sleep, 1)
+            # ... but keeps its slot, until the worker process is finished
+            self.assertEqual(pool.pending, 1)
+            pool.reject = True
+            self.assertRaises(ServerBusyError, pool.run, argon2.verify, "test", ph)
+            pool.timeout = 5
+            time.sleep(1.5)
+            self.assertEqual(pool.pending, 0)
+            self.assertTrue(pool.run(argon2.verify, "test", ph))
+
+            pool.write_stats()
+            self.assertEqual(get_values("kdf_pool_rejected")[-1][1], 4)
+            self.assertEqual(get_values("kdf_pool_verified")[-1][1], 3)
+            self.assertEqual(get_values("kdf_pool_pending")[-1][1], 0)
+        finally:
+            pool.shutdown()
+
+    def test_04_reject_config(self):
+        self.app.config["EDUMFA_KDF_POOL_SIZE"] = 2
+        self.app.config["EDUMFA_KDF_POOL_FULL"] = "reject"
+        pool = get_kdf_pool()
+        self.assertEqual(pool.queue_size, 8)
+        self.assertTrue(pool.reject)
@@ -10,6 +10,7 @@ import dateutil
 
 from edumfa.lib.auth import ROLE
 from edumfa.lib.error import ParameterError
+from edumfa.lib.framework import get_request_local_store
 from edumfa.lib.policy import (
     ACTION,
     MAIN_MENU,
@@ -18,6 +19,7 @@ from edumfa.lib.policy import (
     MatchingError,
     PolicyClass,
     PolicyError,
+    PolicyIndex,
     delete_all_policies,
     delete_policy,
     enable_policy,
@@ -1889,6 +1891,81 @@ class PolicyTestCase(MyTestCase):
         # clean up
         delete_policy(pname)
 
+    def test_41_policy_index(self):
+        policies = [
+            {"name": "p0", "scope": SCOPE.AUTH, "action": {"otppin": "none"}},
+            {
+                "name": "p1",
+                "scope": SCOPE.AUTH,
+                "action": {"otppin": "userstore"},
+                "realm": ["realm1"],
+            },
+            {
+                "name": "p2",
+                "scope": SCOPE.AUTH,
+                "action": {"passthru": True},
+                "realm": ["realm.*"],
+            },
+            {
+                "name": "p3",
+                "scope": SCOPE.ADMIN,
+                "action": {"enable": True},
+                "adminrealm": ["admins"],
+                "resolver": ["reso1"],
+            },
+            {
+                "name": "p4",
+                "scope": SCOPE.ADMIN,
+                "action": {"*": True},
+                "resolver": ["reso2"],
+                "check_all_resolvers": True,
+            },
+            {
+                "name": "p5",
+                "scope": SCOPE.AUTH,
+                "action": {"otppin": "none"},
+                "realm": ["!realm2", "realm3"],
+            },
+        ]
+        index = PolicyIndex(policies)
+
+        def names(**kwargs):
+            return [p.get("name") for p in index.candidates(**kwargs)]
+
+        self.assertEqual(names(), ["p0", "p1", "p2", "p3", "p4", "p5"])
+        self.assertEqual(names(name="p3"), ["p3"])
+        self.assertEqual(names(name="p3", scope=SCOPE.AUTH), [])
+        self.assertEqual(names(scope=SCOPE.AUTH), ["p0", "p1", "p2", "p5"])
+        self.assertEqual(names(scope=SCOPE.AUTH, action="otppin"), ["p0", "p1", "p5"])
+        # regular expressions and exclusions are always candidates
+        self.assertEqual(
+            names(scope=SCOPE.AUTH, action="otppin", realm="realm1"), ["p0", "p1", "p5"]
+        )
+        self.assertEqual(names(scope=SCOPE.AUTH, realm="realm2"), ["p0", "p2", "p5"])
+        # wildcard actions and check_all_resolvers
+        self.assertEqual(names(scope=SCOPE.ADMIN, action="enable"), ["p3", "p4"])
+        self.assertEqual(names(scope=SCOPE.ADMIN, resolver="reso3"), ["p4"])
+        self.assertEqual(names(scope=SCOPE.ADMIN, adminrealm="other"), ["p4"])
+        # a list of search values
+        self.assertEqual(
+            names(scope=SCOPE.ADMIN, resolver=["reso1", "reso2"]), ["p3", "p4"]
+        )
+
+        # The index of the policy class is updated with the policies
+        set_policy("idx1", scope=SCOPE.AUTH, action="otppin=none", realm="realm1")
+        set_policy("idx2", scope=SCOPE.AUTH, action="otppin=none", realm="realm2")
+        P = PolicyClass()
+        self.assertEqual(
+            [p.get("name") for p in P.policy_index.candidates(name="idx2")], ["idx2"]
+        )
+        pols = P.match_policies(scope=SCOPE.AUTH, action="otppin", realm="realm1")
+        self.assertTrue(_check_policy_name("idx1", pols))
+        self.assertFalse(_check_policy_name("idx2", pols))
+        delete_policy("idx1")
+        delete_policy("idx2")
+        P = PolicyClass()
+        self.assertEqual(P.policy_index.candidates(name="idx2"), [])
+
 
 class PolicyMatchTestCase(MyTestCase):
     @classmethod
@@ -2086,6 +2163,42 @@ class PolicyMatchTestCase(MyTestCase):
                 {"pol4"},
             )
 
+    def test_06_match_memo(self):
+        g = FakeFlaskG()
+        g.client_ip = "127.0.0.1"
+        g.audit_object = mock.Mock()
+        g.policy_object = PolicyClass()
+        store = get_request_local_store()
+        store.pop("policy_match_memo", None)
+
+        g.audit_object.audit_data = {}
+        self.check_names(
+            Match.action_only(g, SCOPE.AUTHZ, "tokentype").policies(), {"pol2", "pol2a"}
+        )
+        memo = store["policy_match_memo"]
+        self.assertEqual((memo["hits"], memo["misses"]), (0, 1))
+        # The identical match is taken from the memo, but still written to the audit log
+        g.audit_object.audit_data = {}
+        self.check_names(
+            Match.action_only(g, SCOPE.AUTHZ, "tokentype").policies(), {"pol2", "pol2a"}
+        )
+        self.assertEqual((memo["hits"], memo["misses"]), (1, 1))
+        self.assertEqual(set(g.audit_object.audit_data["policies"]), {"pol2", "pol2a"})
+        # A different client IP is a different match
+        g.client_ip = "10.0.0.1"
+        Match.action_only(g, SCOPE.AUTHZ, "tokentype").policies()
+        self.assertEqual((memo["hits"], memo["misses"]), (1, 2))
+
+        # Changing the policies resets the memo
+        set_policy(name="pol2b", action="tokentype=SPASS", scope=SCOPE.AUTHZ)
+        self.check_names(
+            Match.action_only(g, SCOPE.AUTHZ, "tokentype").policies(),
+            {"pol2", "pol2a", "pol2b"},
+        )
+        memo = store["policy_match_memo"]
+        self.assertEqual((memo["hits"], memo["misses"]), (0, 1))
+        delete_policy("pol2b")
+
     @classmethod
     def tearDownClass(cls):
         delete_all_policies()
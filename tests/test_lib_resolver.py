@@ -11,7 +11,9 @@ The lib.resolver.py only depends on the database model.
 PWFILE = "tests/testdata/passwords"
 import datetime
 import json
+import os
 import ssl
+import tempfile
 import uuid
 from unittest import mock
 
@@ -21,6 +23,7 @@ import responses
 from ldap3.core.exceptions import LDAPOperationResult
 from ldap3.core.results import RESULT_SIZE_LIMIT_EXCEEDED
 from requests import HTTPError
+from sqlalchemy import event
 
 from edumfa.lib.realm import delete_realm, set_realm
 from edumfa.lib.resolver import (
@@ -676,6 +679,31 @@ class SQLResolverTestCase(MyTestCase):
         user_info = y.getUserInfo(user)
         self.assertEqual(user_info.get("userid"), "cornelius")
 
+    def test_09_batch_lookups(self):
+        y = SQLResolver()
+        y.loadConfig(self.parameters)
+        statements = []
+
+        def count_statements(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(y.engine, "before_cursor_execute", count_statements)
+        try:
+            usernames = y.getUsernames(["3", "4", "unknown", "3"])
+            self.assertEqual(len(statements), 1)
+            self.assertEqual(usernames["3"], "cornelius")
+            self.assertEqual(usernames["4"], y.getUsername("4"))
+            self.assertEqual(usernames["unknown"], "")
+            infos = y.getUserInfoBatch(["3", "4"])
+            self.assertEqual(infos["3"], y.getUserInfo("3"))
+        finally:
+            event.remove(y.engine, "before_cursor_execute", count_statements)
+
+        # The size limit of the resolver applies to the user list
+        self.assertEqual(len(y.getUserList()), self.num_users)
+        y.limit = 3
+        self.assertEqual(len(y.getUserList()), 3)
+
     def test_99_testconnection_fail(self):
         y = SQLResolver()
         self.parameters["Database"] = "does_not_exist"
@@ -995,6 +1023,19 @@ class LDAPResolverTestCase(MyTestCase):
     Test the LDAP resolver
     """
 
+    def tearDown(self):
+        from edumfa.lib.resolvers.LDAPIdResolver import CACHE_STATS
+
+        for key in [
+            "EDUMFA_LDAP_CACHE_SIZE",
+            "EDUMFA_LDAP_CACHE_NEGATIVE_SIZE",
+            "EDUMFA_LDAP_CACHE_STATS",
+        ]:
+            self.app.config.pop(key, None)
+        for name in CACHE_STATS:
+            CACHE_STATS[name] = 0
+        super().tearDown()
+
     @ldap3mock.activate
     def test_00_testconnection(self):
         ldap3mock.setLDAPDirectory(LDAPDirectory)
@@ -2489,6 +2530,114 @@ class LDAPResolverTestCase(MyTestCase):
             self.assertEqual(bob_id, bob_id2)
             mock_search.assert_called_once()
 
+    @ldap3mock.activate
+    def test_33a_cache_size_and_negative_entries(self):
+        ldap3mock.setLDAPDirectory(LDAPDirectory_small)
+        self.app.config["EDUMFA_LDAP_CACHE_SIZE"] = 2
+        self.app.config["EDUMFA_LDAP_CACHE_NEGATIVE_SIZE"] = 1
+        self.app.config["EDUMFA_LDAP_CACHE_STATS"] = True
+        y = LDAPResolver()
+        y.loadConfig(
+            {
+                "LDAPURI": "ldap://localhost",
+                "LDAPBASE": "o=test",
+                "BINDDN": "cn=manager,ou=example,o=test",
+                "BINDPW": "ldaptest",
+                "LOGINNAMEATTRIBUTE": "cn",
+                "LDAPSEARCHFILTER": "(&(cn=*)(cn=*))",  # we use this weird search filter to get a unique resolver ID
+                "USERINFO": '{ "username": "cn", "email" : "mail" }',
+                "UIDTYPE": "objectGUID",
+                "NOREFERRALS": True,
+                "CACHE_TIMEOUT": 120,
+            }
+        )
+        from edumfa.lib.monitoringstats import get_values
+        from edumfa.lib.resolvers.LDAPIdResolver import CACHE, CACHE_STATS
+
+        for name in CACHE_STATS:
+            CACHE_STATS[name] = 0
+        self.assertNotIn(y.getResolverId(), CACHE)
+        bob_id = y.getUserId("bob")
+        manager_id = y.getUserId("manager")
+        # unknown users are stored in the negative section
+        self.assertEqual(y.getUserId("unknown1"), "")
+        self.assertEqual(y.getUserId("unknown2"), "")
+        r_cache = CACHE[y.getResolverId()]
+        self.assertEqual(list(r_cache["negative:getUserId"].keys()), ["unknown2"])
+        # ... and do not evict the existing users
+        self.assertEqual(list(r_cache["getUserId"].keys()), ["bob", "manager"])
+        # a cache hit moves bob to the end, so manager is evicted first
+        with mock.patch.object(ldap3mock.Connection, "search") as mock_search:
+            self.assertEqual(y.getUserId("bob"), bob_id)
+            self.assertEqual(y.getUserId("unknown2"), "")
+            mock_search.assert_not_called()
+        y.getUserId("salesman")
+        self.assertEqual(list(r_cache["getUserId"].keys()), ["bob", "salesman"])
+        self.assertEqual(CACHE_STATS, {"hits": 2, "misses": 5, "evictions": 2})
+        self.assertNotEqual(bob_id, manager_id)
+
+        # the counters are written to the monitoring at the end of the request
+        from edumfa.lib.lifecycle import call_finalizers
+
+        call_finalizers()
+        self.assertEqual(get_values("ldap_cache_hits")[-1][1], 2)
+        self.assertEqual(get_values("ldap_cache_evictions")[-1][1], 2)
+        self.assertEqual(CACHE_STATS, {"hits": 0, "misses": 0, "evictions": 0})
+
+    @ldap3mock.activate
+    def test_33b_user_info_batch(self):
+        ldap3mock.setLDAPDirectory(LDAPDirectory_small)
+        y = LDAPResolver()
+        y.loadConfig(
+            {
+                "LDAPURI": "ldap://localhost",
+                "LDAPBASE": "o=test",
+                "BINDDN": "cn=manager,ou=example,o=test",
+                "BINDPW": "ldaptest",
+                "LOGINNAMEATTRIBUTE": "cn",
+                "LDAPSEARCHFILTER": "(&(cn=*))",
+                "USERINFO": '{ "username": "cn", "email" : "email" }',
+                "UIDTYPE": "objectGUID",
+                "NOREFERRALS": True,
+                "CACHE_TIMEOUT": 120,
+            }
+        )
+        y._bind()
+        unknown_id = str(uuid.uuid4())
+        # all users are found with a single search
+        with mock.patch.object(
+            ldap3mock.Connection, "search", wraps=y.l.search
+        ) as mock_search:
+            usernames = y.getUsernames(
+                [objectGUIDs[0], unknown_id, objectGUIDs[2], objectGUIDs[0]]
+            )
+            mock_search.assert_called_once()
+        self.assertEqual(
+            usernames,
+            {objectGUIDs[0]: "bob", objectGUIDs[2]: "salesman", unknown_id: ""},
+        )
+        # the results are written to the cache
+        with mock.patch.object(ldap3mock.Connection, "search") as mock_search:
+            self.assertEqual(y.getUserInfo(objectGUIDs[2])["username"], "salesman")
+            self.assertEqual(y.getUserInfo(unknown_id), {})
+            infos = y.getUserInfoBatch([objectGUIDs[0], objectGUIDs[2]])
+            mock_search.assert_not_called()
+        self.assertEqual(infos[objectGUIDs[0]]["email"], "bob@example.com")
+
+        # the users are searched in chunks
+        with mock.patch(
+            "edumfa.lib.resolvers.LDAPIdResolver.BATCH_SIZE", 2
+        ), mock.patch.object(
+            ldap3mock.Connection, "search", wraps=y.l.search
+        ) as mock_search:
+            y.cache_timeout = 0
+            infos = y.getUserInfoBatch(objectGUIDs[:3])
+            self.assertEqual(mock_search.call_count, 2)
+        self.assertEqual(
+            [info["username"] for info in infos.values()],
+            ["bob", "manager", "salesman"],
+        )
+
     @ldap3mock.activate
     def test_34_censored_tests(self):
         ldap3mock.setLDAPDirectory(LDAPDirectory)
@@ -2790,6 +2939,42 @@ class PasswdIdResolverTestCase(MyTestCase):
         reso_obj = get_resolver_object("unknown")
         self.assertTrue(reso_obj is None, reso_obj)
 
+    def test_06_resolver_object_pool(self):
+        reso_obj = get_resolver_object(self.resolvername1)
+        # The resolver object is reused
+        self.assertIs(reso_obj, get_resolver_object(self.resolvername1))
+        # Changing another resolver does not recreate the resolver object
+        save_resolver(
+            {
+                "resolver": "otherresolver",
+                "type": "passwdresolver",
+                "fileName": PWFILE,
+            }
+        )
+        self.assertIs(reso_obj, get_resolver_object(self.resolvername1))
+        delete_resolver("otherresolver")
+        self.assertIs(reso_obj, get_resolver_object(self.resolvername1))
+        # Changing the configuration of the resolver recreates the resolver object
+        config = get_resolver_config(self.resolvername1)
+        save_resolver(
+            {
+                "resolver": self.resolvername1,
+                "type": "passwdresolver",
+                "fileName": PWFILE,
+            }
+        )
+        new_reso_obj = get_resolver_object(self.resolvername1)
+        self.assertIsNot(reso_obj, new_reso_obj)
+        self.assertEqual(new_reso_obj.fileName, PWFILE)
+        self.assertIs(new_reso_obj, get_resolver_object(self.resolvername1))
+        save_resolver(
+            {
+                "resolver": self.resolvername1,
+                "type": "passwdresolver",
+                "fileName": config.get("fileName"),
+            }
+        )
+
     def test_10_delete_resolver(self):
         # get the list of the resolvers
         reso_list = get_resolver_list()
@@ -3010,6 +3195,48 @@ class PasswdIdResolverTestCase(MyTestCase):
         delete_realm("myrealm")
         delete_resolver(self.resolvername1)
 
+    def test_16_shared_passwd_file(self):
+        from edumfa.lib.resolvers.PasswdIdResolver import IdResolver
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "passwd")
+            with open(filename, "w") as f:
+                f.write("hans:x:1000:1000:Hans Meier,,1234,5678,hans@example.com::\n")
+            y1 = IdResolver().loadConfig({"fileName": filename})
+            y2 = IdResolver().loadConfig({"fileName": filename})
+            # The parsed file is shared by both resolvers
+            self.assertIs(y1.passwdFile, y2.passwdFile)
+            self.assertEqual(y1.getUserId("hans"), "1000")
+            self.assertEqual(
+                y1.getUserInfo("1000", no_passwd=True),
+                {
+                    "username": "hans",
+                    "userid": "1000",
+                    "description": "Hans Meier,,1234,5678,hans@example.com",
+                    "givenname": "Hans",
+                    "surname": "Meier",
+                    "phone": "5678",
+                    "mobile": "1234",
+                    "email": "hans@example.com",
+                },
+            )
+            passwd_file = y1.passwdFile
+            # The file is not parsed again, as long as it is unchanged
+            self.assertEqual(y2.getUsername("1000"), "hans")
+            self.assertIs(y2.passwdFile, passwd_file)
+            # A changed file is parsed again
+            with open(filename, "a") as f:
+                f.write("anna:x:1001:1001:Anna::\n")
+            self.assertEqual(y2.getUserId("anna"), "1001")
+            self.assertIsNot(y2.passwdFile, passwd_file)
+            self.assertEqual(len(y1.getUserList({"username": "*"})), 2)
+            self.assertIs(y1.passwdFile, y2.passwdFile)
+            # If the file vanishes, the last known users are still available
+            os.unlink(filename)
+            self.assertEqual(y1.getUsername("1001"), "anna")
+        # A resolver without a file has no users
+        self.assertEqual(IdResolver().getUserId("hans"), "")
+
 
 class HTTPResolverTestCase(MyTestCase):
     ENDPOINT = "http://localhost:8080/get-data"
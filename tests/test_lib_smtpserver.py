@@ -4,15 +4,20 @@ This test file tests the lib/smtpserver.py
 
 import binascii
 import email
+import smtplib
 from email.mime.image import MIMEImage
 from smtplib import SMTPException
+from unittest import mock
 
 from edumfa.lib.error import ResourceNotFoundError
 from edumfa.lib.queue import get_job_queue
 from edumfa.lib.smtpserver import (
+    SMTPConnection,
+    SMTPConnectionPool,
     SMTPServer,
     add_smtpserver,
     delete_smtpserver,
+    get_smtp_pool,
     get_smtpserver,
     get_smtpservers,
 )
@@ -198,6 +203,95 @@ class SMTPServerTestCase(MyTestCase):
         # Check, if the mock SMTP server actually has been configured as SMTP_SSL
         self.assertTrue(smtpmock.get_smtp_ssl())
 
+    @smtpmock.activate
+    def test_07_connection_pool(self):
+        smtpmock.setdata(response={"recp@example.com": (200, "OK")}, support_tls=True)
+        add_smtpserver(identifier="myserver", server="1.2.3.4", tls=True)
+        server = get_smtpserver("myserver")
+        connections = []
+        init = SMTPConnection.__init__
+
+        def connect(connection, config):
+            connections.append(connection)
+            init(connection, config)
+
+        self.assertIsNone(get_smtp_pool())
+        with mock.patch.object(SMTPConnection, "__init__", connect):
+            # Without the pool, every email opens a new connection
+            self.assertTrue(server.send_email("recp@example.com", "Hallo", "Body"))
+            self.assertTrue(server.send_email("recp@example.com", "Hallo", "Body"))
+            self.assertEqual(len(connections), 2)
+
+            self.app.config["EDUMFA_SMTP_POOL_SIZE"] = 1
+            self.app.config["EDUMFA_SMTP_POOL_MAX_MESSAGES"] = 2
+            try:
+                pool = get_smtp_pool()
+                self.assertIsInstance(pool, SMTPConnectionPool)
+                self.assertIs(pool, get_smtp_pool())
+                # The connection is reused up to the maximum number of emails
+                del connections[:]
+                for _i in range(3):
+                    self.assertTrue(
+                        server.send_email("recp@example.com", "Hallo", "Body")
+                    )
+                self.assertEqual(len(connections), 2)
+                self.assertEqual(connections[1].sent, 1)
+                # An idle connection is not reused
+                pool.idle_time = 0
+                self.assertTrue(server.send_email("recp@example.com", "Hallo", "Body"))
+                self.assertEqual(len(connections), 3)
+                pool.idle_time = 30
+
+                # A connection, that was closed by the server, is replaced
+                with mock.patch.object(
+                    smtplib.SMTP,
+                    "sendmail",
+                    side_effect=[smtplib.SMTPServerDisconnected("closed"), {}],
+                ):
+                    self.assertTrue(
+                        server.send_email("recp@example.com", "Hallo", "Body")
+                    )
+                self.assertEqual(len(connections), 4)
+                # Other errors are raised and the connection is not reused
+                with mock.patch.object(
+                    smtplib.SMTP,
+                    "sendmail",
+                    side_effect=smtplib.SMTPRecipientsRefused({}),
+                ):
+                    self.assertRaises(
+                        smtplib.SMTPRecipientsRefused,
+                        server.send_email,
+                        "recp@example.com",
+                        "Hallo",
+                        "Body",
+                    )
+                self.assertEqual([c for c in pool._connections.values() if c], [])
+
+                # A batch is sent via one connection. An email, which can not
+                # be sent, does not stop the batch.
+                del connections[:]
+                messages = [
+                    {"recipient": "recp@example.com", "subject": "1", "body": "Body"},
+                    {"recipient": "recp@example.com", "subject": "2", "body": "Body"},
+                ]
+                self.assertEqual(server.send_emails(messages), [True, True])
+                self.assertEqual(len(connections), 1)
+                with mock.patch.object(
+                    smtplib.SMTP,
+                    "sendmail",
+                    side_effect=[{}, smtplib.SMTPRecipientsRefused({}), {}],
+                ):
+                    r = server.send_emails(messages + messages[:1])
+                self.assertEqual(r, [True, False, True])
+                # The first batch reached the maximum number of emails and
+                # the failed connection is replaced
+                self.assertEqual(len(connections), 3)
+                pool.clear()
+            finally:
+                self.app.config.pop("EDUMFA_SMTP_POOL_SIZE", None)
+                self.app.config.pop("EDUMFA_SMTP_POOL_MAX_MESSAGES", None)
+        delete_smtpserver("myserver")
+
 
 class SMTPServerQueueTestCase(MockQueueTestCase):
     @smtpmock.activate
@@ -272,3 +366,19 @@ class SMTPServerQueueTestCase(MockQueueTestCase):
         self.assertEqual(queue.enqueued_jobs, [])
 
         delete_smtpserver("myserver")
+
+    @smtpmock.activate
+    def test_03_enqueue_batch(self):
+        add_smtpserver(identifier="myserver", server="1.2.3.4", enqueue_job=True)
+        server = get_smtpserver("myserver")
+        messages = [
+            {"recipient": "recp@example.com", "subject": "1", "body": "Body"},
+            {"recipient": "recp@example.com", "subject": "2", "body": "Body"},
+        ]
+        self.assertEqual(server.send_emails(messages), [True, True])
+        queue = get_job_queue()
+        self.assertEqual(len(queue.enqueued_jobs), 1)
+        job_name, args, kwargs = queue.enqueued_jobs[0]
+        self.assertEqual(job_name, "smtpserver.send_batch")
+        self.assertEqual(args[1], messages)
+        delete_smtpserver("myserver")
@@ -0,0 +1,40 @@
+"""
+This tests the files
+  lib/task/challengecleanup.py
+"""
+
+from flask import current_app
+
+from edumfa.lib.monitoringstats import get_values
+from edumfa.lib.periodictask import get_available_taskmodules, get_taskmodule
+from edumfa.lib.task.challengecleanup import ChallengeCleanupTask
+from edumfa.models import Challenge, db
+
+from .base import MyTestCase
+
+
+class TaskChallengeCleanupTestCase(MyTestCase):
+    def test_00_delete_expired_challenges(self):
+        self.assertIn("ChallengeCleanup", get_available_taskmodules())
+        self.assertIsInstance(get_taskmodule("ChallengeCleanup"), ChallengeCleanupTask)
+
+        Challenge.query.delete()
+        db.session.commit()
+        for i in range(3):
+            Challenge("CLEAN1", challenge=f"c{i}", validitytime=-10).save()
+        Challenge("CLEAN1", challenge="valid").save()
+
+        task = ChallengeCleanupTask(current_app.config)
+        self.assertIn("chunk_size", task.options)
+        r = task.do({"chunk_size": "2", "stats_key": "expired_challenges"})
+        self.assertTrue(r)
+        self.assertEqual(get_values("expired_challenges")[-1][1], 3)
+        self.assertEqual(
+            [c.challenge for c in Challenge.query.filter_by(serial="CLEAN1")],
+            ["valid"],
+        )
+        # The default chunk size is used and the JWT blocklist is cleaned up
+        self.assertTrue(task.do({"cleanup_jwt_blacklist": "True"}))
+        self.assertEqual(Challenge.query.filter_by(serial="CLEAN1").count(), 1)
+        Challenge.query.delete()
+        db.session.commit()
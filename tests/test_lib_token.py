@@ -20,6 +20,8 @@ import warnings
 
 from dateutil import parser
 from dateutil.tz import tzlocal
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
 
 from edumfa.lib.config import (
     SYSCONF,
@@ -35,6 +37,7 @@ from edumfa.lib.error import (
     UserError,
     eduMFAError,
 )
+from edumfa.lib.importotp import iterOATHcsv
 from edumfa.lib.policy import ACTION, SCOPE, PolicyClass, delete_policy, set_policy
 from edumfa.lib.token import (
     add_tokeninfo,
@@ -69,6 +72,7 @@ from edumfa.lib.token import (
     get_tokens_paginate,
     get_tokens_paginated_generator,
     import_token,
+    import_tokens,
     init_token,
     is_token_active,
     is_token_owner,
@@ -107,7 +111,14 @@ from edumfa.lib.tokengroup import delete_tokengroup, set_tokengroup
 from edumfa.lib.tokens.totptoken import TotpTokenClass
 from edumfa.lib.user import User
 from edumfa.lib.utils import b32encode_and_unicode, hexlify_and_unicode
-from edumfa.models import Challenge, Token, TokenRealm, db
+from edumfa.models import (
+    Challenge,
+    Token,
+    TokenOwner,
+    TokenRealm,
+    db,
+    token_unit_of_work,
+)
 
 from .base import FakeAudit, FakeFlaskG, MyTestCase
 
@@ -1154,6 +1165,20 @@ class TokenTestCase(MyTestCase):
 
         self.assertEqual("A8", tokens[0].get("serial"), tokens[0])
 
+        # an orphaned token keeps the realm of its owner
+        tok = init_token({"serial": "ORPHANED1", "type": "spass"})
+        TokenOwner(
+            token_id=tok.token.id,
+            resolver=self.resolvername1,
+            realmname=self.realm1,
+            user_id="123981298",
+        ).save()
+        tokens = get_tokens_paginate(serial="ORPHANED1").get("tokens")
+        self.assertEqual(tokens[0].get("username"), "")
+        self.assertEqual(tokens[0].get("user_realm"), self.realm1)
+        self.assertTrue(tokens[0].get("user_editable") is not None)
+        remove_token("ORPHANED1")
+
     def test_43_encryptpin(self):
         serial = "ENC01"
         # encrypt pin on init
@@ -1864,6 +1889,146 @@ class TokenTestCase(MyTestCase):
             > weigh_token_type(dummy_token("hotp"))
         )
 
+    def test_60_token_unit_of_work(self):
+        commits = []
+
+        def count_commit(session):
+            commits.append(session)
+
+        serial = "uow01"
+        tok = init_token({"serial": serial, "otpkey": OTPKEY, "pin": "test"})
+        event.listen(Session, "after_commit", count_commit)
+        try:
+            # Without a unit of work, every modification is committed
+            r, _reply = check_token_list([tok], "test755224")
+            self.assertTrue(r)
+            self.assertGreater(len(commits), 1)
+            # With a unit of work, the token state is written in one transaction
+            self.app.config["EDUMFA_TOKEN_UNIT_OF_WORK"] = True
+            del commits[:]
+            r, _reply = check_token_list([tok], "test287082")
+            self.assertTrue(r)
+            self.assertEqual(len(commits), 1)
+            del commits[:]
+            r, _reply = check_token_list([tok], "test111111")
+            self.assertFalse(r)
+            self.assertEqual(len(commits), 1)
+        finally:
+            event.remove(Session, "after_commit", count_commit)
+            self.app.config.pop("EDUMFA_TOKEN_UNIT_OF_WORK", None)
+
+        # The buffered modifications are in the database
+        db.session.expire_all()
+        tok = get_tokens(serial=serial)[0]
+        self.assertEqual(tok.token.count, 2)
+        self.assertEqual(tok.token.failcount, 1)
+        self.assertEqual(tok.get_count_auth_success(), 2)
+        self.assertEqual(tok.get_count_auth(), 3)
+
+        # Other objects, e.g. challenges, are committed at once, so that
+        # other processes can see them
+        with token_unit_of_work(force=True):
+            chal = Challenge(serial, transaction_id="uow01", challenge="c")
+            self.assertIsNotNone(chal.save())
+            with db.engine.connect() as connection:
+                self.assertEqual(
+                    connection.execute(
+                        select(Challenge.id).where(Challenge.transaction_id == "uow01")
+                    ).scalar(),
+                    chal.id,
+                )
+        remove_token(serial)
+
+    def test_61_token_load_profiles(self):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        user = User("cornelius", self.realm1)
+        serials = ["load01", "load02", "load03"]
+        for serial in serials:
+            tok = init_token({"serial": serial, "otpkey": OTPKEY}, user=user)
+            tok.add_tokeninfo("key", serial)
+        self.assertRaises(KeyError, get_tokens, user=user, load_profile="unknown")
+
+        for load_profile, touched in [(None, True), ("auth", False)]:
+            db.session.expire_all()
+            tokens = get_tokens(user=user, load_profile=load_profile)
+            self.assertGreaterEqual(len(tokens), len(serials))
+            event.listen(db.engine, "before_cursor_execute", count_statement)
+            try:
+                for tok in tokens:
+                    self.assertEqual(tok.user.login, "cornelius")
+                    tok.get_tokeninfo()
+                    self.assertEqual(tok.token.get_realms(), [self.realm1])
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count_statement)
+            # Only without a load profile, the relationships are queried
+            self.assertEqual(bool(statements), touched)
+            del statements[:]
+
+        # The tokens of a page are listed with their token info
+        tokens = get_tokens_paginate(user=user, psize=10)
+        self.assertEqual(
+            tokens["tokens"][-1]["info"].get("key"), tokens["tokens"][-1]["serial"]
+        )
+        for serial in serials:
+            remove_token(serial)
+
+    def test_62_import_tokens(self):
+        self.setUp_user_realms()
+        lines = [
+            "# OATH CSV\n",
+            "imp01, 3132333435363738393031323334353637383930, hotp, 6\n",
+            "imp02, 3132333435363738393031323334353637383930, totp, 6, 30\n",
+            "\n",
+            "imp04, 3132333435363738393031323334353637383930, hotp, 8\n",
+        ]
+        tokens = list(iterOATHcsv(lines))
+        self.assertEqual([t[0] for t in tokens], ["imp01", "imp02", "imp04"])
+        # A token with an unknown type can not be imported
+        tokens.insert(2, ("imp03", {"type": "unknown", "otpkey": OTPKEY}))
+        # A token, which fails after it was created, is removed again
+        tokens.insert(
+            4, ("imp05", {"type": "hotp", "otpkey": OTPKEY, "counter": "invalid"})
+        )
+        commits = []
+        progress = []
+
+        def count_commit(connection):
+            commits.append(connection)
+
+        event.listen(db.engine, "commit", count_commit)
+        try:
+            r = import_tokens(
+                iter(tokens),
+                tokenrealms=[self.realm1],
+                chunk_size=2,
+                progress=progress.append,
+            )
+        finally:
+            event.remove(db.engine, "commit", count_commit)
+        self.assertEqual(r["n_imported"], 3)
+        self.assertEqual(list(r["errors"]), ["imp03", "imp05"])
+        self.assertEqual(progress, [2, 4, 5])
+        # The token data of a chunk is written in one transaction
+        self.assertEqual(len(commits), 3)
+
+        db.session.expire_all()
+        self.assertEqual(get_tokens(serial="imp03"), [])
+        self.assertEqual(get_tokens(serial="imp05"), [])
+        for serial, tokentype, otplen in [
+            ("imp01", "hotp", 6),
+            ("imp02", "totp", 6),
+            ("imp04", "hotp", 8),
+        ]:
+            tok = get_tokens(serial=serial)[0]
+            self.assertEqual(tok.type, tokentype)
+            self.assertEqual(tok.token.otplen, otplen)
+            self.assertEqual(tok.token.get_realms(), [self.realm1])
+            remove_token(serial)
+
 
 class TokenOutOfBandTestCase(MyTestCase):
     def test_00_create_realms(self):
@@ -18,6 +18,7 @@ from edumfa.lib.policy import SCOPE, PolicyClass, delete_policy, set_policy
 from edumfa.lib.realm import set_realm
 from edumfa.lib.resolver import save_resolver
 from edumfa.lib.tokenclass import DATE_FORMAT
+from edumfa.lib.tokens.HMAC import OtpLookaheadCache, OtpLookaheadTable
 from edumfa.lib.tokens.hotptoken import HotpTokenClass
 from edumfa.lib.user import User
 from edumfa.lib.utils import b32encode_and_unicode
@@ -824,3 +825,73 @@ class HOTPTokenTestCase(MyTestCase):
         )
         self.assertEqual(secret, expected_secret)
         self.assertTrue(token.token.active)
+
+    def test_31_otp_lookahead_cache(self):
+        serial = "lookahead1"
+        db_token = Token(serial, tokentype="hotp")
+        db_token.save()
+        token = HotpTokenClass(db_token)
+        token.update({"otpkey": self.otpkey, "otplen": 6})
+        token.set_count_window(5)
+        self.app.config["EDUMFA_OTP_LOOKAHEAD_CACHE"] = True
+        try:
+            table = token._get_lookahead_table()
+            self.assertIsInstance(table, OtpLookaheadTable)
+            self.assertEqual(table.values, {})
+            # A failed check fills the table with the values of the window
+            self.assertEqual(token.check_otp("123456"), -1)
+            self.assertEqual(table.values, dict(enumerate(self.valid_otp_values[:5])))
+            # A successful check advances the counter and prunes the table
+            self.assertEqual(token.check_otp(self.valid_otp_values[2]), 2)
+            self.assertEqual(token.token.count, 3)
+            self.assertEqual(sorted(table.values), [3, 4])
+            # A value from the table is found
+            self.assertEqual(token.check_otp_exist(self.valid_otp_values[4]), 4)
+            self.assertEqual(table.values, {})
+            # A failed check prunes the values, which are far from the counter
+            self.assertEqual(token.check_otp("123456"), -1)
+            self.assertEqual(sorted(table.values), [5, 6, 7, 8, 9])
+            token.set_otp_count(150)
+            self.assertEqual(token.check_otp("123456"), -1)
+            self.assertEqual(sorted(table.values), [150, 151, 152, 153, 154])
+            # A new key results in a new table
+            token.update({"otpkey": "3132333435363738393031323334353637383931"})
+            self.assertIsNot(token._get_lookahead_table(), table)
+            # resync removes the table
+            table = token._get_lookahead_table()
+            token.update({"otpkey": self.otpkey})
+            token.set_sync_window(10)
+            self.assertTrue(token.resync("399871", "520489"))
+            self.assertIsNot(token._get_lookahead_table(), table)
+        finally:
+            self.app.config["EDUMFA_OTP_LOOKAHEAD_CACHE"] = False
+        self.assertIsNone(token._get_lookahead_table())
+        token.delete_token()
+
+    def test_32_otp_lookahead_cache_size(self):
+        cache = OtpLookaheadCache(size=2)
+        table1 = cache.get_table("S1", "fp")
+        cache.get_table("S2", "fp")
+        self.assertIs(cache.get_table("S1", "fp"), table1)
+        cache.get_table("S3", "fp")
+        # S2 was the least recently used table
+        self.assertEqual(list(cache._tables), ["S1", "S3"])
+        # a changed fingerprint results in a new table
+        self.assertIsNot(cache.get_table("S1", "other"), table1)
+        cache.invalidate("S1")
+        self.assertEqual(list(cache._tables), ["S3"])
+        # the number of values per token is limited
+        table = OtpLookaheadTable(max_entries=3)
+        for c in range(5):
+            table.put(c, str(c))
+        self.assertEqual(table.values, {0: "0", 1: "1", 2: "2"})
+        # a full table evicts the value with the lowest counter
+        table.prune(2)
+        table.put(3, "3")
+        table.put(4, "4")
+        self.assertEqual(table.values, {2: "2", 3: "3", 4: "4"})
+        # the table moves along with the counter
+        table.prune(6)
+        self.assertEqual(table.values, {4: "4"})
+        table.advance(5)
+        self.assertEqual(table.values, {})
@@ -300,6 +300,7 @@ class RadiusTokenTestCase(MyTestCase):
         self.assertEqual(opts.get("radius_message"), "Please provide more information.")
         self.assertEqual(opts.get("radius_result"), radiusmock.AccessChallenge)
         self.assertEqual(opts.get("radius_state"), state1[0])
+        self.assertEqual(opts.get("radius_challenge_server"), "1.2.3.4:1812")
 
         # Creating the challenge within eduMFA
         r, message, transaction_id, _attr = token.create_challenge(options=opts)
@@ -310,6 +311,8 @@ class RadiusTokenTestCase(MyTestCase):
         chals = get_challenges(token.token.serial)
         self.assertEqual(len(chals), 1)
         self.assertEqual(chals[0].transaction_id, transaction_id)
+        # The challenge remembers the RADIUS server, which sent the challenge
+        self.assertEqual(chals[0].data, "313233343536 1.2.3.4:1812")
 
         # Checking, if this is the answer attempt to a challenge
         r = token.is_challenge_response(
@@ -0,0 +1,194 @@
+"""
+This file contains the tests for the upstream fan-out.
+
+In particular, this tests
+lib/upstream.py
+"""
+
+import threading
+import time
+
+import responses
+from pyrad.client import Timeout
+from pyrad.dictionary import Dictionary
+from pyrad.packet import AccessAccept
+
+from edumfa.lib.edumfaserver import add_edumfaserver, get_edumfaserver
+from edumfa.lib.framework import get_app_local_store
+from edumfa.lib.radiusserver import (
+    RADIUSServer,
+    format_radius_server,
+    parse_radius_servers,
+    send_radius_request,
+)
+from edumfa.lib.upstream import (
+    MAX_FAILURES,
+    UpstreamRegistry,
+    get_upstream_registry,
+)
+from edumfa.models import RADIUSServer as RADIUSServerDB
+
+from . import radiusmock
+from .base import MyTestCase
+
+DICT_FILE = "tests/testdata/dictionary"
+
+
+class UpstreamTestCase(MyTestCase):
+    def tearDown(self):
+        registry = get_app_local_store().pop("upstream_registry", None)
+        if registry:
+            registry.shutdown()
+        self.app.config.pop("EDUMFA_UPSTREAM_FANOUT", None)
+        super().tearDown()
+
+    def test_01_health_and_latency(self):
+        registry = UpstreamRegistry(hedge_delay=0.5)
+        self.assertEqual(registry.get_hedge_delay("a"), 0.5)
+        for i in range(20):
+            registry.record("a", (i + 1) / 100, True)
+        self.assertAlmostEqual(registry.get_hedge_delay("a"), 0.2)
+        for _i in range(MAX_FAILURES):
+            self.assertTrue(registry.is_healthy("b"))
+            registry.record("b", 5, False)
+        self.assertFalse(registry.is_healthy("b"))
+        # An upstream, which is down, is queried last
+        self.assertEqual(registry.order(["b", "a"]), ["a", "b"])
+        stats = registry.get_stats()
+        self.assertEqual(stats["b"]["failures"], MAX_FAILURES)
+        self.assertFalse(stats["b"]["healthy"])
+        self.assertIsNone(stats["b"]["latency_median"])
+        self.assertAlmostEqual(stats["a"]["latency_median"], 0.11)
+        # A successful request makes the upstream available again
+        registry.record("b", 0.1, True)
+        self.assertTrue(registry.is_healthy("b"))
+
+    def test_02_fan_out(self):
+        calls = []
+        release = threading.Event()
+
+        def func(upstream):
+            calls.append(upstream)
+            if upstream == "slow":
+                release.wait(5)
+                return "slow"
+            if upstream.startswith("broken"):
+                raise Timeout()
+            return upstream
+
+        self.assertEqual(UpstreamRegistry().fanout, "failover")
+        registry = UpstreamRegistry(fanout="hedge", hedge_delay=0.1)
+        try:
+            # A single upstream is called in the current thread
+            self.assertEqual(registry.request(["fast"], func), "fast")
+            self.assertRaises(Timeout, registry.request, ["broken"], func)
+            # A failed upstream is followed by the next one
+            self.assertEqual(registry.request(["broken", "fast"], func), "fast")
+            # A slow upstream is hedged
+            calls.clear()
+            start = time.monotonic()
+            self.assertEqual(registry.request(["slow", "fast"], func), "fast")
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(calls, ["slow", "fast"])
+            release.set()
+
+            # A negative answer waits for the pending requests
+            release.clear()
+            calls.clear()
+            threading.Timer(0.3, release.set).start()
+            result = registry.request(
+                ["slow", "fast"], func, is_success=lambda r: r == "slow"
+            )
+            self.assertEqual(result, "slow")
+
+            # Without hedging, the slow upstream is awaited
+            registry.fanout = "failover"
+            release.clear()
+            calls.clear()
+            threading.Timer(0.3, release.set).start()
+            self.assertEqual(registry.request(["slow", "fast"], func), "slow")
+            self.assertEqual(calls, ["slow"])
+
+            # All upstreams are queried at once
+            registry.fanout = "parallel"
+            calls.clear()
+            self.assertEqual(
+                registry.request(
+                    ["broken", "fast"], func, is_success=lambda r: r == "fast"
+                ),
+                "fast",
+            )
+            self.assertEqual(sorted(calls), ["broken", "fast"])
+            self.assertRaises(Timeout, registry.request, ["broken", "broken2"], func)
+        finally:
+            release.set()
+            registry.shutdown()
+
+    @radiusmock.activate
+    def test_03_radius_servers(self):
+        self.assertEqual(
+            parse_radius_servers("radius1, radius2:1813 [2001:db8::1]:1814 ::1", 1812),
+            [
+                ("radius1", 1812),
+                ("radius2", 1813),
+                ("2001:db8::1", 1814),
+                ("::1", 1812),
+            ],
+        )
+        radiusmock.setdata(response=AccessAccept)
+        config = RADIUSServerDB(
+            identifier="fanout",
+            server="radius1.example.com radius2.example.com",
+            port=1812,
+            secret="",
+            dictionary=DICT_FILE,
+        )
+        self.assertTrue(RADIUSServer.request(config, "user", "password"))
+        stats = get_upstream_registry().get_stats()
+        self.assertEqual(stats["radius:radius1.example.com:1812"]["requests"], 1)
+        self.assertNotIn("radius:radius2.example.com:1812", stats)
+        # The answer to a challenge is only sent to the server of the challenge
+        self.assertEqual(
+            format_radius_server("2001:db8::1", 1812), "[2001:db8::1]:1812"
+        )
+        response = send_radius_request(
+            [("radius1.example.com", 1812), ("radius2.example.com", 1812)],
+            b"",
+            Dictionary(DICT_FILE),
+            "eduMFA",
+            "user",
+            "123456",
+            state=b"state",
+            challenge_server=("radius2.example.com", 1812),
+        )
+        self.assertEqual(response.server, "radius2.example.com")
+        stats = get_upstream_registry().get_stats()
+        self.assertEqual(stats["radius:radius1.example.com:1812"]["requests"], 1)
+        self.assertEqual(stats["radius:radius2.example.com:1812"]["requests"], 1)
+
+    @responses.activate
+    def test_04_edumfa_servers(self):
+        self.app.config["EDUMFA_UPSTREAM_FANOUT"] = "parallel"
+        responses.add(
+            responses.POST,
+            "https://pi1/validate/check",
+            json={"result": {"status": True, "value": False}},
+        )
+        responses.add(
+            responses.POST,
+            "https://pi2/validate/check",
+            json={"result": {"status": True, "value": True}},
+        )
+        add_edumfaserver(identifier="fanout", url="https://pi1 https://pi2")
+        server = get_edumfaserver("fanout")
+        # The accepting server wins
+        r = server.validate_check("user", "password")
+        self.assertEqual(r.url, "https://pi2/validate/check")
+        self.assertTrue(server.request(server.config, "user", "password"))
+        self.assertEqual(len(responses.calls), 4)
+        # The answer to a challenge is only sent to the server of the challenge
+        r = server.validate_check(
+            "user", "123456", transaction_id="123", url=r.remote_url
+        )
+        self.assertEqual(r.remote_url, "https://pi2")
+        self.assertEqual(len(responses.calls), 5)
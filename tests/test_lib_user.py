@@ -18,6 +18,7 @@ from edumfa.lib.user import (
     get_user_from_param,
     get_user_list,
     get_username,
+    get_usernames,
     split_user,
 )
 from edumfa.lib.user import log as user_log
@@ -119,6 +120,11 @@ class UserTestCase(MyTestCase):
         username = get_username("0", self.resolvername1)
         self.assertTrue(username == "root", username)
 
+    def test_04_get_usernames(self):
+        usernames = get_usernames(["0", "1", "12345", ""], self.resolvername1)
+        self.assertEqual(usernames, {"0": "root", "1": "daemon", "12345": "", "": ""})
+        self.assertEqual(get_usernames(["0"], "unknown"), {"0": ""})
+
     def test_05_get_user_list(self):
         # all users
         userlist = get_user_list()
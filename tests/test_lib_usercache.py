@@ -10,18 +10,23 @@ from unittest.mock import patch
 
 from edumfa.lib.config import set_edumfa_config
 from edumfa.lib.error import UserError
+from edumfa.lib.framework import get_app_local_store
 from edumfa.lib.realm import delete_realm, set_realm
 from edumfa.lib.resolver import delete_resolver, get_resolver_object, save_resolver
 from edumfa.lib.user import User, create_user, get_username
 from edumfa.lib.usercache import (
     EXPIRATION_SECONDS,
+    HotUserCache,
+    add_to_cache,
     cache_username,
     delete_user_cache,
     get_cache_time,
+    get_hot_user_cache,
     is_cache_enabled,
     retrieve_latest_entry,
+    retrieve_latest_logins,
 )
-from edumfa.models import UserCache
+from edumfa.models import UserCache, db
 from tests import ldap3mock
 from tests.test_mock_ldap3 import LDAPDirectory
 
@@ -535,6 +540,61 @@ class UserCacheTestCase(MyTestCase):
         self.assertEqual(r, "user1")
         self.assertEqual(self.counter, 1)
 
+    def test_14_hot_cache(self):
+        set_edumfa_config(EXPIRATION_SECONDS, 600)
+        delete_user_cache()
+        self.assertIsNone(get_hot_user_cache())
+        self.app.config["EDUMFA_USER_CACHE_HOT_SIZE"] = 6
+        try:
+            hot_cache = get_hot_user_cache()
+            self.assertIsInstance(hot_cache, HotUserCache)
+            self.assertIs(hot_cache, get_hot_user_cache())
+            add_to_cache("hans1", "hans1", "resolver1", "uid1")
+            UserCache("hans2", "hans2", "resolver2", "uid2", datetime.now()).save()
+            UserCache("hans2", "hans2", "resolver3", "uid3", datetime.now()).save()
+            # The entries of all resolvers are read with one query
+            entries = retrieve_latest_logins("hans2", ["resolver2", "resolver3"])
+            self.assertEqual(entries["resolver2"], ("hans2", "resolver2", "uid2"))
+            self.assertEqual(entries["resolver3"], ("hans2", "resolver3", "uid3"))
+
+            # Remove the entries from the database behind the back of the hot cache
+            UserCache.query.delete()
+            db.session.commit()
+            self.assertEqual(get_username("uid1", "resolver1"), "hans1")
+            self.assertEqual(User("hans1", "realm1", "resolver1").uid, "uid1")
+            self.assertEqual(
+                retrieve_latest_logins("hans2", ["resolver2", "resolver3"]),
+                {"resolver2": ("hans2", "resolver2", "uid2")},
+            )
+            # The hot cache respects the expiration of the user cache
+            with patch("edumfa.lib.usercache.get_cache_time") as mock_get_cache_time:
+                mock_get_cache_time.return_value = timedelta(seconds=-1)
+                self.assertIsNone(hot_cache.get(("uid", "uid1", "resolver1")))
+            # Deleting entries from the user cache invalidates the hot cache
+            delete_user_cache(resolver="resolver2")
+            self.assertEqual(retrieve_latest_logins("hans2", ["resolver2"]), {})
+            add_to_cache("hans1", "hans1", "resolver1", "uid1")
+            UserCache.query.delete()
+            db.session.commit()
+            delete_user_cache(username="hans1")
+            self.assertEqual(get_username("uid1", "resolver1"), "")
+        finally:
+            self.app.config.pop("EDUMFA_USER_CACHE_HOT_SIZE")
+            get_app_local_store().pop("hot_user_cache", None)
+
+        # The least recently used entries are evicted
+        hot_cache = HotUserCache(4)
+        hot_cache.put("hans1", "hans1", "resolver1", "uid1", datetime.now())
+        hot_cache.put("hans2", "hans2", "resolver1", "uid2", datetime.now())
+        self.assertTrue(hot_cache.get(("login", "hans1", "resolver1")))
+        hot_cache.put("hans3", "hans3", "resolver1", "uid3", datetime.now())
+        self.assertIsNone(hot_cache.get(("login", "hans2", "resolver1")))
+        self.assertIsNone(hot_cache.get(("uid", "uid1", "resolver1")))
+        self.assertEqual(
+            hot_cache.get(("login", "hans1", "resolver1")),
+            ("hans1", "resolver1", "uid1"),
+        )
+
     def test_99_unset_config(self):
         # Test early exit!
         # Assert that the function `retrieve_latest_entry` is called if the cache is enabled